@@ -0,0 +1,56 @@
+"""Normalize group hobby to a foreign key
+
+Revision ID: 3f8a6b1c9d27
+Revises: 9c1e5a7d2f40
+Create Date: 2026-10-19 11:02:47.318902
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f8a6b1c9d27'
+down_revision: Union[str, Sequence[str], None] = '9c1e5a7d2f40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('groups', sa.Column('hobby_id', sa.Integer(), nullable=True))
+
+    # Every non-DM group's hobby becomes a hobbies row; DMs keep a NULL hobby_id.
+    op.execute("""
+        INSERT INTO hobbies (name)
+        SELECT DISTINCT hobby FROM groups WHERE NOT is_direct_message
+        ON CONFLICT (name) DO NOTHING
+    """)
+    op.execute("""
+        UPDATE groups SET hobby_id = hobbies.id
+        FROM hobbies
+        WHERE hobbies.name = groups.hobby AND NOT groups.is_direct_message
+    """)
+
+    op.create_foreign_key('groups_hobby_id_fkey', 'groups', 'hobbies', ['hobby_id'], ['id'])
+    op.create_index(op.f('ix_groups_hobby_id'), 'groups', ['hobby_id'], unique=False)
+    op.create_index(op.f('ix_groups_creator_id'), 'groups', ['creator_id'], unique=False)
+    op.drop_column('groups', 'hobby')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.add_column('groups', sa.Column('hobby', sa.String(), nullable=True))
+    op.execute("""
+        UPDATE groups SET hobby = COALESCE(
+            (SELECT name FROM hobbies WHERE hobbies.id = groups.hobby_id),
+            'Direct Message'
+        )
+    """)
+    op.alter_column('groups', 'hobby', nullable=False)
+    op.drop_index(op.f('ix_groups_creator_id'), table_name='groups')
+    op.drop_index(op.f('ix_groups_hobby_id'), table_name='groups')
+    op.drop_constraint('groups_hobby_id_fkey', 'groups', type_='foreignkey')
+    op.drop_column('groups', 'hobby_id')
@@ -0,0 +1,55 @@
+"""Add canonical DM pair to groups
+
+Revision ID: 9c1e5a7d2f40
+Revises: 2b4926e379ee
+Create Date: 2026-10-19 10:12:31.204518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c1e5a7d2f40'
+down_revision: Union[str, Sequence[str], None] = '2b4926e379ee'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('groups', sa.Column('dm_user_low_id', sa.Integer(), nullable=True))
+    op.add_column('groups', sa.Column('dm_user_high_id', sa.Integer(), nullable=True))
+
+    # Backfill existing two-member DMs. If a pair already has duplicate DMs,
+    # only the oldest one gets the key; the others stay reachable by ID.
+    op.execute("""
+        WITH pairs AS (
+            SELECT m.group_id, MIN(m.user_id) AS low_id, MAX(m.user_id) AS high_id
+            FROM memberships m
+            JOIN groups g ON g.id = m.group_id
+            WHERE g.is_direct_message
+            GROUP BY m.group_id
+            HAVING COUNT(*) = 2
+        ),
+        ranked AS (
+            SELECT group_id, low_id, high_id,
+                   ROW_NUMBER() OVER (PARTITION BY low_id, high_id ORDER BY group_id) AS rn
+            FROM pairs
+        )
+        UPDATE groups
+        SET dm_user_low_id = ranked.low_id, dm_user_high_id = ranked.high_id
+        FROM ranked
+        WHERE groups.id = ranked.group_id AND ranked.rn = 1
+    """)
+
+    op.create_index('ix_groups_dm_pair', 'groups', ['dm_user_low_id', 'dm_user_high_id'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_groups_dm_pair', table_name='groups')
+    op.drop_column('groups', 'dm_user_high_id')
+    op.drop_column('groups', 'dm_user_low_id')
@@ -0,0 +1,61 @@
+"""Cascade membership and hobby links on delete, and index the deletion paths
+
+Revision ID: a91d3e6f4c28
+Revises: f2c8d4a7b391
+Create Date: 2026-10-19 17:42:03.118264
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a91d3e6f4c28'
+down_revision: Union[str, Sequence[str], None] = 'f2c8d4a7b391'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# memberships and user_hobbies predate the migrations, so their foreign keys may
+# lack ON DELETE CASCADE depending on when the database was created.
+FOREIGN_KEYS = [
+    ('memberships', 'user_id', 'users'),
+    ('memberships', 'group_id', 'groups'),
+    ('user_hobbies', 'user_id', 'users'),
+    ('user_hobbies', 'hobby_id', 'hobbies'),
+]
+
+# Columns app.deletion deletes by, which the cascades check too. On partitioned
+# tables the index is created on every partition.
+INDEXES = [
+    ('ix_chat_messages_user_id_id', 'chat_messages', ['user_id', 'id']),
+    ('ix_posts_owner_id_id', 'posts', ['owner_id', 'id']),
+    ('ix_memberships_group_id', 'memberships', ['group_id']),
+]
+
+
+def _replace_foreign_keys(on_delete: str):
+    for table, column, target in FOREIGN_KEYS:
+        op.execute(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {table}_{column}_fkey")
+        op.execute(
+            f"ALTER TABLE {table} ADD CONSTRAINT {table}_{column}_fkey "
+            f"FOREIGN KEY ({column}) REFERENCES {target} (id){on_delete}"
+        )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, unique=False)
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    _replace_foreign_keys(' ON DELETE CASCADE')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for name, table, _ in INDEXES:
+        op.drop_index(name, table_name=table)
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    _replace_foreign_keys('')
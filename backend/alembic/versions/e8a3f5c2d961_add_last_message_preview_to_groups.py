@@ -0,0 +1,55 @@
+"""Add last message preview to groups
+
+Revision ID: e8a3f5c2d961
+Revises: d47c0e9b5a12
+Create Date: 2026-10-19 13:20:44.092317
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e8a3f5c2d961'
+down_revision: Union[str, Sequence[str], None] = 'd47c0e9b5a12'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('groups', sa.Column('last_message_id', sa.Integer(), nullable=True))
+    op.add_column('groups', sa.Column('last_message_user_id', sa.Integer(), nullable=True))
+    op.add_column('groups', sa.Column('last_message_preview', sa.String(length=200), nullable=True))
+    op.add_column('groups', sa.Column('last_message_at', sa.TIMESTAMP(timezone=True), nullable=True))
+    op.add_column('groups', sa.Column('last_activity_at', sa.TIMESTAMP(timezone=True), nullable=True))
+
+    op.execute("""
+        UPDATE groups
+        SET last_message_id = latest.id,
+            last_message_user_id = latest.user_id,
+            last_message_preview = LEFT(latest.content, 200),
+            last_message_at = latest.timestamp
+        FROM (
+            SELECT DISTINCT ON (group_id) group_id, id, user_id, content, timestamp
+            FROM chat_messages
+            ORDER BY group_id, id DESC
+        ) AS latest
+        WHERE groups.id = latest.group_id
+    """)
+    op.execute("UPDATE groups SET last_activity_at = COALESCE(last_message_at, created_at, now())")
+    op.alter_column('groups', 'last_activity_at', nullable=False)
+
+    op.create_index('ix_groups_last_activity_at_id', 'groups', ['last_activity_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_groups_last_activity_at_id', table_name='groups')
+    op.drop_column('groups', 'last_activity_at')
+    op.drop_column('groups', 'last_message_at')
+    op.drop_column('groups', 'last_message_preview')
+    op.drop_column('groups', 'last_message_user_id')
+    op.drop_column('groups', 'last_message_id')
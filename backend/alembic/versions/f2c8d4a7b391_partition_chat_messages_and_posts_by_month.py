@@ -0,0 +1,155 @@
+"""Partition chat_messages and posts by month
+
+Revision ID: f2c8d4a7b391
+Revises: e8a3f5c2d961
+Create Date: 2026-10-19 16:05:12.530184
+
+"""
+from datetime import date
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2c8d4a7b391'
+down_revision: Union[str, Sequence[str], None] = 'e8a3f5c2d961'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Partitions created past the current month; app.jobs.archive keeps this window ahead afterwards.
+MONTHS_AHEAD = 3
+
+# table -> (partition column, column type, other columns)
+TABLES = {
+    'chat_messages': ('timestamp', 'TIMESTAMP WITH TIME ZONE', [
+        'content TEXT NOT NULL',
+        'user_id INTEGER NOT NULL',
+        'group_id INTEGER NOT NULL',
+    ]),
+    'posts': ('created_at', 'TIMESTAMP WITHOUT TIME ZONE', [
+        'title VARCHAR NOT NULL',
+        'content TEXT NOT NULL',
+        'owner_id INTEGER NOT NULL',
+        'group_id INTEGER NOT NULL',
+    ]),
+}
+FOREIGN_KEYS = {
+    'chat_messages': [('user_id', 'users'), ('group_id', 'groups')],
+    'posts': [('owner_id', 'users'), ('group_id', 'groups')],
+}
+INDEXES = {
+    'chat_messages': [('ix_chat_messages_id', 'id'), ('ix_chat_messages_group_id_id', 'group_id, id')],
+    'posts': [('ix_posts_id', 'id')],
+}
+
+
+def _add_month(value: date) -> date:
+    return date(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+def _bound(table: str, value: date) -> str:
+    # chat_messages.timestamp is timestamptz, so its bounds are pinned to UTC.
+    return f"'{value.isoformat()} 00:00:00+00'" if table == 'chat_messages' else f"'{value.isoformat()} 00:00:00'"
+
+
+def _create_partitions(bind, table: str, parent: str, column: str):
+    """Monthly partitions from the oldest existing row to MONTHS_AHEAD past today, plus a default partition."""
+    oldest = bind.execute(sa.text(f'SELECT min("{column}") FROM {table}')).scalar()
+    today = date.today()
+    month = date(oldest.year, oldest.month, 1) if oldest else date(today.year, today.month, 1)
+    last = date(today.year, today.month, 1)
+    for _ in range(MONTHS_AHEAD):
+        last = _add_month(last)
+
+    while month <= last:
+        following = _add_month(month)
+        op.execute(
+            f"CREATE TABLE {table}_y{month.year}m{month.month:02d} PARTITION OF {parent} "
+            f"FOR VALUES FROM ({_bound(table, month)}) TO ({_bound(table, following)})"
+        )
+        month = following
+    op.execute(f"CREATE TABLE {table}_default PARTITION OF {parent} DEFAULT")
+
+
+def _finish_table(table: str, primary_key: str):
+    op.execute(f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY ({primary_key})")
+    for name, columns in INDEXES[table]:
+        op.execute(f"CREATE INDEX {name} ON {table} ({columns})")
+    for column, target in FOREIGN_KEYS[table]:
+        op.execute(
+            f"ALTER TABLE {table} ADD CONSTRAINT {table}_{column}_fkey "
+            f"FOREIGN KEY ({column}) REFERENCES {target} (id) ON DELETE CASCADE"
+        )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('archived_partitions',
+    sa.Column('table_name', sa.String(), nullable=False),
+    sa.Column('range_start', sa.TIMESTAMP(timezone=True), nullable=False),
+    sa.Column('range_end', sa.TIMESTAMP(timezone=True), nullable=False),
+    sa.Column('path', sa.String(), nullable=False),
+    sa.Column('row_count', sa.Integer(), nullable=False),
+    sa.Column('archived_at', sa.TIMESTAMP(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('table_name', 'range_start')
+    )
+
+    bind = op.get_bind()
+    # Declarative partitioning is PostgreSQL-only; other databases keep plain tables.
+    if bind.dialect.name == 'postgresql':
+        _partition_tables(bind)
+    # Group-scoped post reads otherwise scan every partition in full.
+    op.create_index('ix_posts_group_id_id', 'posts', ['group_id', 'id'], unique=False)
+
+
+def _partition_tables(bind):
+    for table, (column, column_type, columns) in TABLES.items():
+        parent = f'{table}_partitioned'
+        # Postgres requires the partition key in the primary key, so it becomes (id, <time>).
+        op.execute(
+            f"CREATE TABLE {parent} ("
+            f"id INTEGER NOT NULL DEFAULT nextval('{table}_id_seq'), "
+            f"{', '.join(columns)}, "
+            f'"{column}" {column_type} NOT NULL'
+            f') PARTITION BY RANGE ("{column}")'
+        )
+        _create_partitions(bind, table, parent, column)
+
+        names = ['id'] + [definition.split()[0] for definition in columns]
+        op.execute(
+            f"INSERT INTO {parent} ({', '.join(names)}, \"{column}\") "
+            f"SELECT {', '.join(names)}, COALESCE(\"{column}\", now()) FROM {table}"
+        )
+        op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {parent}.id")
+        op.execute(f"DROP TABLE {table}")
+        op.execute(f"ALTER TABLE {parent} RENAME TO {table}")
+        _finish_table(table, f'id, "{column}"')
+
+
+def downgrade() -> None:
+    """Downgrade schema. Rows already moved to archive files are not restored."""
+    op.drop_index('ix_posts_group_id_id', table_name='posts')
+    op.drop_table('archived_partitions')
+
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+
+    for table, (column, column_type, columns) in TABLES.items():
+        plain = f'{table}_plain'
+        op.execute(
+            f"CREATE TABLE {plain} ("
+            f"id INTEGER NOT NULL DEFAULT nextval('{table}_id_seq'), "
+            f"{', '.join(columns)}, "
+            f'"{column}" {column_type}'
+            f")"
+        )
+        names = ['id'] + [definition.split()[0] for definition in columns] + [f'"{column}"']
+        op.execute(f"INSERT INTO {plain} ({', '.join(names)}) SELECT {', '.join(names)} FROM {table}")
+        op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {plain}.id")
+        # Dropping the partitioned table drops all of its partitions.
+        op.execute(f"DROP TABLE {table}")
+        op.execute(f"ALTER TABLE {plain} RENAME TO {table}")
+        _finish_table(table, 'id')
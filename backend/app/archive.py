@@ -0,0 +1,129 @@
+"""
+Monthly partitions of chat_messages and posts, and reads from their archives.
+
+On PostgreSQL both tables are range-partitioned by month on their timestamp
+column. `app.jobs.archive` creates partitions ahead of time and moves months
+older than their retention period into gzip-compressed NDJSON files under
+ARCHIVE_DIR, listed in the `archived_partitions` table.
+
+An archive file holds one month of one table with its rows grouped by group_id.
+Each group's rows are written as separate gzip members, and a sidecar index
+maps group IDs to the byte ranges of those members. Concatenated members are
+still one valid gzip file, and one group's rows can be read back without
+decompressing the rest of the month. API workers read these files for history
+requests that include archived ranges, so ARCHIVE_DIR must be readable by them.
+"""
+import gzip
+import json
+import logging
+import os
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+
+from . import models, serializers
+
+load_dotenv()
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+
+# Partitioned table -> the timestamp column it is partitioned by.
+PARTITION_COLUMNS = {"chat_messages": "timestamp", "posts": "created_at"}
+# posts.created_at is stored without a time zone, in UTC.
+NAIVE_TABLES = {"posts"}
+
+
+def month_start(value: datetime) -> datetime:
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(value: datetime, months: int) -> datetime:
+    """Moves the first of a month `months` months forward (or back, if negative)."""
+    index = value.year * 12 + value.month - 1 + months
+    return value.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(table: str, start: datetime) -> str:
+    return f"{table}_y{start.year}m{start.month:02d}"
+
+
+def archive_path(table: str, start: datetime) -> str:
+    """The archive file of one month, relative to ARCHIVE_DIR."""
+    return os.path.join(table, f"{start:%Y-%m}.ndjson.gz")
+
+
+def index_path(path: str) -> str:
+    return f"{path}.index.json"
+
+
+def _aware(value: datetime) -> datetime:
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def _column_time(table: str, value: datetime) -> datetime:
+    """Converts `value` to the form the table stores: naive UTC for posts, aware otherwise."""
+    if table in NAIVE_TABLES:
+        return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+    return _aware(value)
+
+
+def _read_group(path: str, group_id: int) -> List[dict]:
+    full_path = os.path.join(ARCHIVE_DIR, path)
+    try:
+        with open(index_path(full_path)) as index_file:
+            members = json.load(index_file).get(str(group_id), [])
+    except FileNotFoundError:
+        logging.error(f"Archive index missing for {full_path}")
+        return []
+
+    rows = []
+    with open(full_path, "rb") as archive_file:
+        for offset, length in members:
+            archive_file.seek(offset)
+            rows.extend(json.loads(line) for line in gzip.decompress(archive_file.read(length)).splitlines())
+    return rows
+
+
+def archived_rows(db: Session, table: str, group_id: int, before: Optional[datetime] = None,
+                  limit: Optional[int] = None) -> List[dict]:
+    """
+    One group's rows from the archived months of `table`, newest first.
+
+    Only rows older than `before` are returned, and months are read newest
+    first until `limit` rows have been found.
+    """
+    column = PARTITION_COLUMNS[table]
+    query = db.query(models.ArchivedPartition).filter(models.ArchivedPartition.table_name == table)
+    if before is not None:
+        query = query.filter(models.ArchivedPartition.range_start < _aware(before))
+        before = _column_time(table, before)
+
+    rows = []
+    for partition in query.order_by(models.ArchivedPartition.range_start.desc()).all():
+        month = _read_group(partition.path, group_id)
+        for row in month:
+            row[column] = datetime.fromisoformat(row[column])
+        if before is not None:
+            month = [row for row in month if row[column] < before]
+        month.sort(key=lambda row: row["id"], reverse=True)
+        rows.extend(month)
+        if limit is not None and len(rows) >= limit:
+            return rows[:limit]
+    return rows
+
+
+def archived_messages(db: Session, group_id: int, before: Optional[datetime], limit: int) -> List[dict]:
+    """`ChatMessageResponse` dicts for up to `limit` archived messages older than `before`, oldest first."""
+    rows = archived_rows(db, "chat_messages", group_id, before, limit)
+    users = serializers.public_users(db, (row["user_id"] for row in rows))
+    # Messages of deleted users are skipped, as the database would have cascaded them away.
+    return [{**row, "user": users[row["user_id"]]} for row in reversed(rows) if row["user_id"] in users]
+
+
+def archived_posts(db: Session, group_id: int) -> List[dict]:
+    """`PostResponse` dicts for every archived post of a group, oldest first."""
+    rows = archived_rows(db, "posts", group_id)
+    owners = serializers.public_users(db, (row["owner_id"] for row in rows))
+    return [{**row, "owner": owners[row["owner_id"]]} for row in reversed(rows) if row["owner_id"] in owners]
@@ -0,0 +1,71 @@
+from sqlalchemy.orm import Session
+from typing import Iterable, List
+
+from app import models, schemas, database
+
+
+def resolve_hobbies(db: Session, names: Iterable[str]) -> List[models.Hobby]:
+    """
+    Returns Hobby rows for `names`, in the given order, creating any that are missing.
+
+    Existing hobbies are read with one `IN` query and missing ones are inserted in one
+    statement; ON CONFLICT keeps concurrent requests from failing on the unique name.
+    """
+    names = list(dict.fromkeys(names))
+    if not names:
+        return []
+
+    hobbies = db.query(models.Hobby).filter(models.Hobby.name.in_(names)).all()
+    found = {hobby.name for hobby in hobbies}
+    missing = [name for name in names if name not in found]
+    if missing:
+        db.execute(
+            database.dialect_insert(models.Hobby)
+            .values([{"name": name} for name in missing])
+            .on_conflict_do_nothing(index_elements=["name"])
+        )
+        hobbies += db.query(models.Hobby).filter(models.Hobby.name.in_(missing)).all()
+
+    by_name = {hobby.name: hobby for hobby in hobbies}
+    return [by_name[name] for name in names]
+
+
+def join_groups(db: Session, user: models.User, group_ids: Iterable[int]) -> List[schemas.BulkMembershipResult]:
+    """
+    Adds `user` to every eligible group in one INSERT and reports the outcome per group.
+
+    The caller commits. Statuses are "joined", "already_member", "not_found" and
+    "hobby_required", matching the errors of the single-group join endpoint.
+    """
+    group_ids = list(dict.fromkeys(group_ids))
+    if not group_ids:
+        return []
+
+    groups = {
+        group.id: group
+        for group in db.query(models.Group).filter(models.Group.id.in_(group_ids)).all()
+    }
+    user_hobby_ids = user.hobby_ids
+
+    statuses = {}
+    eligible = []
+    for group_id in group_ids:
+        group = groups.get(group_id)
+        if group is None:
+            statuses[group_id] = "not_found"
+        elif group.hobby_id not in user_hobby_ids:
+            statuses[group_id] = "hobby_required"
+        else:
+            eligible.append(group_id)
+
+    if eligible:
+        joined = set(db.execute(
+            database.dialect_insert(models.Membership)
+            .values([{"user_id": user.id, "group_id": group_id} for group_id in eligible])
+            .on_conflict_do_nothing(index_elements=["user_id", "group_id"])
+            .returning(models.Membership.group_id)
+        ).scalars().all())
+        for group_id in eligible:
+            statuses[group_id] = "joined" if group_id in joined else "already_member"
+
+    return [schemas.BulkMembershipResult(group_id=group_id, status=statuses[group_id]) for group_id in group_ids]
@@ -1,22 +1,217 @@
-from sqlalchemy import create_engine
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import create_engine, exc
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+from jose import jwt, JWTError
+import asyncio
+import itertools
+import logging
 import os
+import time
 from dotenv import load_dotenv
 
+from . import tracing
+from .metrics import PoolStats
+from .redis_client import redis_client
+
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_engine(DATABASE_URL)
+# Pool sizing is per worker process; size it against the number of uvicorn workers
+# and the threadpool size so that workers * (size + overflow) fits the server limit.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+# Connections opened at startup so the first requests don't pay for the handshake.
+DB_POOL_WARM = int(os.getenv("DB_POOL_WARM", "2"))
+
+# Comma-separated replica URLs used by read-only endpoints. Leave empty to read from the primary.
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "2"))
+REPLICA_LAG_CHECK_INTERVAL = float(os.getenv("REPLICA_LAG_CHECK_INTERVAL", "5"))
+# How long a user's reads stay on the primary after they write.
+READ_YOUR_WRITES_SECONDS = int(os.getenv("READ_YOUR_WRITES_SECONDS", "10"))
+
+
+class InstrumentedQueuePool(QueuePool):
+    """A QueuePool that records checkout wait time and exhaustion events."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        # Every connection is in use: this checkout has to wait or overflow.
+        saturated = self.checkedout() >= self.size() + max(self._max_overflow, 0)
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.record_timeout()
+            raise
+        self.stats.record_checkout(time.perf_counter() - start, saturated)
+        return connection
+
+
+def _create_engine(url: str):
+    new_engine = create_engine(
+        url,
+        poolclass=InstrumentedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+    )
+    tracing.instrument_engine(new_engine)
+    return new_engine
+
+
+engine = _create_engine(DATABASE_URL)
+replica_engines = [_create_engine(url) for url in DATABASE_REPLICA_URLS]
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReplicaSessions = [sessionmaker(autocommit=False, autoflush=False, bind=e) for e in replica_engines]
+
+# Last measured replication lag per replica in seconds; None means unknown or unreachable.
+replica_lag: list[float | None] = [None] * len(replica_engines)
+_replica_cursor = itertools.count()
+# Local copy of recent writers (subject -> expiry) so repeated writes skip Redis.
+_recent_writers: dict[str, float] = {}
 
 Base = declarative_base()
 
+def dialect_insert(model):
+    """An INSERT for `model` that supports `on_conflict_do_nothing` on PostgreSQL and SQLite."""
+    if engine.dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert
+    return insert(model)
+
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+def token_subject(request: Request) -> str | None:
+    """Reads the token subject for routing only; authentication still happens in get_current_user."""
+    authorization = request.headers.get("authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return jwt.get_unverified_claims(token).get("sub")
+    except JWTError:
+        return None
+
+
+async def mark_recent_write(subject: str):
+    """Pins `subject`'s reads to the primary for READ_YOUR_WRITES_SECONDS, across all workers."""
+    if not replica_engines:
+        return
+    now = time.monotonic()
+    # Re-marking within the first half of the window would only extend it slightly.
+    if _recent_writers.get(subject, 0) - now > READ_YOUR_WRITES_SECONDS / 2:
+        return
+    _recent_writers[subject] = now + READ_YOUR_WRITES_SECONDS
+    try:
+        await redis_client.set(f"db:recent_write:{subject}", 1, ex=READ_YOUR_WRITES_SECONDS)
+    except Exception as e:
+        logging.error(f"Failed to record recent write for read routing: {e}")
+
+
+async def _has_recent_write(subject: str) -> bool:
+    if _recent_writers.get(subject, 0) > time.monotonic():
+        return True
+    try:
+        return bool(await redis_client.exists(f"db:recent_write:{subject}"))
+    except Exception as e:
+        # Without the marker we cannot rule out a recent write, so stay on the primary.
+        logging.error(f"Failed to check recent writes for read routing: {e}")
+        return True
+
+
+def _pick_replica() -> sessionmaker | None:
+    healthy = [i for i, lag in enumerate(replica_lag) if lag is not None and lag <= REPLICA_MAX_LAG_SECONDS]
+    if not healthy:
+        return None
+    return ReplicaSessions[healthy[next(_replica_cursor) % len(healthy)]]
+
+
+async def get_read_db(request: Request):
+    """
+    Session for read-only endpoints. Uses a replica unless none is within
+    REPLICA_MAX_LAG_SECONDS or the caller wrote recently, in which case it
+    falls back to the primary so users always see their own writes.
+    """
+    session_factory = SessionLocal
+    if replica_engines:
+        subject = token_subject(request)
+        if subject is None or not await _has_recent_write(subject):
+            session_factory = _pick_replica() or SessionLocal
+    db = session_factory()
+    try:
+        yield db
+    finally:
+        await run_in_threadpool(db.close)
+
+
+def _measure_lag(replica_engine) -> float:
+    with replica_engine.connect() as connection:
+        # An idle primary produces no replay timestamps, so a caught-up replica reports zero.
+        return float(connection.exec_driver_sql(
+            "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+            "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+        ).scalar())
+
+
+async def monitor_replica_lag():
+    """Background task that refreshes `replica_lag` so routing never probes lag on the request path."""
+    while True:
+        for i, replica_engine in enumerate(replica_engines):
+            try:
+                replica_lag[i] = await run_in_threadpool(_measure_lag, replica_engine)
+            except Exception as e:
+                replica_lag[i] = None
+                logging.warning(f"Replica {i} is unavailable for reads: {e}")
+        await asyncio.sleep(REPLICA_LAG_CHECK_INTERVAL)
+
+
+def warm_up():
+    """Opens DB_POOL_WARM connections and returns them to the pool."""
+    connections = []
+    try:
+        for _ in range(min(DB_POOL_WARM, DB_POOL_SIZE)):
+            connection = engine.connect()
+            connection.exec_driver_sql("SELECT 1")
+            connections.append(connection)
+    finally:
+        for connection in connections:
+            connection.close()
+
+
+def dispose():
+    engine.dispose()
+    for replica_engine in replica_engines:
+        replica_engine.dispose()
+
+
+def pool_status(engine=engine) -> dict:
+    pool = engine.pool
+    return {
+        "size": pool.size(),
+        "max_overflow": DB_MAX_OVERFLOW,
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+        **pool.stats.as_dict(),
+    }
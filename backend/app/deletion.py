@@ -0,0 +1,242 @@
+"""
+Chunked background deletion of users and groups.
+
+Deleting a user or group through the ORM used to load and delete every post,
+message and membership row one by one in a single transaction. Instead, a
+deletion request records a job in Redis and returns. The job then deletes the
+heavy child rows DELETION_CHUNK_SIZE at a time, one short transaction per
+chunk, and removes the matching search documents with one bulk request per
+chunk. The user or group row is deleted last, and the database's ON DELETE
+CASCADE clears whatever small tables remain. Groups created by a deleted user
+pass to their longest-standing remaining member, or are deleted too when the
+user was their only member.
+
+Progress is stored in the `deletion:<job_id>` hash and is readable at
+`GET /internal/deletions/{job_id}`. Jobs interrupted by a restart are resumed
+by `python -m app.jobs.deletions`.
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import defaultdict
+from typing import Optional
+
+from dotenv import load_dotenv
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, select
+
+from . import database, es_client, membership_cache, models, read_state
+from .redis_client import redis_client
+
+load_dotenv()
+
+DELETION_CHUNK_SIZE = int(os.getenv("DELETION_CHUNK_SIZE", "5000"))
+# Pause between chunks so other writers and autovacuum keep up with a long deletion.
+DELETION_PAUSE_SECONDS = float(os.getenv("DELETION_PAUSE_SECONDS", "0.05"))
+# A running job that has not reported progress for this long is considered abandoned and can be resumed.
+DELETION_STALE_SECONDS = int(os.getenv("DELETION_STALE_SECONDS", "300"))
+JOB_TTL_SECONDS = 7 * 24 * 3600
+
+PENDING_KEY = "deletions:pending"
+
+# kind -> (model, [(progress field, child model, column pointing at the target)]), children in deletion order.
+TARGETS = {
+    "user": (models.User, [
+        ("chat_messages", models.ChatMessage, models.ChatMessage.user_id),
+        ("posts", models.Post, models.Post.owner_id),
+        ("memberships", models.Membership, models.Membership.user_id),
+    ]),
+    "group": (models.Group, [
+        ("chat_messages", models.ChatMessage, models.ChatMessage.group_id),
+        ("posts", models.Post, models.Post.group_id),
+        ("memberships", models.Membership, models.Membership.group_id),
+    ]),
+}
+SEARCH_INDICES = {"user": "users", "group": "groups", "posts": "posts"}
+
+
+def _job_key(job_id: str) -> str:
+    return f"deletion:{job_id}"
+
+
+def _target_key(kind: str, target_id: int) -> str:
+    return f"deletion:target:{kind}:{target_id}"
+
+
+async def start(kind: str, target_id: int, requested_by: int) -> str:
+    """Records a deletion job and returns its ID; a target already being deleted returns the existing job."""
+    job_id = uuid.uuid4().hex
+    if not await redis_client.set(_target_key(kind, target_id), job_id, nx=True, ex=JOB_TTL_SECONDS):
+        existing = await redis_client.get(_target_key(kind, target_id))
+        if existing:
+            return existing
+        # The marker expired between the two calls; take it over.
+        await redis_client.set(_target_key(kind, target_id), job_id, ex=JOB_TTL_SECONDS)
+
+    await redis_client.hset(_job_key(job_id), mapping={
+        "kind": kind,
+        "target_id": target_id,
+        "requested_by": requested_by,
+        "status": "pending",
+        "updated_at": time.time(),
+    })
+    await redis_client.sadd(PENDING_KEY, job_id)
+    return job_id
+
+
+async def get_status(job_id: str) -> Optional[dict]:
+    job = await redis_client.hgetall(_job_key(job_id))
+    return job or None
+
+
+def _delete_chunk(model, column, target_id: int) -> list:
+    """Deletes up to DELETION_CHUNK_SIZE child rows in one transaction and returns their (id, user_id, group_id)."""
+    returning = [model.id]
+    if model is models.Membership:
+        returning += [models.Membership.user_id, models.Membership.group_id]
+    db = database.SessionLocal()
+    try:
+        chunk = select(model.id).where(column == target_id).limit(DELETION_CHUNK_SIZE).scalar_subquery()
+        statement = delete(model).where(model.id.in_(chunk)).returning(*returning)
+        rows = db.execute(statement, execution_options={"synchronize_session": False}).all()
+        db.commit()
+        return rows
+    finally:
+        db.close()
+
+
+def _delete_target(model, target_id: int):
+    db = database.SessionLocal()
+    try:
+        db.execute(delete(model).where(model.id == target_id), execution_options={"synchronize_session": False})
+        db.commit()
+    finally:
+        db.close()
+
+
+def _hand_over_groups(user_id: int) -> list:
+    """
+    Makes the longest-standing other member the creator of each group `user_id` created.
+
+    Returns the IDs of groups that have no other member; those are deleted
+    along with the user rather than left without anyone able to manage them.
+    """
+    db = database.SessionLocal()
+    try:
+        orphaned = []
+        group_ids = [row.id for row in db.query(models.Group.id).filter(models.Group.creator_id == user_id)]
+        for group_id in group_ids:
+            successor = db.query(models.Membership.user_id).filter(
+                models.Membership.group_id == group_id,
+                models.Membership.user_id != user_id
+            ).order_by(models.Membership.id).first()
+            if successor is None:
+                orphaned.append(group_id)
+                continue
+            db.query(models.Group).filter(models.Group.id == group_id).update(
+                {models.Group.creator_id: successor.user_id}, synchronize_session=False
+            )
+        db.commit()
+        return orphaned
+    finally:
+        db.close()
+
+
+def _refresh_previews(user_id: int):
+    """Points groups whose last message was by `user_id`, now deleted, at their newest remaining message."""
+    db = database.SessionLocal()
+    try:
+        group_ids = [row.id for row in db.query(models.Group.id).filter(models.Group.last_message_user_id == user_id)]
+        for group_id in group_ids:
+            latest = db.query(models.ChatMessage).filter(
+                models.ChatMessage.group_id == group_id
+            ).order_by(models.ChatMessage.id.desc()).first()
+            db.query(models.Group).filter(models.Group.id == group_id).update({
+                models.Group.last_message_id: latest.id if latest else None,
+                models.Group.last_message_user_id: latest.user_id if latest else None,
+                models.Group.last_message_preview: latest.content[:200] if latest else None,
+                models.Group.last_message_at: latest.timestamp if latest else None,
+            }, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+async def _forget_memberships(rows: list):
+    groups_by_user = defaultdict(list)
+    for _, user_id, group_id in rows:
+        groups_by_user[user_id].append(group_id)
+    for user_id, group_ids in groups_by_user.items():
+        await membership_cache.remove_memberships(user_id, group_ids)
+    await read_state.forget((user_id, group_id) for _, user_id, group_id in rows)
+
+
+async def _delete_documents(key: str, index: str, doc_ids: list):
+    try:
+        await es_client.delete_documents(index, doc_ids)
+    except Exception as e:
+        # The rows are gone either way; search hits for them are dropped when hydrated from the database.
+        logging.error(f"Failed to delete {len(doc_ids)} documents from {index}: {e}")
+        await redis_client.hincrby(key, "search_errors", len(doc_ids))
+
+
+async def run(job_id: str):
+    """Runs (or resumes) a deletion job. Every step is idempotent, so a job can safely be run again."""
+    key = _job_key(job_id)
+    job = await redis_client.hgetall(key)
+    if not job or job["status"] == "done":
+        return
+    kind, target_id = job["kind"], int(job["target_id"])
+    model, children = TARGETS[kind]
+    await redis_client.hset(key, mapping={"status": "running", "updated_at": time.time()})
+    started = time.perf_counter()
+
+    try:
+        if kind == "user":
+            # Done before the memberships go, while the successors can still be found.
+            for group_id in await run_in_threadpool(_hand_over_groups, target_id):
+                await run(await start("group", group_id, target_id))
+                await redis_client.hincrby(key, "groups_deleted", 1)
+
+        for field, child, column in children:
+            while rows := await run_in_threadpool(_delete_chunk, child, column, target_id):
+                if field == "posts":
+                    await _delete_documents(key, SEARCH_INDICES["posts"], [row[0] for row in rows])
+                elif field == "memberships":
+                    await _forget_memberships(rows)
+                await redis_client.hincrby(key, field, len(rows))
+                await redis_client.hset(key, "updated_at", time.time())
+                await asyncio.sleep(DELETION_PAUSE_SECONDS)
+            if kind == "user" and field == "chat_messages":
+                await run_in_threadpool(_refresh_previews, target_id)
+
+        await run_in_threadpool(_delete_target, model, target_id)
+        await _delete_documents(key, SEARCH_INDICES[kind], [target_id])
+        if kind == "user":
+            await read_state.forget_user(target_id)
+    except Exception as e:
+        logging.error(f"Deletion job {job_id} for {kind} {target_id} failed: {e}")
+        await redis_client.hset(key, mapping={"status": "failed", "error": str(e), "updated_at": time.time()})
+        return
+
+    await redis_client.hset(key, mapping={"status": "done", "updated_at": time.time()})
+    await redis_client.expire(key, JOB_TTL_SECONDS)
+    await redis_client.srem(PENDING_KEY, job_id)
+    logging.info(f"Deleted {kind} {target_id} in {time.perf_counter() - started:.1f}s (job {job_id})")
+
+
+async def resume_pending() -> int:
+    """Runs every unfinished job that is not actively making progress; returns how many were run."""
+    resumed = 0
+    for job_id in await redis_client.smembers(PENDING_KEY):
+        job = await redis_client.hgetall(_job_key(job_id))
+        if not job:
+            await redis_client.srem(PENDING_KEY, job_id)
+            continue
+        if job["status"] == "running" and time.time() - float(job["updated_at"]) < DELETION_STALE_SECONDS:
+            continue
+        await run(job_id)
+        resumed += 1
+    return resumed
@@ -1,14 +1,74 @@
-from elasticsearch import AsyncElasticsearch
 import asyncio
+import logging
+import os
+from typing import List
+from dotenv import load_dotenv
+
+from . import search_cache, tracing
+
+load_dotenv()
+
+# Search is optional: with SEARCH_ENABLED=false the search router is not mounted,
+# indexing becomes a no-op and the elasticsearch package is never imported.
+SEARCH_ENABLED = os.getenv("SEARCH_ENABLED", "true").lower() == "true"
+
+ES_URL = os.getenv("ES_URL", "http://localhost:9200")
+ES_CONNECTIONS_PER_NODE = int(os.getenv("ES_CONNECTIONS_PER_NODE", "10"))
+ES_REQUEST_TIMEOUT = float(os.getenv("ES_REQUEST_TIMEOUT", "10"))
+ES_MAX_RETRIES = int(os.getenv("ES_MAX_RETRIES", "2"))
+
+_es_client = None
+
+
+def get_es_client():
+    """Returns the shared asynchronous Elasticsearch client, creating it on first use."""
+    global _es_client
+    if _es_client is None:
+        from elasticsearch import AsyncElasticsearch
+        from elastic_transport import AsyncTransport
+
+        # This client connects to the Elasticsearch server we started with Docker.
+        _es_client = AsyncElasticsearch(
+            ES_URL,
+            connections_per_node=ES_CONNECTIONS_PER_NODE,
+            request_timeout=ES_REQUEST_TIMEOUT,
+            max_retries=ES_MAX_RETRIES,
+            retry_on_timeout=True,
+            transport_class=tracing.traced_transport_class(AsyncTransport),
+        )
+    return _es_client
+
+
+async def index_document(index: str, doc_id: int, document: dict):
+    """Indexes one document and invalidates cached searches over its index."""
+    if not SEARCH_ENABLED:
+        return
+    await get_es_client().index(
+        index=index,
+        id=doc_id,
+        document=document,
+        # Wait until the document is searchable so the cache is not refilled with stale hits.
+        refresh="wait_for"
+    )
+    await search_cache.bump_generation(index)
+
+
+async def delete_documents(index: str, doc_ids: List[int]):
+    """Deletes documents in one bulk request and invalidates cached searches over the index."""
+    if not SEARCH_ENABLED or not doc_ids:
+        return
+    # Documents that were never indexed come back as per-item "not_found" results, not errors.
+    await get_es_client().bulk(
+        operations=[{"delete": {"_index": index, "_id": doc_id}} for doc_id in doc_ids],
+        refresh="wait_for"
+    )
+    await search_cache.bump_generation(index)
 
-# Create an asynchronous Elasticsearch client instance.
-# This client connects to the Elasticsearch server we started with Docker.
-es_client = AsyncElasticsearch("http://localhost:9200")
 
 # A simple function to test the connection.
 async def check_es_connection():
     try:
-        is_connected = await es_client.ping()
+        is_connected = await get_es_client().ping()
         if is_connected:
             print("Successfully connected to Elasticsearch.")
         else:
@@ -16,6 +76,36 @@ async def check_es_connection():
     except Exception as e:
         print(f"An error occurred while connecting to Elasticsearch: {e}")
 
+
+async def warm_up():
+    if not SEARCH_ENABLED:
+        return
+    # Elasticsearch is not required to serve most requests, so a failed ping only logs.
+    try:
+        if not await get_es_client().ping():
+            logging.warning(f"Elasticsearch at {ES_URL} did not respond to ping")
+    except Exception as e:
+        logging.warning(f"Could not reach Elasticsearch at {ES_URL}: {e}")
+
+
+async def close():
+    global _es_client
+    if _es_client is not None:
+        await _es_client.close()
+        _es_client = None
+
+
+def pool_status() -> dict:
+    # The transport does not expose per-connection usage, so report the configured
+    # limits alongside the number of nodes it currently knows about.
+    return {
+        "enabled": SEARCH_ENABLED,
+        "nodes": len(_es_client.transport.node_pool.all()) if _es_client is not None else 0,
+        "connections_per_node": ES_CONNECTIONS_PER_NODE,
+        "request_timeout": ES_REQUEST_TIMEOUT,
+        "max_retries": ES_MAX_RETRIES,
+    }
+
 # This block allows you to run the file directly to test the connection.
 if __name__ == "__main__":
-    asyncio.run(check_es_connection())
\ No newline at end of file
+    asyncio.run(check_es_connection())
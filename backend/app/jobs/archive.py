@@ -0,0 +1,226 @@
+"""
+Offline job that maintains the monthly partitions of chat_messages and posts.
+
+Run it daily, for example from cron:
+
+    python -m app.jobs.archive
+
+For each partitioned table it first creates partitions for the next
+PARTITION_MONTHS_AHEAD months, so new rows never land in the default partition.
+It then archives every month older than the table's retention period. The
+month is written to a gzip-compressed NDJSON file under ARCHIVE_DIR, recorded
+in `archived_partitions`, and its partition is detached and dropped. That is a
+metadata change, so the hot table never needs a large DELETE or the vacuum
+that follows one. On PostgreSQL 14 and later the partition is detached
+CONCURRENTLY, which waits for running queries instead of locking the parent
+table; only the detached table is then dropped. History endpoints read archived months back when
+called with `archived=true`; see app.archive.
+
+A retention of 0 months keeps a table's rows in the database forever.
+"""
+import gzip
+import json
+import logging
+import os
+import re
+import time
+from datetime import datetime, timezone
+from typing import Dict
+
+from dotenv import load_dotenv
+from sqlalchemy import text
+
+from app import archive, database
+
+load_dotenv()
+
+CHAT_RETENTION_MONTHS = int(os.getenv("CHAT_RETENTION_MONTHS", "12"))
+POST_RETENTION_MONTHS = int(os.getenv("POST_RETENTION_MONTHS", "0"))
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+# Rows of one group written as a single gzip member; bounds the job's memory for very busy groups.
+ARCHIVE_CHUNK_ROWS = int(os.getenv("ARCHIVE_CHUNK_ROWS", "10000"))
+
+RETENTION_MONTHS = {"chat_messages": CHAT_RETENTION_MONTHS, "posts": POST_RETENTION_MONTHS}
+
+
+def _bound(table: str, value: datetime) -> str:
+    if table in archive.NAIVE_TABLES:
+        return f"'{value:%Y-%m-%d} 00:00:00'"
+    return f"'{value:%Y-%m-%d} 00:00:00+00'"
+
+
+def _months(table: str, names) -> Dict[datetime, str]:
+    pattern = re.compile(rf"^{table}_y(\d{{4}})m(\d{{2}})$")
+    months = {}
+    for name in names:
+        match = pattern.match(name)
+        if match:
+            months[datetime(int(match[1]), int(match[2]), 1, tzinfo=timezone.utc)] = name
+    return months
+
+
+def _partitions(conn, table: str) -> Dict[datetime, str]:
+    """Maps the start of each month that has a partition to the partition's name."""
+    names = conn.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE parent.relname = :table"
+    ), {"table": table}).scalars()
+    return _months(table, names)
+
+
+def _detached(conn, table: str) -> Dict[datetime, str]:
+    """Month tables already detached by a run that stopped before dropping them."""
+    names = conn.execute(text(
+        "SELECT relname FROM pg_class WHERE relkind = 'r' AND NOT relispartition AND relname LIKE :prefix"
+    ), {"prefix": f"{table}_y%"}).scalars()
+    return _months(table, names)
+
+
+def _utc(value: datetime) -> datetime:
+    return value.astimezone(timezone.utc) if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def ensure_months(table: str, first: datetime, last: datetime):
+    """Creates a partition for every month from `first` through `last` that has none yet."""
+    month, end = archive.month_start(_utc(first)), archive.month_start(_utc(last))
+    with database.engine.begin() as conn:
+        existing = _partitions(conn, table)
+        while month <= end:
+            following = archive.add_months(month, 1)
+            if month not in existing:
+                # Fails if the default partition already holds rows for this month; those need moving by hand.
+                conn.execute(text(
+                    f"CREATE TABLE {archive.partition_name(table, month)} PARTITION OF {table} "
+                    f"FOR VALUES FROM ({_bound(table, month)}) TO ({_bound(table, following)})"
+                ))
+                logging.info(f"Created partition {archive.partition_name(table, month)}")
+            month = following
+
+
+def ensure_partitions(table: str, now: datetime):
+    ensure_months(table, now, archive.add_months(archive.month_start(_utc(now)), PARTITION_MONTHS_AHEAD))
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot encode {type(value).__name__}")
+
+
+def _export(name: str, path: str) -> int:
+    """
+    Writes a partition to `path` with its group index next to it, and returns the row count.
+
+    Rows are streamed from a server-side cursor ordered by group, so memory
+    holds at most ARCHIVE_CHUNK_ROWS rows.
+    """
+    index = {}
+    count = 0
+    with database.engine.connect() as conn, open(path, "wb") as archive_file:
+        result = conn.execution_options(stream_results=True, yield_per=ARCHIVE_CHUNK_ROWS).execute(
+            text(f"SELECT * FROM {name} ORDER BY group_id, id")
+        )
+        chunk, chunk_group = [], None
+
+        def flush():
+            offset = archive_file.tell()
+            archive_file.write(gzip.compress("".join(chunk).encode()))
+            index.setdefault(str(chunk_group), []).append([offset, archive_file.tell() - offset])
+            chunk.clear()
+
+        for row in result.mappings():
+            if chunk and (row["group_id"] != chunk_group or len(chunk) >= ARCHIVE_CHUNK_ROWS):
+                flush()
+            chunk_group = row["group_id"]
+            chunk.append(json.dumps(dict(row), default=_encode) + "\n")
+            count += 1
+        if chunk:
+            flush()
+        archive_file.flush()
+        os.fsync(archive_file.fileno())
+
+    with open(archive.index_path(path), "w") as index_file:
+        json.dump(index, index_file)
+    return count
+
+
+def _detach(table: str, name: str):
+    """Detaches a partition from its table, if it is still attached."""
+    with database.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        attached = conn.execute(text(
+            "SELECT 1 FROM pg_inherits WHERE inhrelid = CAST(:name AS regclass)"
+        ), {"name": name}).scalar()
+        if attached is None:
+            return
+        if database.engine.dialect.server_version_info >= (14,):
+            # Cannot run in a transaction. A detach interrupted halfway is completed with FINALIZE.
+            pending = conn.execute(text(
+                "SELECT inhdetachpending FROM pg_inherits WHERE inhrelid = CAST(:name AS regclass)"
+            ), {"name": name}).scalar()
+            conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name} {'FINALIZE' if pending else 'CONCURRENTLY'}"))
+            return
+
+    with database.engine.begin() as conn:
+        # Parent first, the order in which queries on the parent lock it and its partitions.
+        conn.execute(text(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE"))
+        conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+
+
+def archive_partition(table: str, start: datetime, name: str):
+    relative_path = archive.archive_path(table, start)
+    path = os.path.join(archive.ARCHIVE_DIR, relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    started = time.perf_counter()
+    exported = _export(name, path)
+    _detach(table, name)
+
+    # Detached, the table no longer receives rows, so a second export is final.
+    with database.engine.connect() as conn:
+        current = conn.execute(text(f"SELECT count(*) FROM {name}")).scalar()
+    if current != exported:
+        logging.warning(f"Partition {name} changed during export ({exported} -> {current} rows), exporting again")
+        exported = _export(name, path)
+
+    with database.engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO archived_partitions (table_name, range_start, range_end, path, row_count, archived_at) "
+            "VALUES (:table, :start, :end, :path, :rows, now())"
+        ), {"table": table, "start": start, "end": archive.add_months(start, 1), "path": relative_path, "rows": exported})
+        conn.execute(text(f"DROP TABLE {name}"))
+
+    logging.info(f"Archived {name}: {exported} rows to {path} in {time.perf_counter() - started:.1f}s")
+
+
+def run():
+    if database.engine.dialect.name != "postgresql":
+        logging.error("Partition maintenance requires PostgreSQL")
+        return
+
+    now = datetime.now(timezone.utc)
+    for table, retention in RETENTION_MONTHS.items():
+        ensure_partitions(table, now)
+        if retention <= 0:
+            continue
+        cutoff = archive.add_months(archive.month_start(now), -retention)
+        with database.engine.connect() as conn:
+            partitions = _partitions(conn, table)
+            detached = _detached(conn, table)
+        for start, name in sorted(detached.items()):
+            archive_partition(table, start, name)
+        for start, name in sorted(partitions.items()):
+            if archive.add_months(start, 1) <= cutoff:
+                archive_partition(table, start, name)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    start = time.perf_counter()
+    run()
+    logging.info(f"Partition maintenance finished in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
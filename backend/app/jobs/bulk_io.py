@@ -0,0 +1,498 @@
+"""
+Bulk import and export of hobbies, users, groups, memberships, posts and chat messages.
+
+    python -m app.jobs.bulk_io export messages messages.ndjson.gz
+    python -m app.jobs.bulk_io import users users.csv
+    python -m app.jobs.bulk_io reindex posts
+
+Files are NDJSON (one object per line) or CSV with a header row, picked from
+the file name unless --format is given. Names ending in .gz are compressed,
+and "-" means stdin or stdout. Rows are read, loaded and committed
+BULK_CHUNK_SIZE at a time, so memory stays flat whatever the file size. On
+PostgreSQL each chunk is loaded with COPY and CSV exports are written by COPY
+directly; other databases get multi-row INSERTs.
+
+Users are expected to carry `hashed_password`, a bcrypt hash such as an export
+from another deployment. Rows with a plain `password` instead are hashed here,
+which costs tens of milliseconds per row. Rows keep their `id` when they have
+one, and the ID sequence is moved past the largest imported ID afterwards.
+
+Imports do not index anything per row. Users, groups and posts are indexed in
+one bulk pass at the end, unless --skip-index is given. `reindex` runs that
+pass on its own. A user's hobbies are part of their search document, but users
+are loaded before user_hobbies, so a users import indexes them without hobbies
+and the user_hobbies import reindexes the users of each chunk it commits. Each
+committed memberships chunk drops the cached group lists of its users. After a
+message import, the groups' last-message previews are refreshed in one
+statement.
+
+On PostgreSQL, posts and messages go to monthly partitions (see app.archive).
+Before each chunk is loaded, partitions are created for every month it
+covers, so rows from an older deployment do not pile up in the default
+partition. Rows for a month that was already archived are refused.
+
+Load files in foreign-key order: hobbies, users, user_hobbies, groups,
+memberships, posts, messages. A failing chunk stops the import. Chunks that
+were already committed stay, and the log says how many rows that was.
+"""
+import argparse
+import asyncio
+import contextlib
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import Boolean, Integer, TIMESTAMP, func, select, text
+
+from app import archive, database, es_client, membership_cache, models, search_cache, security
+from app.jobs import archive as archive_job
+from app.redis_client import redis_client
+
+load_dotenv()
+
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "10000"))
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+# entity -> (table, defaults for columns the file leaves out). COPY bypasses the
+# ORM, so the model's Python-side defaults are applied here.
+ENTITIES = {
+    "hobbies": (models.Hobby.__table__, {}),
+    "users": (models.User.__table__, {"created_at": _now}),
+    "user_hobbies": (models.user_hobbies, {}),
+    "groups": (models.Group.__table__, {"created_at": _now, "is_direct_message": lambda: False, "last_activity_at": _now}),
+    "memberships": (models.Membership.__table__, {"joined_at": _now}),
+    "posts": (models.Post.__table__, {"created_at": _now}),
+    "messages": (models.ChatMessage.__table__, {"timestamp": _now}),
+}
+# Entities with a search index, and the index they go to.
+SEARCH_INDICES = {"users": "users", "groups": "groups", "posts": "posts"}
+# Entities stored in monthly partitions on PostgreSQL, and their table.
+PARTITIONED_ENTITIES = {"posts": "posts", "messages": "chat_messages"}
+
+
+# --- Files ---
+
+def _format(path: str, requested: Optional[str]) -> str:
+    if requested:
+        return requested
+    return "csv" if path.removesuffix(".gz").endswith(".csv") else "ndjson"
+
+
+def _open(path: str, mode: str):
+    if path == "-":
+        return contextlib.nullcontext(sys.stdin if mode == "r" else sys.stdout)
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", newline="", encoding="utf-8")
+    return open(path, mode, newline="", encoding="utf-8")
+
+
+def _read_rows(source, file_format: str) -> Iterator[dict]:
+    if file_format == "csv":
+        for row in csv.DictReader(source):
+            # An empty CSV field means NULL, as it does for COPY.
+            yield {key: (value if value != "" else None) for key, value in row.items()}
+    else:
+        for line in source:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _text_value(value):
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot encode {type(value).__name__}")
+
+
+def _chunks(rows: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(rows)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+# --- Import ---
+
+def _prepare(entity: str, rows: List[dict]) -> List[str]:
+    """Fills defaults and password hashes in place and returns the table columns present in the chunk."""
+    table, defaults = ENTITIES[entity]
+    for row in rows:
+        if entity == "users":
+            _check_password(row)
+        for column, default in defaults.items():
+            if row.get(column) is None:
+                row[column] = default()
+    present = set().union(*rows)
+    # COPY stores a missing id as NULL rather than drawing from the sequence.
+    if "id" in present and any(row.get("id") is None for row in rows):
+        raise ValueError(f"Either every {entity} row needs an id or none may have one")
+    return [column.name for column in table.columns if column.name in present]
+
+
+def _check_password(row: dict):
+    password = row.pop("password", None)
+    if row.get("hashed_password"):
+        if security.pwd_context.identify(row["hashed_password"], required=False) is None:
+            raise ValueError(f"User {row.get('email')} has a hashed_password in an unsupported format")
+    elif password:
+        row["hashed_password"] = security.hash_password(password)
+    else:
+        raise ValueError(f"User {row.get('email')} has neither hashed_password nor password")
+
+
+def _timestamp(value) -> datetime:
+    return value if isinstance(value, datetime) else datetime.fromisoformat(value)
+
+
+def _ensure_partitions(entity: str, rows: List[dict]):
+    """Creates the monthly partitions a chunk of posts or messages needs, refusing archived months."""
+    table = PARTITIONED_ENTITIES.get(entity)
+    if table is None or database.engine.dialect.name != "postgresql":
+        return
+    column = archive.PARTITION_COLUMNS[table]
+    times = [_timestamp(row[column]) for row in rows]
+    first, last = min(times), max(times)
+    with database.engine.connect() as conn:
+        archived = conn.execute(
+            select(func.count()).select_from(models.ArchivedPartition).where(
+                models.ArchivedPartition.table_name == table,
+                models.ArchivedPartition.range_end > archive_job._utc(first),
+                models.ArchivedPartition.range_start <= archive_job._utc(last),
+            )
+        ).scalar()
+    if archived:
+        raise ValueError(f"{entity} rows between {first} and {last} fall in months that were already archived")
+    archive_job.ensure_months(table, first, last)
+
+
+def _copy_chunk(conn, table, columns: List[str], rows: List[dict]):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([_text_value(row.get(column)) for column in columns])
+    buffer.seek(0)
+    quoted = ", ".join(f'"{column}"' for column in columns)
+    cursor = conn.connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {table.name} ({quoted}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+
+
+def _coerce(column, value):
+    """CSV values are all strings; the generic INSERT path needs them typed."""
+    if not isinstance(value, str):
+        return value
+    if isinstance(column.type, Boolean):
+        return value.lower() in ("true", "t", "1")
+    if isinstance(column.type, Integer):
+        return int(value)
+    if isinstance(column.type, TIMESTAMP):
+        return datetime.fromisoformat(value)
+    return value
+
+
+def _insert_chunk(conn, table, columns: List[str], rows: List[dict]):
+    conn.execute(table.insert(), [
+        {column: _coerce(table.c[column], row.get(column)) for column in columns}
+        for row in rows
+    ])
+
+
+def _max_id(table) -> int:
+    with database.engine.connect() as conn:
+        return conn.execute(select(func.coalesce(func.max(table.c.id), 0))).scalar()
+
+
+def _reset_sequence(table):
+    if database.engine.dialect.name != "postgresql":
+        return
+    with database.engine.begin() as conn:
+        conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), GREATEST((SELECT max(id) FROM {table.name}), 1))"
+        ))
+
+
+def _refresh_group_previews(since_id: int):
+    """Points each group's last-message preview at its newest message after a message import."""
+    if database.engine.dialect.name != "postgresql":
+        logging.warning("Group last-message previews are only refreshed on PostgreSQL")
+        return
+    with database.engine.begin() as conn:
+        conn.execute(text("""
+            UPDATE groups
+            SET last_message_id = latest.id,
+                last_message_user_id = latest.user_id,
+                last_message_preview = LEFT(latest.content, 200),
+                last_message_at = latest.timestamp,
+                last_activity_at = GREATEST(groups.last_activity_at, latest.timestamp)
+            FROM (
+                SELECT DISTINCT ON (group_id) group_id, id, user_id, content, timestamp
+                FROM chat_messages
+                WHERE id >= :since_id
+                ORDER BY group_id, id DESC
+            ) AS latest
+            WHERE groups.id = latest.group_id
+              AND (groups.last_message_id IS NULL OR groups.last_message_id < latest.id)
+        """), {"since_id": since_id})
+
+
+def import_rows(entity: str, rows: Iterable[dict],
+                after_chunk: Optional[Callable[[List[dict]], None]] = None) -> Optional[int]:
+    """
+    Loads rows in chunks, one transaction each, calling `after_chunk` with each committed chunk.
+
+    Returns the smallest ID that may have been written, which covers every
+    imported row. Tables without an ID column return None.
+    """
+    table, _ = ENTITIES[entity]
+    has_id = "id" in table.c
+    since_id = _max_id(table) + 1 if has_id else None
+    load = _copy_chunk if database.engine.dialect.name == "postgresql" else _insert_chunk
+
+    started = time.perf_counter()
+    imported = 0
+    for chunk in _chunks(rows, BULK_CHUNK_SIZE):
+        columns = _prepare(entity, chunk)
+        if has_id:
+            explicit_ids = [int(row["id"]) for row in chunk if row.get("id") is not None]
+            if explicit_ids:
+                since_id = min(since_id, min(explicit_ids))
+        try:
+            _ensure_partitions(entity, chunk)
+            with database.engine.begin() as conn:
+                load(conn, table, columns, chunk)
+        except Exception:
+            logging.error(f"Import of {entity} stopped after {imported} rows")
+            raise
+        imported += len(chunk)
+        if after_chunk:
+            after_chunk(chunk)
+        elapsed = time.perf_counter() - started
+        logging.info(f"Imported {imported} {entity} ({imported / elapsed:.0f} rows/s)")
+
+    if has_id:
+        _reset_sequence(table)
+    if entity == "messages" and imported:
+        _refresh_group_previews(since_id)
+    return since_id
+
+
+# --- Export ---
+
+def export_rows(entity: str, destination, file_format: str) -> int:
+    table, _ = ENTITIES[entity]
+    columns = [column.name for column in table.columns]
+
+    if file_format == "csv" and database.engine.dialect.name == "postgresql":
+        quoted = ", ".join(f'"{column}"' for column in columns)
+        with database.engine.connect() as conn:
+            cursor = conn.connection.cursor()
+            try:
+                # COPY (SELECT ...) rather than COPY table, which partitioned tables do not support.
+                cursor.copy_expert(f"COPY (SELECT {quoted} FROM {table.name}) TO STDOUT WITH (FORMAT csv, HEADER)", destination)
+                return cursor.rowcount
+            finally:
+                cursor.close()
+
+    writer = None
+    if file_format == "csv":
+        writer = csv.writer(destination)
+        writer.writerow(columns)
+    exported = 0
+    with database.engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=BULK_CHUNK_SIZE).execute(select(table))
+        for row in result.mappings():
+            if writer:
+                writer.writerow([_text_value(row[column]) for column in columns])
+            else:
+                destination.write(json.dumps(dict(row), default=_encode) + "\n")
+            exported += 1
+    return exported
+
+
+# --- Search ---
+
+def _user_documents(db, rows) -> List[dict]:
+    hobbies: Dict[int, List[str]] = {}
+    for user_id, name in db.query(models.user_hobbies.c.user_id, models.Hobby.name).join(
+        models.Hobby, models.Hobby.id == models.user_hobbies.c.hobby_id
+    ).filter(models.user_hobbies.c.user_id.in_([row.id for row in rows])):
+        hobbies.setdefault(user_id, []).append(name)
+    return [{"name": row.name, "email": row.email, "hobbies": hobbies.get(row.id, [])} for row in rows]
+
+
+def _documents(entity: str, since_id: int) -> Iterator[List[dict]]:
+    """Bulk index actions for rows with id >= since_id, a chunk at a time, read in ID order."""
+    last_id = since_id - 1
+    db = database.SessionLocal()
+    try:
+        while True:
+            if entity == "users":
+                rows = db.query(models.User.id, models.User.name, models.User.email).filter(
+                    models.User.id > last_id
+                ).order_by(models.User.id).limit(BULK_CHUNK_SIZE).all()
+                documents = _user_documents(db, rows)
+            elif entity == "groups":
+                # Only public groups are searchable.
+                rows = db.query(
+                    models.Group.id, models.Group.name, models.Group.description, models.Hobby.name.label("hobby")
+                ).outerjoin(models.Hobby, models.Hobby.id == models.Group.hobby_id).filter(
+                    models.Group.id > last_id, models.Group.is_direct_message == False
+                ).order_by(models.Group.id).limit(BULK_CHUNK_SIZE).all()
+                documents = [{"name": row.name, "description": row.description, "hobby": row.hobby} for row in rows]
+            else:
+                rows = db.query(models.Post.id, models.Post.title, models.Post.content, models.Post.group_id).filter(
+                    models.Post.id > last_id
+                ).order_by(models.Post.id).limit(BULK_CHUNK_SIZE).all()
+                documents = [{"title": row.title, "content": row.content, "group_id": row.group_id} for row in rows]
+
+            if not rows:
+                return
+            last_id = rows[-1].id
+            yield [
+                {"_index": SEARCH_INDICES[entity], "_id": row.id, "_source": document}
+                for row, document in zip(rows, documents)
+            ]
+    finally:
+        db.close()
+
+
+def _user_documents_by_id(user_ids: Iterable[int]) -> Iterator[List[dict]]:
+    """Bulk index actions for the given users, a chunk at a time."""
+    user_ids = sorted(user_ids)
+    db = database.SessionLocal()
+    try:
+        for start in range(0, len(user_ids), BULK_CHUNK_SIZE):
+            rows = db.query(models.User.id, models.User.name, models.User.email).filter(
+                models.User.id.in_(user_ids[start:start + BULK_CHUNK_SIZE])
+            ).all()
+            yield [
+                {"_index": SEARCH_INDICES["users"], "_id": row.id, "_source": document}
+                for row, document in zip(rows, _user_documents(db, rows))
+            ]
+    finally:
+        db.close()
+
+
+async def reindex(entity: str, since_id: int = 0, user_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    Indexes every row with id >= since_id in bulk requests, refreshing the index once at the end.
+
+    With `user_ids`, only those users are indexed instead.
+    """
+    if not es_client.SEARCH_ENABLED:
+        logging.info("Search is disabled; nothing to index")
+        return 0
+    from elasticsearch.helpers import async_bulk
+
+    client = es_client.get_es_client()
+    index = SEARCH_INDICES[entity]
+    indexed = 0
+    batches = _user_documents_by_id(user_ids) if user_ids is not None else _documents(entity, since_id)
+    for actions in batches:
+        if not actions:
+            continue
+        succeeded, errors = await async_bulk(client, actions, chunk_size=len(actions), raise_on_error=False)
+        indexed += succeeded
+        for error in errors[:5]:
+            logging.error(f"Failed to index into {index}: {error}")
+        logging.info(f"Indexed {indexed} {entity}")
+    await client.indices.refresh(index=index)
+    await search_cache.bump_generation(index)
+    return indexed
+
+
+async def _close_clients():
+    await es_client.close()
+    await redis_client.aclose()
+
+
+async def _reindex_and_close(entity: str, since_id: int = 0, user_ids: Optional[Iterable[int]] = None) -> int:
+    try:
+        return await reindex(entity, since_id, user_ids)
+    finally:
+        await _close_clients()
+
+
+# --- CLI ---
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="write a table to a file")
+    export_parser.add_argument("entity", choices=ENTITIES)
+    export_parser.add_argument("path", help='output file, or "-" for stdout')
+    export_parser.add_argument("--format", choices=("ndjson", "csv"))
+
+    import_parser = commands.add_parser("import", help="load a file into a table")
+    import_parser.add_argument("entity", choices=ENTITIES)
+    import_parser.add_argument("path", help='input file, or "-" for stdin')
+    import_parser.add_argument("--format", choices=("ndjson", "csv"))
+    import_parser.add_argument("--skip-index", action="store_true", help="do not index the imported rows for search")
+
+    reindex_parser = commands.add_parser("reindex", help="index a table for search in bulk")
+    reindex_parser.add_argument("entity", choices=SEARCH_INDICES)
+    reindex_parser.add_argument("--since-id", type=int, default=0, help="only index rows with at least this ID")
+
+    args = parser.parse_args()
+    start = time.perf_counter()
+
+    if args.command == "export":
+        with _open(args.path, "w") as destination:
+            exported = export_rows(args.entity, destination, _format(args.path, args.format))
+        logging.info(f"Exported {exported} {args.entity} in {time.perf_counter() - start:.1f}s")
+
+    elif args.command == "import":
+        # One loop for the whole import, so the Redis and search clients survive between chunks.
+        loop = asyncio.new_event_loop()
+
+        def after_chunk(chunk: List[dict]):
+            user_ids = {int(row["user_id"]) for row in chunk}
+            if args.entity == "memberships":
+                loop.run_until_complete(membership_cache.forget_users(user_ids))
+            elif args.entity == "user_hobbies" and not args.skip_index:
+                loop.run_until_complete(reindex("users", user_ids=user_ids))
+
+        try:
+            with _open(args.path, "r") as source:
+                since_id = import_rows(
+                    args.entity, _read_rows(source, _format(args.path, args.format)),
+                    after_chunk if args.entity in ("memberships", "user_hobbies") else None
+                )
+            logging.info(f"Imported {args.entity} in {time.perf_counter() - start:.1f}s")
+            if args.entity in SEARCH_INDICES and not args.skip_index:
+                indexed = loop.run_until_complete(reindex(args.entity, since_id))
+                logging.info(f"Indexed {indexed} {args.entity} in {time.perf_counter() - start:.1f}s")
+        finally:
+            loop.run_until_complete(_close_clients())
+            loop.close()
+
+    else:
+        indexed = asyncio.run(_reindex_and_close(args.entity, args.since_id))
+        logging.info(f"Indexed {indexed} {args.entity} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""
+Offline job that resumes user and group deletions interrupted by a restart.
+
+Deletions normally run in the API worker that accepted them (see app.deletion).
+Run this periodically, for example from cron, to finish jobs whose worker went
+away or that failed:
+
+    python -m app.jobs.deletions
+"""
+import asyncio
+import logging
+import time
+
+from app import deletion
+from app.redis_client import redis_client
+
+
+async def _resume() -> int:
+    try:
+        return await deletion.resume_pending()
+    finally:
+        await redis_client.aclose()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    start = time.perf_counter()
+    resumed = asyncio.run(_resume())
+    logging.info(f"Resumed {resumed} deletion jobs in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
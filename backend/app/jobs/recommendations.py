@@ -0,0 +1,241 @@
+"""
+Offline job that precomputes group recommendations for every user.
+
+Run it periodically, for example from cron:
+
+    python -m app.jobs.recommendations
+
+Each public group gets a short list of its most similar groups by co-membership.
+Every user is then scored against the groups matching their hobbies and the
+neighbours of the groups they already belong to, with a boost for recent
+activity. Only the top RECOMMENDATION_TOP_K groups per user are stored, so
+serving a user's recommendations is a primary-key range read.
+"""
+import asyncio
+import heapq
+import logging
+import math
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+from dotenv import load_dotenv
+from sqlalchemy import and_, func, insert
+from sqlalchemy.orm import Session, aliased
+
+from app import models, database
+from app.redis_client import redis_client
+
+load_dotenv()
+
+RECOMMENDATION_TOP_K = int(os.getenv("RECOMMENDATION_TOP_K", "20"))
+RECOMMENDATION_NEIGHBORS = int(os.getenv("RECOMMENDATION_NEIGHBORS", "50"))
+RECOMMENDATION_GROUPS_PER_HOBBY = int(os.getenv("RECOMMENDATION_GROUPS_PER_HOBBY", "100"))
+RECOMMENDATION_ACTIVITY_DAYS = int(os.getenv("RECOMMENDATION_ACTIVITY_DAYS", "14"))
+RECOMMENDATION_BATCH_SIZE = int(os.getenv("RECOMMENDATION_BATCH_SIZE", "1000"))
+
+HOBBY_WEIGHT = 1.0
+SIMILARITY_WEIGHT = 2.0
+ACTIVITY_WEIGHT = 0.5
+
+# Bumped after every run so recommendations cached from the previous run are ignored.
+VERSION_KEY = "recs:version"
+
+
+def cache_key(version, user_id: int) -> str:
+    return f"recs:{version}:{user_id}"
+
+
+def _public_groups(db: Session) -> Dict[int, int]:
+    """Maps every non-DM group ID to its hobby ID."""
+    rows = db.query(models.Group.id, models.Group.hobby_id).filter(
+        models.Group.is_direct_message == False
+    ).all()
+    return dict(rows)
+
+
+def _member_counts(db: Session) -> Dict[int, int]:
+    rows = db.query(models.Membership.group_id, func.count()).group_by(models.Membership.group_id).all()
+    return dict(rows)
+
+
+def _activity_scores(db: Session) -> Dict[int, float]:
+    """Recent posts and messages per group, log-scaled to [0, 1]."""
+    since = datetime.now(timezone.utc) - timedelta(days=RECOMMENDATION_ACTIVITY_DAYS)
+    counts = defaultdict(int)
+    # posts.created_at is stored without a time zone, in UTC.
+    for group_id, count in db.query(models.Post.group_id, func.count()).filter(
+        models.Post.created_at >= since.replace(tzinfo=None)
+    ).group_by(models.Post.group_id):
+        counts[group_id] += count
+    for group_id, count in db.query(models.ChatMessage.group_id, func.count()).filter(
+        models.ChatMessage.timestamp >= since
+    ).group_by(models.ChatMessage.group_id):
+        counts[group_id] += count
+
+    if not counts:
+        return {}
+    scale = math.log1p(max(counts.values()))
+    return {group_id: math.log1p(count) / scale for group_id, count in counts.items()}
+
+
+def _group_neighbors(db: Session, member_counts: Dict[int, int]) -> Dict[int, Dict[int, float]]:
+    """
+    Keeps, for each public group, the RECOMMENDATION_NEIGHBORS groups with the
+    highest cosine similarity of their member sets. The co-membership counts are
+    aggregated by the database and streamed, so only the top lists stay in memory.
+    """
+    a = aliased(models.Membership)
+    b = aliased(models.Membership)
+    group_a = aliased(models.Group)
+    group_b = aliased(models.Group)
+    rows = db.query(a.group_id, b.group_id, func.count()).join(
+        b, and_(a.user_id == b.user_id, a.group_id != b.group_id)
+    ).join(
+        group_a, group_a.id == a.group_id
+    ).join(
+        group_b, group_b.id == b.group_id
+    ).filter(
+        group_a.is_direct_message == False,
+        group_b.is_direct_message == False
+    ).group_by(a.group_id, b.group_id).yield_per(10000)
+
+    heaps = defaultdict(list)
+    for group_id, other_id, shared in rows:
+        similarity = shared / math.sqrt(member_counts[group_id] * member_counts[other_id])
+        heap = heaps[group_id]
+        if len(heap) < RECOMMENDATION_NEIGHBORS:
+            heapq.heappush(heap, (similarity, other_id))
+        elif similarity > heap[0][0]:
+            heapq.heapreplace(heap, (similarity, other_id))
+
+    return {group_id: {other_id: sim for sim, other_id in heap} for group_id, heap in heaps.items()}
+
+
+def _groups_by_hobby(groups: Dict[int, int], member_counts: Dict[int, int], activity: Dict[int, float]) -> Dict[int, List[int]]:
+    """The most active and largest groups of each hobby, which are the hobby-overlap candidates."""
+    by_hobby = defaultdict(list)
+    for group_id, hobby_id in groups.items():
+        if hobby_id is not None:
+            by_hobby[hobby_id].append(group_id)
+    for hobby_id, group_ids in by_hobby.items():
+        group_ids.sort(key=lambda g: (activity.get(g, 0.0), member_counts.get(g, 0)), reverse=True)
+        del group_ids[RECOMMENDATION_GROUPS_PER_HOBBY:]
+    return by_hobby
+
+
+def _score_user(hobby_ids, joined, neighbors, groups_by_hobby, activity) -> List[tuple]:
+    scores = defaultdict(float)
+    for hobby_id in hobby_ids:
+        for group_id in groups_by_hobby.get(hobby_id, ()):
+            scores[group_id] += HOBBY_WEIGHT
+    for group_id in joined:
+        for other_id, similarity in neighbors.get(group_id, {}).items():
+            scores[other_id] += SIMILARITY_WEIGHT * similarity
+
+    candidates = (
+        (score + ACTIVITY_WEIGHT * activity.get(group_id, 0.0), group_id)
+        for group_id, score in scores.items()
+        if group_id not in joined
+    )
+    return heapq.nlargest(RECOMMENDATION_TOP_K, candidates)
+
+
+def run(db: Session) -> int:
+    """Recomputes the recommendations table in batches of users. Returns the number of users processed."""
+    groups = _public_groups(db)
+    member_counts = _member_counts(db)
+    activity = _activity_scores(db)
+    neighbors = _group_neighbors(db, member_counts)
+    groups_by_hobby = _groups_by_hobby(groups, member_counts, activity)
+    logging.info(f"Computed neighbours for {len(neighbors)} of {len(groups)} groups")
+
+    processed = 0
+    last_user_id = 0
+    while True:
+        user_ids = [row[0] for row in db.query(models.User.id).filter(
+            models.User.id > last_user_id
+        ).order_by(models.User.id).limit(RECOMMENDATION_BATCH_SIZE)]
+        if not user_ids:
+            break
+
+        hobbies = defaultdict(set)
+        for user_id, hobby_id in db.query(models.user_hobbies.c.user_id, models.user_hobbies.c.hobby_id).filter(
+            models.user_hobbies.c.user_id.in_(user_ids)
+        ):
+            hobbies[user_id].add(hobby_id)
+        joined = defaultdict(set)
+        for user_id, group_id in db.query(models.Membership.user_id, models.Membership.group_id).filter(
+            models.Membership.user_id.in_(user_ids)
+        ):
+            joined[user_id].add(group_id)
+
+        computed_at = datetime.now(timezone.utc)
+        rows = [
+            {"user_id": user_id, "group_id": group_id, "score": score, "computed_at": computed_at}
+            for user_id in user_ids
+            for score, group_id in _score_user(hobbies[user_id], joined[user_id], neighbors, groups_by_hobby, activity)
+        ]
+
+        db.query(models.GroupRecommendation).filter(
+            models.GroupRecommendation.user_id.in_(user_ids)
+        ).delete(synchronize_session=False)
+        if rows:
+            db.execute(insert(models.GroupRecommendation), rows)
+        db.commit()
+
+        processed += len(user_ids)
+        last_user_id = user_ids[-1]
+
+    return processed
+
+
+def load_recommendations(db: Session, user: models.User) -> List[dict]:
+    """Reads a user's precomputed recommendations, falling back to hobby matches for new users."""
+    rows = db.query(models.Group, models.GroupRecommendation.score).join(
+        models.GroupRecommendation, models.GroupRecommendation.group_id == models.Group.id
+    ).filter(
+        models.GroupRecommendation.user_id == user.id
+    ).order_by(models.GroupRecommendation.score.desc()).limit(RECOMMENDATION_TOP_K).all()
+
+    if not rows and user.hobby_ids:
+        # Users who signed up after the last run get groups for their hobbies until it catches up.
+        groups = db.query(models.Group).filter(
+            models.Group.is_direct_message == False,
+            models.Group.hobby_id.in_(user.hobby_ids)
+        ).order_by(models.Group.id.desc()).limit(RECOMMENDATION_TOP_K).all()
+        rows = [(group, 0.0) for group in groups]
+
+    return [
+        {
+            "id": group.id,
+            "name": group.name,
+            "description": group.description,
+            "hobby": group.hobby,
+            "score": score
+        }
+        for group, score in rows
+    ]
+
+
+async def _publish_new_version():
+    await redis_client.incr(VERSION_KEY)
+    await redis_client.aclose()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    start = time.perf_counter()
+    db = database.SessionLocal()
+    try:
+        processed = run(db)
+    finally:
+        db.close()
+    asyncio.run(_publish_new_version())
+    logging.info(f"Recomputed recommendations for {processed} users in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,57 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import auth, users, groups, memberships, posts, chat, notifications, search
+import asyncio
+import logging
 
-app = FastAPI()
+from app import database, redis_client, es_client, presence, previews, read_state, tracing, compression
+from app.routers import auth, users, groups, memberships, posts, chat, notifications, internal
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    tracing.start_exporter()
+    # Warm the pools before the worker starts accepting traffic.
+    await run_in_threadpool(database.warm_up)
+    try:
+        await redis_client.warm_up()
+    except Exception as e:
+        logging.error(f"Could not reach Redis at startup: {e}")
+    await es_client.warm_up()
+    lag_monitor = asyncio.create_task(database.monitor_replica_lag()) if database.replica_engines else None
+    presence_heartbeat = asyncio.create_task(presence.run_heartbeat())
+    read_state_flusher = asyncio.create_task(read_state.run_flusher())
+    preview_flusher = asyncio.create_task(previews.run_flusher())
+
+    yield
+
+    presence_heartbeat.cancel()
+    read_state_flusher.cancel()
+    # Persist read positions that have not been flushed yet.
+    try:
+        await read_state.flush_dirty()
+    except Exception as e:
+        logging.error(f"Failed to persist read state on shutdown: {e}")
+    preview_flusher.cancel()
+    try:
+        await previews.flush_dirty()
+    except Exception as e:
+        logging.error(f"Failed to refresh group previews on shutdown: {e}")
+    if lag_monitor:
+        lag_monitor.cancel()
+    # Drain WebSockets first so their Redis listeners release connections,
+    # then close the clients so no sockets are leaked on rolling restarts.
+    await chat.chat_manager.shutdown()
+    await notifications.notification_manager.shutdown()
+    await es_client.close()
+    await redis_client.close()
+    await run_in_threadpool(database.dispose)
+    tracing.stop_exporter()
+
+
+tracing.install_serialization_hook()
+app = FastAPI(lifespan=lifespan, default_response_class=tracing.TimedJSONResponse)
 
 origins = [
     "http://localhost:5173",
@@ -16,6 +65,44 @@ app.add_middleware(
     allow_headers=["*"],         # allow all headers
 )
 
+app.add_middleware(
+    compression.CompressionMiddleware,
+    minimum_size=compression.COMPRESSION_MINIMUM_SIZE,
+    compresslevel=compression.GZIP_LEVEL,
+)
+
+
+@app.middleware("http")
+async def track_recent_writes(request: Request, call_next):
+    """Keeps a user's reads on the primary for a short while after a successful write."""
+    response = await call_next(request)
+    if request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+        subject = database.token_subject(request)
+        if subject:
+            await database.mark_recent_write(subject)
+    return response
+
+
+# Registered last so it wraps every other middleware and sees the whole request.
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Records where a request spends its time and reports it in a Server-Timing header."""
+    token = tracing.start_request(request.method, request.url.path)
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        trace = tracing.current()
+        route = request.scope.get("route")
+        if trace is not None and route is not None:
+            trace.route = route.path
+        server_timing = tracing.finish_request(token, status_code)
+    if server_timing:
+        response.headers["Server-Timing"] = server_timing
+    return response
+
+
 app.include_router(auth.router)
 app.include_router(users.router)
 app.include_router(groups.router)
@@ -23,4 +110,9 @@ app.include_router(memberships.router)
 app.include_router(posts.router)
 app.include_router(chat.router)
 app.include_router(notifications.router)
-app.include_router(search.router)
\ No newline at end of file
+app.include_router(internal.router)
+
+# Search is optional, so its router is only imported when it is enabled.
+if es_client.SEARCH_ENABLED:
+    from app.routers import search
+    app.include_router(search.router)
@@ -0,0 +1,157 @@
+import logging
+import os
+import time
+from typing import Dict, FrozenSet, Iterable, Tuple
+
+from dotenv import load_dotenv
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+
+from . import database, models
+from .redis_client import redis_client
+
+load_dotenv()
+
+# Other workers may keep serving a removed membership for up to this long.
+MEMBERSHIP_LOCAL_TTL_SECONDS = float(os.getenv("MEMBERSHIP_LOCAL_TTL_SECONDS", "5"))
+MEMBERSHIP_REDIS_TTL_SECONDS = int(os.getenv("MEMBERSHIP_REDIS_TTL_SECONDS", "600"))
+
+# Group IDs start at 1, so 0 marks a set as loaded even when the user is in no groups.
+_LOADED_MARKER = "0"
+
+# user_id -> (expires_at, group IDs)
+_local_cache: Dict[int, Tuple[float, FrozenSet[int]]] = {}
+
+# Fills a set from a database read only if no membership was removed since the read,
+# so a slow fill cannot put back a membership that a removal just took out.
+_fill_if_unchanged = redis_client.register_script("""
+if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[1] or redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+redis.call('SADD', KEYS[1], unpack(ARGV, 3))
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+""")
+
+# Only extend sets that are already loaded; a missing set is rebuilt from the database.
+_add_if_loaded = redis_client.register_script("""
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('SADD', KEYS[1], unpack(ARGV))
+end
+return 0
+""")
+
+
+def _key(user_id: int) -> str:
+    return f"user:{user_id}:groups"
+
+
+def _generation_key(user_id: int) -> str:
+    """Counts removals from a user's set; fills check it to detect removals that raced them."""
+    return f"user:{user_id}:groups:generation"
+
+
+# Both read the primary: a lagging replica could still list a membership that was just removed.
+def _load_group_ids(user_id: int) -> FrozenSet[int]:
+    db = database.SessionLocal()
+    try:
+        rows = db.query(models.Membership.group_id).filter(models.Membership.user_id == user_id).all()
+        return frozenset(row[0] for row in rows)
+    finally:
+        db.close()
+
+
+def _membership_exists(user_id: int, group_id: int) -> bool:
+    db = database.SessionLocal()
+    try:
+        return db.query(models.Membership.id).filter(
+            models.Membership.user_id == user_id,
+            models.Membership.group_id == group_id
+        ).first() is not None
+    finally:
+        db.close()
+
+
+def _set_local(user_id: int, group_ids: FrozenSet[int]):
+    _local_cache[user_id] = (time.monotonic() + MEMBERSHIP_LOCAL_TTL_SECONDS, group_ids)
+
+
+async def get_group_ids(db: Session, user_id: int) -> FrozenSet[int]:
+    """Returns the IDs of every group `user_id` belongs to, from memory, Redis or the database."""
+    entry = _local_cache.get(user_id)
+    if entry and entry[0] > time.monotonic():
+        return entry[1]
+
+    key, generation_key = _key(user_id), _generation_key(user_id)
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.smembers(key)
+            pipe.get(generation_key)
+            members, generation = await pipe.execute()
+    except Exception as e:
+        logging.error(f"Failed to read membership cache for user {user_id}: {e}")
+        members, generation = None, None
+
+    if members:
+        group_ids = frozenset(int(m) for m in members if m != _LOADED_MARKER)
+    else:
+        group_ids = await run_in_threadpool(_load_group_ids, user_id)
+        try:
+            await _fill_if_unchanged(
+                keys=[key, generation_key],
+                args=[generation or "0", MEMBERSHIP_REDIS_TTL_SECONDS, _LOADED_MARKER, *group_ids]
+            )
+        except Exception as e:
+            logging.error(f"Failed to populate membership cache for user {user_id}: {e}")
+
+    _set_local(user_id, group_ids)
+    return group_ids
+
+
+async def is_member(db: Session, user_id: int, group_id: int) -> bool:
+    if group_id in await get_group_ids(db, user_id):
+        return True
+    # A miss may come from a cache that has not seen a recent join yet, so
+    # confirm it against the database before denying access.
+    if await run_in_threadpool(_membership_exists, user_id, group_id):
+        await add_memberships(user_id, [group_id])
+        return True
+    return False
+
+
+async def add_memberships(user_id: int, group_ids: Iterable[int]):
+    group_ids = frozenset(group_ids)
+    if not group_ids:
+        return
+    entry = _local_cache.get(user_id)
+    if entry:
+        _local_cache[user_id] = (entry[0], entry[1] | group_ids)
+    try:
+        await _add_if_loaded(keys=[_key(user_id)], args=list(group_ids))
+    except Exception as e:
+        logging.error(f"Failed to add memberships to cache for user {user_id}: {e}")
+
+
+async def remove_memberships(user_id: int, group_ids: Iterable[int]):
+    group_ids = frozenset(group_ids)
+    if not group_ids:
+        return
+    entry = _local_cache.get(user_id)
+    if entry:
+        _local_cache[user_id] = (entry[0], entry[1] - group_ids)
+    try:
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.incr(_generation_key(user_id))
+            # Outlives any fill that could have read the database before this removal.
+            pipe.expire(_generation_key(user_id), MEMBERSHIP_REDIS_TTL_SECONDS)
+            pipe.srem(_key(user_id), *group_ids)
+            await pipe.execute()
+    except Exception as e:
+        logging.error(f"Failed to remove memberships from cache for user {user_id}: {e}")
+
+
+async def forget_users(user_ids: Iterable[int]):
+    """Drops the cached groups of many users at once, e.g. after memberships were written outside the API."""
+    keys = [_key(user_id) for user_id in user_ids]
+    for start in range(0, len(keys), 1000):
+        await redis_client.delete(*keys[start:start + 1000])
@@ -0,0 +1,136 @@
+import bisect
+import threading
+import time
+from typing import Dict
+
+
+class PoolStats:
+    """Counters describing how long callers wait for a pooled connection and how often the pool runs dry."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.saturated_checkouts = 0
+        self.timeouts = 0
+
+    def record_checkout(self, wait_seconds: float, saturated: bool):
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait_seconds += wait_seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+            if saturated:
+                self.saturated_checkouts += 1
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def as_dict(self) -> dict:
+        return {
+            "checkouts": self.checkouts,
+            "avg_wait_ms": (self.total_wait_seconds / self.checkouts * 1000) if self.checkouts else 0.0,
+            "max_wait_ms": self.max_wait_seconds * 1000,
+            "saturated_checkouts": self.saturated_checkouts,
+            "timeouts": self.timeouts,
+        }
+
+
+class Histogram:
+    """Fixed-bucket latency histogram in milliseconds, cheap enough to update on every send."""
+    BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS_MS) + 1)
+        self.total = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, value_ms: float):
+        self.counts[bisect.bisect_left(self.BUCKETS_MS, value_ms)] += 1
+        self.total += 1
+        self.sum_ms += value_ms
+        self.max_ms = max(self.max_ms, value_ms)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th quantile."""
+        if not self.total:
+            return 0.0
+        rank = q * self.total
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return float(self.BUCKETS_MS[i]) if i < len(self.BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.total,
+            "avg_ms": self.sum_ms / self.total if self.total else 0.0,
+            "p50_ms": self.quantile(0.5),
+            "p95_ms": self.quantile(0.95),
+            "p99_ms": self.quantile(0.99),
+            "max_ms": self.max_ms,
+            "buckets": {f"le_{bound}": count for bound, count in zip(self.BUCKETS_MS, self.counts)},
+        }
+
+
+class RateMeter:
+    """Events per second over a sliding window of one-second slots, plus the all-time total."""
+    def __init__(self, window_seconds: int = 60):
+        self.window = window_seconds
+        self.slots = [0] * window_seconds
+        self.slot_seconds = [0] * window_seconds
+        self.total = 0
+
+    def mark(self, count: int = 1):
+        now = int(time.monotonic())
+        i = now % self.window
+        if self.slot_seconds[i] != now:
+            self.slot_seconds[i] = now
+            self.slots[i] = 0
+        self.slots[i] += count
+        self.total += count
+
+    def rate(self) -> float:
+        now = int(time.monotonic())
+        # The current second is still filling up, so average over the completed ones.
+        recent = sum(
+            count for count, second in zip(self.slots, self.slot_seconds)
+            if now - self.window < second < now
+        )
+        return recent / (self.window - 1)
+
+
+class SocketStats:
+    """Traffic counters for one kind of WebSocket (chat or notifications) in this worker."""
+    def __init__(self):
+        self.messages_in = RateMeter()
+        self.messages_out = RateMeter()
+        self.send_latency = Histogram()
+        # Messages delivered per group or user, to find hot rooms.
+        self.out_by_key: Dict[int, RateMeter] = {}
+        self.slow_consumer_drops = 0
+        self.slow_consumers_closed = 0
+
+    def record_out(self, key: int, count: int):
+        self.messages_out.mark(count)
+        meter = self.out_by_key.get(key)
+        if meter is None:
+            meter = self.out_by_key[key] = RateMeter()
+        meter.mark(count)
+
+    def forget(self, key: int):
+        self.out_by_key.pop(key, None)
+
+    def as_dict(self, top: int = 10) -> dict:
+        rates = sorted(((meter.rate(), key) for key, meter in self.out_by_key.items()), reverse=True)[:top]
+        return {
+            "messages_in": {"total": self.messages_in.total, "per_second": self.messages_in.rate()},
+            "messages_out": {"total": self.messages_out.total, "per_second": self.messages_out.rate()},
+            "send_latency": self.send_latency.as_dict(),
+            "slow_consumer_drops": self.slow_consumer_drops,
+            "slow_consumers_closed": self.slow_consumers_closed,
+            "hottest": [{"id": key, "messages_out_per_second": rate} for rate, key in rates if rate > 0],
+        }
@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String, TIMESTAMP, ForeignKey, Table, Text, UniqueConstraint, Boolean
+from sqlalchemy import Column, Integer, String, TIMESTAMP, ForeignKey, Table, Text, UniqueConstraint, Boolean, Index, Float, event
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
+from functools import cached_property
 from .database import Base
 
 
@@ -19,17 +20,28 @@ class User(Base):
     name = Column(String, nullable=False)
     email = Column(String, unique=True, index=True, nullable=False)
     hashed_password = Column(String, nullable=False)
-    created_at = Column(TIMESTAMP, default=datetime.now(timezone.utc))
+    created_at = Column(TIMESTAMP, default=lambda: datetime.now(timezone.utc))
 
     # Relationship to hobbies (many-to-many)
-    hobbies = relationship("Hobby", secondary=user_hobbies, back_populates="users")
+    hobbies = relationship("Hobby", secondary=user_hobbies, back_populates="users", passive_deletes=True)
 
-    posts = relationship("Post", back_populates="owner", cascade="all, delete-orphan")
+    # Children are removed by the database's ON DELETE CASCADE rather than loaded and deleted
+    # one by one; large deletions go through app.deletion first.
+    posts = relationship("Post", back_populates="owner", cascade="all, delete-orphan", passive_deletes=True)
 
-    chat_messages = relationship("ChatMessage", back_populates="user", cascade="all, delete-orphan")
+    chat_messages = relationship("ChatMessage", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
 
     # Relationship to groups (via memberships)
-    memberships = relationship("Membership", back_populates="user", cascade="all, delete-orphan")
+    memberships = relationship("Membership", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
+
+    @cached_property
+    def hobby_ids(self) -> set[int]:
+        """
+        IDs of the user's hobbies, for eligibility checks against Group.hobby_id.
+
+        Built once per loaded user; changing or expiring `hobbies` clears it.
+        """
+        return {hobby.id for hobby in self.hobbies}
 
     @property
     def group_memberships(self) -> list[int]:
@@ -37,6 +49,18 @@ class User(Base):
         return [membership.group_id for membership in self.memberships]
 
 
+@event.listens_for(User.hobbies, "append")
+@event.listens_for(User.hobbies, "remove")
+def _hobbies_changed(user, *args):
+    user.__dict__.pop("hobby_ids", None)
+
+
+@event.listens_for(User, "expire")
+@event.listens_for(User, "refresh")
+def _user_reloaded(user, *args):
+    user.__dict__.pop("hobby_ids", None)
+
+
 class Hobby(Base):
     __tablename__ = "hobbies"
 
@@ -49,24 +73,51 @@ class Hobby(Base):
 
 class Group(Base):
     __tablename__ = "groups"
+    __table_args__ = (
+        # One DM per user pair: lookups are a single index probe and creation can upsert.
+        Index("ix_groups_dm_pair", "dm_user_low_id", "dm_user_high_id", unique=True),
+        # Keyset pagination of conversations by recent activity.
+        Index("ix_groups_last_activity_at_id", "last_activity_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
     description = Column(Text)
-    hobby = Column(String, nullable=False)
-    created_at = Column(TIMESTAMP, default=datetime.now(timezone.utc))
+    # NULL for DMs, which are not tied to a hobby.
+    hobby_id = Column(Integer, ForeignKey("hobbies.id"), nullable=True, index=True)
+    created_at = Column(TIMESTAMP, default=lambda: datetime.now(timezone.utc))
 
     is_direct_message = Column(Boolean, default=False, nullable=False)
 
+    # Denormalized preview of the latest chat message, written with the message itself.
+    last_message_id = Column(Integer, nullable=True)
+    last_message_user_id = Column(Integer, nullable=True)
+    last_message_preview = Column(String(200), nullable=True)
+    last_message_at = Column(TIMESTAMP(timezone=True), nullable=True)
+    # Creation time until the first message, then the latest message time.
+    last_activity_at = Column(TIMESTAMP(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
+
+    # Canonical (min, max) user IDs of a DM's two members; NULL for regular groups.
+    dm_user_low_id = Column(Integer, nullable=True)
+    dm_user_high_id = Column(Integer, nullable=True)
+
     # Track the creator of the group
-    creator_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    creator_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True, index=True)
+
+    # Always needed to render the hobby name, so load it in the same query.
+    hobby_ref = relationship("Hobby", lazy="joined")
     
     # Relationship to memberships
-    memberships = relationship("Membership", back_populates="group", cascade="all, delete-orphan")
+    memberships = relationship("Membership", back_populates="group", cascade="all, delete-orphan", passive_deletes=True)
+
+    posts = relationship("Post", back_populates="group", cascade="all, delete-orphan", passive_deletes=True)
 
-    posts = relationship("Post", back_populates="group", cascade="all, delete-orphan")
+    chat_messages = relationship("ChatMessage", back_populates="group", cascade="all, delete-orphan", passive_deletes=True)
 
-    chat_messages = relationship("ChatMessage", back_populates="group", cascade="all, delete-orphan")
+    @property
+    def hobby(self) -> str:
+        """Name of the group's hobby, as exposed by the API."""
+        return self.hobby_ref.name if self.hobby_ref else "Direct Message"
 
     @property
     def members(self) -> list:
@@ -76,12 +127,16 @@ class Group(Base):
 
 class Membership(Base):
     __tablename__ = "memberships"
-    __table_args__ = (UniqueConstraint('user_id', 'group_id', name='unique_membership'),)
+    __table_args__ = (
+        UniqueConstraint('user_id', 'group_id', name='unique_membership'),
+        # The unique constraint leads with user_id; group deletion and member lists go by group.
+        Index("ix_memberships_group_id", "group_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     group_id = Column(Integer, ForeignKey("groups.id", ondelete="CASCADE"), nullable=False)
-    joined_at = Column(TIMESTAMP, default=datetime.now(timezone.utc))
+    joined_at = Column(TIMESTAMP, default=lambda: datetime.now(timezone.utc))
 
     # Relationships
     user = relationship("User", back_populates="memberships")
@@ -89,12 +144,21 @@ class Membership(Base):
 
 
 class Post(Base):
+    """
+    On PostgreSQL the table is range-partitioned by month on created_at, with
+    primary key (id, created_at); see app.archive. `id` stays unique on its own.
+    """
     __tablename__ = "posts"
+    __table_args__ = (
+        Index("ix_posts_group_id_id", "group_id", "id"),
+        # Serves user deletion, which removes a user's posts in ID-ordered chunks.
+        Index("ix_posts_owner_id_id", "owner_id", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, nullable=False)
     content = Column(Text, nullable=False)
-    created_at = Column(TIMESTAMP, default=datetime.now(timezone.utc))
+    created_at = Column(TIMESTAMP, nullable=False, default=lambda: datetime.now(timezone.utc))
 
     owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
 
@@ -105,11 +169,21 @@ class Post(Base):
 
 
 class ChatMessage(Base):
+    """
+    On PostgreSQL the table is range-partitioned by month on timestamp, with
+    primary key (id, timestamp); see app.archive. `id` stays unique on its own.
+    """
     __tablename__ = "chat_messages"
+    __table_args__ = (
+        # Serves "messages in a group after id X" for unread counts.
+        Index("ix_chat_messages_group_id_id", "group_id", "id"),
+        # Serves user deletion and the users.id cascade check.
+        Index("ix_chat_messages_user_id_id", "user_id", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     content = Column(Text, nullable=False)
-    timestamp = Column(TIMESTAMP(timezone=True), default=lambda: datetime.now(timezone.utc))
+    timestamp = Column(TIMESTAMP(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
 
     # Foreign key to link the message to its author (User)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
@@ -119,4 +193,37 @@ class ChatMessage(Base):
 
     # Relationships to access the User and Group objects from a ChatMessage instance
     user = relationship("User", back_populates="chat_messages")
-    group = relationship("Group", back_populates="chat_messages")
\ No newline at end of file
+    group = relationship("Group", back_populates="chat_messages")
+
+
+class GroupRecommendation(Base):
+    """Top-K group recommendations per user, precomputed by app.jobs.recommendations."""
+    __tablename__ = "group_recommendations"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    group_id = Column(Integer, ForeignKey("groups.id", ondelete="CASCADE"), primary_key=True)
+    score = Column(Float, nullable=False)
+    computed_at = Column(TIMESTAMP(timezone=True), default=lambda: datetime.now(timezone.utc))
+
+
+class ConversationRead(Base):
+    """Last message each user has read per group, persisted lazily from Redis by app.read_state."""
+    __tablename__ = "conversation_reads"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    group_id = Column(Integer, ForeignKey("groups.id", ondelete="CASCADE"), primary_key=True)
+    last_read_message_id = Column(Integer, nullable=False)
+    updated_at = Column(TIMESTAMP(timezone=True), default=lambda: datetime.now(timezone.utc))
+
+
+class ArchivedPartition(Base):
+    """A month of a partitioned table moved to a compressed file by app.jobs.archive."""
+    __tablename__ = "archived_partitions"
+
+    table_name = Column(String, primary_key=True)
+    range_start = Column(TIMESTAMP(timezone=True), primary_key=True)
+    range_end = Column(TIMESTAMP(timezone=True), nullable=False)
+    # Relative to ARCHIVE_DIR.
+    path = Column(String, nullable=False)
+    row_count = Column(Integer, nullable=False)
+    archived_at = Column(TIMESTAMP(timezone=True), default=lambda: datetime.now(timezone.utc))
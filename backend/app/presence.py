@@ -0,0 +1,158 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from collections import defaultdict
+from typing import Dict, List, Set, Tuple
+
+from dotenv import load_dotenv
+
+from .redis_client import redis_client
+
+load_dotenv()
+
+PRESENCE_TTL_SECONDS = int(os.getenv("PRESENCE_TTL_SECONDS", "30"))
+PRESENCE_HEARTBEAT_SECONDS = int(os.getenv("PRESENCE_HEARTBEAT_SECONDS", "10"))
+# Presence changes and typing events within this window go out as one event per group.
+PRESENCE_FLUSH_SECONDS = float(os.getenv("PRESENCE_FLUSH_SECONDS", "0.5"))
+# A user's typing events are forwarded at most this often per group.
+TYPING_MIN_INTERVAL_SECONDS = float(os.getenv("TYPING_MIN_INTERVAL_SECONDS", "2"))
+
+# Presence entries are "<user_id>:<worker_id>" so that a user connected through
+# several workers stays online until the last of them disconnects.
+WORKER_ID = uuid.uuid4().hex[:12]
+
+# (group_id, user_id) -> number of sockets open on this worker
+_local_connections: Dict[Tuple[int, int], int] = defaultdict(int)
+# (group_id, user_id) -> when this worker last forwarded a typing event
+_last_typing: Dict[Tuple[int, int], float] = {}
+
+# Events waiting for the next per-group flush.
+_pending_online: Dict[int, Set[int]] = defaultdict(set)
+_pending_offline: Dict[int, Set[int]] = defaultdict(set)
+_pending_typing: Dict[int, Set[int]] = defaultdict(set)
+_flush_tasks: Dict[int, asyncio.Task] = {}
+
+
+def _key(group_id: int) -> str:
+    return f"presence:{group_id}"
+
+
+def _member(user_id: int) -> str:
+    return f"{user_id}:{WORKER_ID}"
+
+
+def _user_ids(members: List[str]) -> Set[int]:
+    return {int(member.split(":", 1)[0]) for member in members}
+
+
+async def get_online_user_ids(group_id: int) -> List[int]:
+    """Users with a live connection to the group on any worker, in one Redis call."""
+    members = await redis_client.zrangebyscore(_key(group_id), time.time(), "+inf")
+    return sorted(_user_ids(members))
+
+
+def _schedule_flush(group_id: int):
+    if group_id not in _flush_tasks:
+        _flush_tasks[group_id] = asyncio.create_task(_flush_after_delay(group_id))
+
+
+async def _flush_after_delay(group_id: int):
+    try:
+        await asyncio.sleep(PRESENCE_FLUSH_SECONDS)
+    finally:
+        _flush_tasks.pop(group_id, None)
+
+    online = _pending_online.pop(group_id, set())
+    offline = _pending_offline.pop(group_id, set())
+    typing = _pending_typing.pop(group_id, set()) - offline
+    channel = f"chat:{group_id}"
+    try:
+        if online or offline:
+            await redis_client.publish(channel, json.dumps({
+                "type": "PRESENCE",
+                "group_id": group_id,
+                "online": sorted(online - offline),
+                "offline": sorted(offline - online),
+            }))
+        if typing:
+            await redis_client.publish(channel, json.dumps({
+                "type": "TYPING",
+                "group_id": group_id,
+                "user_ids": sorted(typing),
+            }))
+    except Exception as e:
+        logging.error(f"Failed to publish presence events for group {group_id}: {e}")
+
+
+async def connected(group_id: int, user_id: int):
+    """Records a new socket for `user_id` in the group and announces them if they just came online."""
+    _local_connections[(group_id, user_id)] += 1
+    if _local_connections[(group_id, user_id)] > 1:
+        return
+
+    key = _key(group_id)
+    now = time.time()
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.zrangebyscore(key, now, "+inf")
+        pipe.zadd(key, {_member(user_id): now + PRESENCE_TTL_SECONDS})
+        pipe.expire(key, PRESENCE_TTL_SECONDS)
+        members, _, _ = await pipe.execute()
+
+    if user_id not in _user_ids(members):
+        _pending_online[group_id].add(user_id)
+        _schedule_flush(group_id)
+
+
+async def disconnected(group_id: int, user_id: int):
+    """Removes a socket and announces the user as offline once no worker has them connected."""
+    _local_connections[(group_id, user_id)] -= 1
+    if _local_connections[(group_id, user_id)] > 0:
+        return
+    del _local_connections[(group_id, user_id)]
+    _last_typing.pop((group_id, user_id), None)
+
+    key = _key(group_id)
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.zrem(key, _member(user_id))
+        pipe.zrangebyscore(key, time.time(), "+inf")
+        _, members = await pipe.execute()
+
+    if user_id not in _user_ids(members):
+        _pending_offline[group_id].add(user_id)
+        _schedule_flush(group_id)
+
+
+def typing(group_id: int, user_id: int):
+    """Queues a typing event, dropping it if the user sent one within TYPING_MIN_INTERVAL_SECONDS."""
+    now = time.monotonic()
+    if now - _last_typing.get((group_id, user_id), 0.0) < TYPING_MIN_INTERVAL_SECONDS:
+        return
+    _last_typing[(group_id, user_id)] = now
+    _pending_typing[group_id].add(user_id)
+    _schedule_flush(group_id)
+
+
+async def run_heartbeat():
+    """Refreshes this worker's presence entries so they outlive PRESENCE_TTL_SECONDS while connected."""
+    while True:
+        await asyncio.sleep(PRESENCE_HEARTBEAT_SECONDS)
+        if not _local_connections:
+            continue
+        now = time.time()
+        members_by_group = defaultdict(dict)
+        for group_id, user_id in list(_local_connections):
+            members_by_group[group_id][_member(user_id)] = now + PRESENCE_TTL_SECONDS
+        try:
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for group_id, members in members_by_group.items():
+                    key = _key(group_id)
+                    pipe.zadd(key, members)
+                    # Entries left behind by crashed workers expire here.
+                    pipe.zremrangebyscore(key, "-inf", now)
+                    pipe.expire(key, PRESENCE_TTL_SECONDS)
+                await pipe.execute()
+        except Exception as e:
+            logging.error(f"Presence heartbeat failed: {e}")
@@ -0,0 +1,111 @@
+"""
+Last-message previews and activity times on group rows.
+
+Writing the preview in each message's own transaction serialized every sender
+of a busy group on that group's row lock. Instead, the first message of a group
+in a PREVIEW_UPDATE_INTERVAL_MS window writes the preview right away, in a
+short transaction of its own after the message is committed. Later messages in
+the window only mark the group dirty, and the flusher moves its preview to the
+newest message once per window. A busy group's row is written about once per
+window rather than once per message. In exchange, previews and the order of
+`GET /chat/conversations/recent` may lag the newest message by up to a window.
+"""
+import asyncio
+import logging
+import os
+from typing import Iterable
+
+from dotenv import load_dotenv
+from fastapi.concurrency import run_in_threadpool
+
+from . import database, models
+from .redis_client import redis_client
+
+load_dotenv()
+
+PREVIEW_LENGTH = 200
+PREVIEW_UPDATE_INTERVAL_MS = int(os.getenv("PREVIEW_UPDATE_INTERVAL_MS", "1000"))
+PREVIEW_FLUSH_BATCH = int(os.getenv("PREVIEW_FLUSH_BATCH", "500"))
+
+# Groups with messages newer than their preview.
+DIRTY_KEY = "previews:dirty"
+
+
+def _throttle_key(group_id: int) -> str:
+    return f"group:{group_id}:preview_written"
+
+
+def _write(db, message: models.ChatMessage):
+    # A preview never moves back to an older message, whichever write lands last.
+    db.query(models.Group).filter(
+        models.Group.id == message.group_id,
+        (models.Group.last_message_id == None) | (models.Group.last_message_id < message.id)
+    ).update({
+        models.Group.last_message_id: message.id,
+        models.Group.last_message_user_id: message.user_id,
+        models.Group.last_message_preview: message.content[:PREVIEW_LENGTH],
+        models.Group.last_message_at: message.timestamp,
+        models.Group.last_activity_at: message.timestamp
+    }, synchronize_session=False)
+
+
+def _write_message(message: models.ChatMessage):
+    db = database.SessionLocal()
+    try:
+        _write(db, message)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _refresh(group_ids: Iterable[int]):
+    """Moves each group's preview to its newest message."""
+    db = database.SessionLocal()
+    try:
+        for group_id in group_ids:
+            latest = db.query(models.ChatMessage).filter(
+                models.ChatMessage.group_id == group_id
+            ).order_by(models.ChatMessage.id.desc()).first()
+            if latest is not None:
+                _write(db, latest)
+            db.commit()
+    finally:
+        db.close()
+
+
+async def record_message(message: models.ChatMessage):
+    """Updates the preview of a committed message's group now, or marks it for the flusher."""
+    try:
+        write_now = await redis_client.set(
+            _throttle_key(message.group_id), 1, nx=True, px=PREVIEW_UPDATE_INTERVAL_MS
+        )
+        if not write_now:
+            await redis_client.sadd(DIRTY_KEY, message.group_id)
+            return
+    except Exception as e:
+        logging.error(f"Failed to throttle the preview of group {message.group_id}: {e}")
+    try:
+        await run_in_threadpool(_write_message, message)
+    except Exception as e:
+        logging.error(f"Failed to update the preview of group {message.group_id}: {e}")
+
+
+async def flush_dirty():
+    group_ids = await redis_client.spop(DIRTY_KEY, PREVIEW_FLUSH_BATCH)
+    if not group_ids:
+        return
+    try:
+        await run_in_threadpool(_refresh, [int(group_id) for group_id in group_ids])
+    except Exception:
+        # Put the groups back so the next flush retries them.
+        await redis_client.sadd(DIRTY_KEY, *group_ids)
+        raise
+
+
+async def run_flusher():
+    while True:
+        await asyncio.sleep(PREVIEW_UPDATE_INTERVAL_MS / 1000)
+        try:
+            await flush_dirty()
+        except Exception as e:
+            logging.error(f"Failed to refresh group previews: {e}")
@@ -0,0 +1,135 @@
+import logging
+import math
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+from fastapi import HTTPException, Request, status
+
+from .redis_client import redis_client
+
+load_dotenv()
+
+# Limits are "<requests>/<seconds>", e.g. "30/10" allows bursts of 30 and refills 3 per second.
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+# Tokens taken from Redis at once and spent locally, as a fraction of the bucket size.
+RATE_LIMIT_LEASE_FRACTION = float(os.getenv("RATE_LIMIT_LEASE_FRACTION", "0.1"))
+# Unspent leased tokens are given up after this long, bounding how far workers can overshoot together.
+RATE_LIMIT_LEASE_SECONDS = float(os.getenv("RATE_LIMIT_LEASE_SECONDS", "1"))
+_MAX_LOCAL_KEYS = 10000
+
+# A token bucket stored as a hash of (tokens, last refill time). Grants up to
+# ARGV[3] tokens and, when none are left, returns how long until the next one.
+_take_tokens = redis_client.register_script("""
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local granted = math.min(requested, math.floor(tokens))
+tokens = tokens - granted
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+local retry_after = 0
+if granted == 0 then
+    retry_after = (1 - tokens) / rate
+end
+return {granted, tostring(retry_after)}
+""")
+
+
+def _parse(spec: str) -> Tuple[int, float]:
+    count, seconds = spec.split("/")
+    return int(count), float(seconds)
+
+
+class RateLimiter:
+    """
+    A distributed token bucket per key, shared by every worker through Redis.
+
+    Each worker leases a few tokens at a time and spends them locally, and it
+    remembers denials until their retry time, so a client flooding one worker
+    costs about one Redis call per lease rather than one per request. If Redis
+    is unreachable, requests are allowed.
+    """
+    def __init__(self, name: str, spec: str):
+        self.name = name
+        self.capacity, seconds = _parse(spec)
+        self.rate = self.capacity / seconds
+        self.lease_size = max(1, int(self.capacity * RATE_LIMIT_LEASE_FRACTION))
+        # key -> (tokens left, lease expiry, denied until)
+        self._local: Dict[str, Tuple[int, float, float]] = {}
+
+    def _prune(self, now: float):
+        if len(self._local) >= _MAX_LOCAL_KEYS:
+            self._local = {key: entry for key, entry in self._local.items() if max(entry[1], entry[2]) > now}
+
+    async def hit(self, key) -> Optional[float]:
+        """Takes one token for `key`. Returns None if allowed, otherwise the seconds until retrying makes sense."""
+        if not RATE_LIMIT_ENABLED:
+            return None
+        key = str(key)
+        now = time.monotonic()
+        entry = self._local.get(key)
+        if entry:
+            tokens, lease_expires, denied_until = entry
+            if denied_until > now:
+                return denied_until - now
+            if tokens > 0 and lease_expires > now:
+                self._local[key] = (tokens - 1, lease_expires, 0.0)
+                return None
+
+        try:
+            granted, retry_after = await _take_tokens(
+                keys=[f"ratelimit:{self.name}:{key}"],
+                args=[self.capacity, self.rate, self.lease_size]
+            )
+        except Exception as e:
+            logging.error(f"Rate limiter {self.name} could not reach Redis: {e}")
+            return None
+
+        self._prune(now)
+        if int(granted) == 0:
+            retry_after = float(retry_after)
+            self._local[key] = (0, now, now + retry_after)
+            return retry_after
+        self._local[key] = (int(granted) - 1, now + RATE_LIMIT_LEASE_SECONDS, 0.0)
+        return None
+
+    def refund(self, key):
+        """Gives back a token taken by `hit`, e.g. when a second limit rejected the same request."""
+        key = str(key)
+        entry = self._local.get(key)
+        if entry and entry[1] > time.monotonic():
+            self._local[key] = (entry[0] + 1, entry[1], entry[2])
+
+
+chat_user = RateLimiter("chat_user", os.getenv("RATE_LIMIT_CHAT_USER", "30/10"))
+chat_group = RateLimiter("chat_group", os.getenv("RATE_LIMIT_CHAT_GROUP", "300/10"))
+post_user = RateLimiter("post_user", os.getenv("RATE_LIMIT_POST_USER", "10/60"))
+dm_user = RateLimiter("dm_user", os.getenv("RATE_LIMIT_DM_USER", "20/60"))
+signup_ip = RateLimiter("signup_ip", os.getenv("RATE_LIMIT_SIGNUP_IP", "5/3600"))
+login_ip = RateLimiter("login_ip", os.getenv("RATE_LIMIT_LOGIN_IP", "20/300"))
+
+
+async def enforce(limiter: RateLimiter, key):
+    """Raises 429 with a Retry-After header when `key` is over the limit."""
+    retry_after = await limiter.hit(key)
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests, please slow down",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+
+
+def by_client_ip(limiter: RateLimiter):
+    """A dependency applying `limiter` to the caller's IP address, for unauthenticated endpoints."""
+    async def dependency(request: Request):
+        await enforce(limiter, request.client.host if request.client else "unknown")
+    return dependency
@@ -0,0 +1,264 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import and_, func
+from sqlalchemy.orm import Session
+
+from . import models, database
+from .redis_client import redis_client
+
+load_dotenv()
+
+READ_STATE_TTL_SECONDS = int(os.getenv("READ_STATE_TTL_SECONDS", str(7 * 24 * 3600)))
+READ_STATE_FLUSH_SECONDS = float(os.getenv("READ_STATE_FLUSH_SECONDS", "5"))
+READ_STATE_FLUSH_BATCH = int(os.getenv("READ_STATE_FLUSH_BATCH", "500"))
+# New members may miss unread increments for up to this long.
+GROUP_MEMBERS_CACHE_SECONDS = float(os.getenv("GROUP_MEMBERS_CACHE_SECONDS", "30"))
+
+# Marks an unread hash as fully built, so increments never create a partial one.
+_LOADED_FIELD = "_loaded"
+# "<user_id>:<group_id>" pairs whose last-read position has not reached the database yet.
+DIRTY_KEY = "read_state:dirty"
+
+# group_id -> (expires_at, member user IDs)
+_group_members: Dict[int, Tuple[float, List[int]]] = {}
+
+_incr_if_loaded = redis_client.register_script("""
+for _, key in ipairs(KEYS) do
+    if redis.call('HEXISTS', key, ARGV[2]) == 1 then
+        redis.call('HINCRBY', key, ARGV[1], 1)
+    end
+end
+return 0
+""")
+
+# Moves the last-read position forward only, and sets the unread count to what remains after it.
+_mark_read = redis_client.register_script("""
+local current = tonumber(redis.call('HGET', KEYS[1], ARGV[1]) or '0')
+if tonumber(ARGV[2]) <= current then
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+if redis.call('HEXISTS', KEYS[2], ARGV[3]) == 1 then
+    redis.call('HSET', KEYS[2], ARGV[1], ARGV[6])
+end
+redis.call('SADD', KEYS[3], ARGV[5])
+return 1
+""")
+
+
+def _unread_key(user_id: int) -> str:
+    return f"unread:{user_id}"
+
+
+def _last_read_key(user_id: int) -> str:
+    return f"last_read:{user_id}"
+
+
+def _load_member_ids(db: Session, group_id: int) -> List[int]:
+    rows = db.query(models.Membership.user_id).filter(models.Membership.group_id == group_id).all()
+    return [row[0] for row in rows]
+
+
+async def _member_ids(db: Session, group_id: int) -> List[int]:
+    entry = _group_members.get(group_id)
+    if entry and entry[0] > time.monotonic():
+        return entry[1]
+    member_ids = await run_in_threadpool(_load_member_ids, db, group_id)
+    _group_members[group_id] = (time.monotonic() + GROUP_MEMBERS_CACHE_SECONDS, member_ids)
+    return member_ids
+
+
+async def record_message(db: Session, group_id: int, sender_id: int, message_id: int):
+    """Counts a new message as unread for every member but its sender, who has read it."""
+    recipients = [user_id for user_id in await _member_ids(db, group_id) if user_id != sender_id]
+    try:
+        if recipients:
+            await _incr_if_loaded(keys=[_unread_key(user_id) for user_id in recipients], args=[group_id, _LOADED_FIELD])
+        await mark_read(sender_id, group_id, message_id)
+    except Exception as e:
+        logging.error(f"Failed to update unread counters for group {group_id}: {e}")
+
+
+async def mark_read(user_id: int, group_id: int, message_id: int, unread: int = 0) -> bool:
+    """
+    Records that `user_id` has read `group_id` up to `message_id`. Returns False if it was already further.
+
+    `unread` is the number of messages from others after `message_id`; see `unread_after`.
+    """
+    return bool(await _mark_read(
+        keys=[_last_read_key(user_id), _unread_key(user_id), DIRTY_KEY],
+        args=[group_id, message_id, _LOADED_FIELD, READ_STATE_TTL_SECONDS, f"{user_id}:{group_id}", unread]
+    ))
+
+
+def _before_retained(db: Session, group_id: int, message_id: int) -> bool:
+    """Whether `message_id` is older than the group's oldest message still in the database."""
+    oldest = db.query(func.min(models.ChatMessage.id)).filter(models.ChatMessage.group_id == group_id).scalar()
+    if oldest is None:
+        # Every message was archived, if the group had any.
+        last_message_id = db.query(models.Group.last_message_id).filter(models.Group.id == group_id).scalar()
+        return last_message_id is not None and 0 < message_id <= last_message_id
+    return 0 < message_id < oldest
+
+
+def unread_after(db: Session, user_id: int, group_id: int, message_id: int) -> Optional[int]:
+    """
+    Counts the messages from others in `group_id` after `message_id`.
+
+    Returns None if `message_id` is not a message of the group. Reading up to
+    the group's last message, the common case, counts an empty index range.
+    An ID older than every message the group still keeps in the database may
+    belong to an archived month, and counts as read up to the archive boundary:
+    every retained message from others is unread.
+    """
+    message = db.query(models.ChatMessage.id).filter(
+        models.ChatMessage.id == message_id, models.ChatMessage.group_id == group_id
+    ).first()
+    if message is None and not _before_retained(db, group_id, message_id):
+        return None
+    # Not short-circuited on groups.last_message_id, which may lag behind (see app.previews).
+    return db.query(func.count(models.ChatMessage.id)).filter(
+        models.ChatMessage.group_id == group_id,
+        models.ChatMessage.id > message_id,
+        models.ChatMessage.user_id != user_id
+    ).scalar()
+
+
+def _load_from_db(db: Session, user_id: int) -> Tuple[Dict[int, int], Dict[int, int]]:
+    """Rebuilds a user's unread counts and last-read positions with two grouped queries."""
+    last_read = dict(db.query(
+        models.ConversationRead.group_id, models.ConversationRead.last_read_message_id
+    ).filter(models.ConversationRead.user_id == user_id).all())
+
+    unread = dict(db.query(models.ChatMessage.group_id, func.count()).join(
+        models.Membership,
+        and_(models.Membership.group_id == models.ChatMessage.group_id, models.Membership.user_id == user_id)
+    ).outerjoin(
+        models.ConversationRead,
+        and_(models.ConversationRead.group_id == models.ChatMessage.group_id, models.ConversationRead.user_id == user_id)
+    ).filter(
+        models.ChatMessage.id > func.coalesce(models.ConversationRead.last_read_message_id, 0),
+        models.ChatMessage.user_id != user_id
+    ).group_by(models.ChatMessage.group_id).all())
+
+    return unread, last_read
+
+
+async def get_read_state(db: Session, user_id: int, group_ids: Iterable[int]) -> Dict[int, Tuple[int, int | None]]:
+    """Returns {group_id: (unread_count, last_read_message_id)} for many groups in one Redis round trip."""
+    group_ids = list(group_ids)
+    if not group_ids:
+        return {}
+    unread_key, last_read_key = _unread_key(user_id), _last_read_key(user_id)
+
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.hmget(unread_key, [_LOADED_FIELD, *group_ids])
+        pipe.hmget(last_read_key, group_ids)
+        unread_values, last_read_values = await pipe.execute()
+
+    if unread_values[0] is not None:
+        unread = {g: int(v) for g, v in zip(group_ids, unread_values[1:]) if v is not None}
+        last_read = {g: int(v) for g, v in zip(group_ids, last_read_values) if v is not None}
+    else:
+        unread, last_read = await run_in_threadpool(_load_from_db, db, user_id)
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.hset(unread_key, mapping={_LOADED_FIELD: 1, **unread})
+            pipe.expire(unread_key, READ_STATE_TTL_SECONDS)
+            if last_read:
+                # Positions already in Redis may be newer than the persisted ones.
+                for group_id, message_id in last_read.items():
+                    pipe.hsetnx(last_read_key, group_id, message_id)
+                pipe.expire(last_read_key, READ_STATE_TTL_SECONDS)
+            await pipe.execute()
+
+    return {group_id: (unread.get(group_id, 0), last_read.get(group_id)) for group_id in group_ids}
+
+
+def _persist(rows: List[dict]):
+    db = database.SessionLocal()
+    try:
+        # Users or groups deleted since the read was recorded would fail the foreign keys and the whole batch.
+        user_ids = {row["user_id"] for row in rows}
+        group_ids = {row["group_id"] for row in rows}
+        existing_users = {row[0] for row in db.query(models.User.id).filter(models.User.id.in_(user_ids))}
+        existing_groups = {row[0] for row in db.query(models.Group.id).filter(models.Group.id.in_(group_ids))}
+        rows = [row for row in rows if row["user_id"] in existing_users and row["group_id"] in existing_groups]
+        if not rows:
+            return
+        stmt = database.dialect_insert(models.ConversationRead).values(rows)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=["user_id", "group_id"],
+            set_={
+                "last_read_message_id": stmt.excluded.last_read_message_id,
+                "updated_at": stmt.excluded.updated_at,
+            }
+        ))
+        db.commit()
+    finally:
+        db.close()
+
+
+async def flush_dirty():
+    """Writes a batch of changed last-read positions to the conversation_reads table."""
+    entries = await redis_client.spop(DIRTY_KEY, READ_STATE_FLUSH_BATCH)
+    if not entries:
+        return
+    pairs = [tuple(int(part) for part in entry.split(":")) for entry in entries]
+
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for user_id, group_id in pairs:
+            pipe.hget(_last_read_key(user_id), group_id)
+        values = await pipe.execute()
+
+    now = datetime.now(timezone.utc)
+    rows = [
+        {"user_id": user_id, "group_id": group_id, "last_read_message_id": int(value), "updated_at": now}
+        for (user_id, group_id), value in zip(pairs, values)
+        if value is not None
+    ]
+    if not rows:
+        return
+    try:
+        await run_in_threadpool(_persist, rows)
+    except Exception:
+        # Put the entries back so the next flush retries them.
+        await redis_client.sadd(DIRTY_KEY, *entries)
+        raise
+
+
+async def forget(pairs: Iterable[Tuple[int, int]]):
+    """Drops the cached read state of (user_id, group_id) pairs, e.g. for a group being deleted."""
+    pairs = list(pairs)
+    if not pairs:
+        return
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for user_id, group_id in pairs:
+            pipe.hdel(_last_read_key(user_id), group_id)
+            pipe.hdel(_unread_key(user_id), group_id)
+        pipe.srem(DIRTY_KEY, *(f"{user_id}:{group_id}" for user_id, group_id in pairs))
+        await pipe.execute()
+
+
+async def forget_user(user_id: int):
+    """Drops all cached read state of a user, including positions not yet persisted."""
+    await redis_client.delete(_last_read_key(user_id), _unread_key(user_id))
+    dirty = [entry async for entry in redis_client.sscan_iter(DIRTY_KEY, match=f"{user_id}:*")]
+    if dirty:
+        await redis_client.srem(DIRTY_KEY, *dirty)
+
+
+async def run_flusher():
+    while True:
+        await asyncio.sleep(READ_STATE_FLUSH_SECONDS)
+        try:
+            await flush_dirty()
+        except Exception as e:
+            logging.error(f"Failed to persist read state: {e}")
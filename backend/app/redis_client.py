@@ -1,5 +1,87 @@
+import os
+import time
 import redis.asyncio as redis
+from dotenv import load_dotenv
 
-redis_client = redis.Redis(host='localhost', port=6379, db=0, decode_responses=True)
+from . import tracing
+from .metrics import PoolStats
 
-print("Successfully connected to redis client")
\ No newline at end of file
+load_dotenv()
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Every pub/sub listener holds a dedicated connection, so leave headroom above
+# the number of concurrently listened chat groups and notification channels.
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "200"))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "5"))
+REDIS_SOCKET_CONNECT_TIMEOUT = float(os.getenv("REDIS_SOCKET_CONNECT_TIMEOUT", "2"))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", "30"))
+
+
+class InstrumentedBlockingConnectionPool(redis.BlockingConnectionPool):
+    """A blocking pool that records how long callers wait for a connection."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    async def get_connection(self, *args, **kwargs):
+        saturated = len(self._in_use_connections) >= self.max_connections
+        start = time.perf_counter()
+        try:
+            connection = await super().get_connection(*args, **kwargs)
+        except redis.ConnectionError:
+            # The blocking pool raises ConnectionError once `timeout` expires.
+            if saturated:
+                self.stats.record_timeout()
+            raise
+        self.stats.record_checkout(time.perf_counter() - start, saturated)
+        return connection
+
+
+class TracedPipeline(redis.client.Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        commands = " ".join(str(args[0]) for args, _ in self.command_stack)
+        with tracing.Timer("redis", "PIPELINE", commands):
+            return await super().execute(raise_on_error)
+
+
+class TracedRedis(redis.Redis):
+    """Records each command and pipeline in the active request's trace."""
+    async def execute_command(self, *args, **options):
+        with tracing.Timer("redis", str(args[0])):
+            return await super().execute_command(*args, **options)
+
+    def pipeline(self, transaction: bool = True, shard_hint=None):
+        return TracedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+redis_pool = InstrumentedBlockingConnectionPool.from_url(
+    REDIS_URL,
+    max_connections=REDIS_MAX_CONNECTIONS,
+    timeout=REDIS_POOL_TIMEOUT,
+    # No socket_timeout: pub/sub listeners block on reads indefinitely and would
+    # otherwise be torn down on every quiet period. Only the connect step is bounded.
+    socket_connect_timeout=REDIS_SOCKET_CONNECT_TIMEOUT,
+    socket_keepalive=True,
+    health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+    decode_responses=True,
+)
+
+redis_client = TracedRedis(connection_pool=redis_pool)
+
+
+async def warm_up():
+    await redis_client.ping()
+
+
+async def close():
+    await redis_client.aclose()
+    await redis_pool.disconnect()
+
+
+def pool_status() -> dict:
+    return {
+        "max_connections": redis_pool.max_connections,
+        "in_use": len(redis_pool._in_use_connections),
+        "idle": len(redis_pool._available_connections),
+        **redis_pool.stats.as_dict(),
+    }
@@ -3,9 +3,8 @@ from sqlalchemy.orm import Session
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import JWTError, jwt
 import logging
-from app.es_client import es_client
 
-from app import models, schemas, database, security
+from app import models, schemas, database, security, es_client, crud, rate_limit
 
 router = APIRouter(
     prefix="/auth",
@@ -15,7 +14,8 @@ router = APIRouter(
 bearer_scheme = HTTPBearer()
 
 
-@router.post("/login", response_model=schemas.TokenResponse)
+@router.post("/login", response_model=schemas.TokenResponse,
+             dependencies=[Depends(rate_limit.by_client_ip(rate_limit.login_ip))])
 def login(request: schemas.LoginRequest, db: Session = Depends(database.get_db)):
     user = db.query(models.User).filter(models.User.email == request.email).first()
     if not user or not security.verify_password(request.password, user.hashed_password):
@@ -36,18 +36,15 @@ async def index_user(user: models.User):
             "hobbies": [hobby.name for hobby in user.hobbies]
         }
         # Send the document to the 'users' index in Elasticsearch.
-        await es_client.index(
-            index="users",
-            id=user.id,
-            document=doc
-        )
+        await es_client.index_document("users", user.id, doc)
         logging.info(f"Successfully indexed user {user.id}")
     except Exception as e:
         logging.error(f"Failed to index user {user.id}: {e}")
         
 
 
-@router.post("/signup", response_model=schemas.UserResponse)
+@router.post("/signup", response_model=schemas.UserResponse,
+             dependencies=[Depends(rate_limit.by_client_ip(rate_limit.signup_ip))])
 def signup(
     user: schemas.UserCreate, 
     background_tasks: BackgroundTasks,
@@ -57,14 +54,7 @@ def signup(
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    hobby_objects = []
-    for hobby_name in user.hobbies:
-        hobby = db.query(models.Hobby).filter(models.Hobby.name == hobby_name).first()
-        if not hobby:
-            hobby = models.Hobby(name=hobby_name)
-            db.add(hobby)
-            db.flush()
-        hobby_objects.append(hobby)
+    hobby_objects = crud.resolve_hobbies(db, user.hobbies)
 
     new_user = models.User(
         name=user.name,
@@ -84,8 +74,14 @@ def signup(
 
 def get_current_user(
     credentials: HTTPAuthorizationCredentials = Security(bearer_scheme),
-    db: Session = Depends(database.get_db)
+    db: Session = Depends(database.get_read_db)
 ):
+    """
+    Resolves the bearer token to its user through the read session.
+
+    The user is attached to that session, so endpoints that write through
+    `get_db` load their own copy before modifying it.
+    """
     token = credentials.credentials
 
     credentials_exception = HTTPException(
@@ -133,5 +129,7 @@ async def get_current_user_ws(
     if not user:
         await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="User not found")
         return None
-    
+
+    # The session lives as long as the socket; don't let it pin a pooled connection.
+    db.close()
     return user
\ No newline at end of file
@@ -1,11 +1,19 @@
-from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect, HTTPException, status, BackgroundTasks
-from sqlalchemy.orm import Session, aliased, joinedload
-from typing import List, Dict
+from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect, HTTPException, status, BackgroundTasks, Query
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session, joinedload
+from datetime import datetime, timezone
+from typing import List, Dict, Literal, Optional
 import logging
+import base64
 import json
 import asyncio
+import itertools
+import os
 
-from app import database, models, schemas
+from app import database, models, schemas, membership_cache, presence, previews, read_state, serializers, rate_limit, archive
+from app.metrics import SocketStats
+from app.socket_sender import QueuedSender
 from .auth import get_current_user, get_current_user_ws
 from ..redis_client import redis_client
 
@@ -14,14 +22,18 @@ class ChatManager:
     def __init__(self):
         # Maps group_id to a list of active WebSocket connections on this server instance.
         self.active_connections: Dict[int, List[WebSocket]] = {}
+        # Each socket's outgoing queue, so fan-out never waits on a single client.
+        self.senders: Dict[WebSocket, QueuedSender] = {}
         # Maps group_id to its background Redis listener task.
         self.listener_tasks: Dict[int, asyncio.Task] = {}
+        self.stats = SocketStats()
 
     async def connect(self, websocket: WebSocket, group_id: int):
         await websocket.accept()
         if group_id not in self.active_connections:
             self.active_connections[group_id] = []
         self.active_connections[group_id].append(websocket)
+        self.senders[websocket] = QueuedSender(websocket, self.stats)
         # Start a Redis listener for this group if it's the first connection on this server.
         if group_id not in self.listener_tasks:
             self.listener_tasks[group_id] = asyncio.create_task(self._redis_listener(group_id))
@@ -29,8 +41,13 @@ class ChatManager:
     def disconnect(self, websocket: WebSocket, group_id: int):
         if group_id in self.active_connections and websocket in self.active_connections[group_id]:
             self.active_connections[group_id].remove(websocket)
+            sender = self.senders.pop(websocket, None)
+            if sender:
+                sender.close()
             # If it's the last connection for this group, cancel the background task to save resources.
             if not self.active_connections[group_id]:
+                del self.active_connections[group_id]
+                self.stats.forget(group_id)
                 task = self.listener_tasks.pop(group_id, None)
                 if task:
                     task.cancel()
@@ -45,16 +62,59 @@ class ChatManager:
                 while True:
                     message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=None)
                     if message:
+                        delivered = 0
                         for connection in self.active_connections.get(group_id, []):
-                            await connection.send_text(message["data"])
+                            sender = self.senders.get(connection)
+                            if sender and sender.enqueue(message["data"]):
+                                delivered += 1
+                        self.stats.record_out(group_id, delivered)
         except asyncio.CancelledError:
             logging.info(f"Listener for {channel} cancelled.")
         # `async with` automatically handles unsubscription.
 
+    def send_personal(self, websocket: WebSocket, message: str):
+        """Queues a frame for one socket only, behind any broadcasts already queued for it."""
+        sender = self.senders.get(websocket)
+        if sender:
+            sender.enqueue(message)
+
     async def publish_to_channel(self, message: str, group_id: int):
         """Publishes a message to the appropriate Redis channel."""
         await redis_client.publish(f"chat:{group_id}", message)
 
+    async def shutdown(self):
+        """Closes every socket on this server instance and stops its Redis listeners."""
+        tasks = list(self.listener_tasks.values())
+        self.listener_tasks.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for sender in self.senders.values():
+            sender.close()
+        self.senders.clear()
+
+        connections = [ws for sockets in self.active_connections.values() for ws in sockets]
+        self.active_connections.clear()
+        for websocket in connections:
+            try:
+                # 1001 "Going Away" tells clients to reconnect, landing on another worker.
+                await websocket.close(code=status.WS_1001_GOING_AWAY, reason="Server shutting down")
+            except Exception:
+                pass
+
+    def metrics(self) -> dict:
+        """Connection counts, fan-out sizes, queue depths and traffic for this worker."""
+        fanout = sorted(((len(sockets), group_id) for group_id, sockets in self.active_connections.items()), reverse=True)
+        depths = [sender.depth for sender in self.senders.values()]
+        return {
+            "connections": len(self.senders),
+            "groups": len(self.active_connections),
+            "listener_tasks": len(self.listener_tasks),
+            "largest_groups": [{"id": group_id, "connections": size} for size, group_id in fanout[:10]],
+            "queue_depth": {"total": sum(depths), "max": max(depths, default=0)},
+            **self.stats.as_dict(),
+        }
+
 chat_manager = ChatManager()
 
 router = APIRouter(
@@ -62,6 +122,112 @@ router = APIRouter(
     tags=["chat"]
 )
 
+CHAT_HISTORY_MAX_LIMIT = int(os.getenv("CHAT_HISTORY_MAX_LIMIT", "10000"))
+CONVERSATION_MEMBER_PREVIEW = int(os.getenv("CONVERSATION_MEMBER_PREVIEW", "3"))
+# Frames above this size get an ERROR frame, but only after they were received in full. What bounds
+# memory is uvicorn's --ws-max-size, set to the same value, which closes the socket (1009) on larger frames.
+WS_MAX_FRAME_BYTES = int(os.getenv("WS_MAX_FRAME_BYTES", "16384"))
+CHAT_MESSAGE_MAX_LENGTH = int(os.getenv("CHAT_MESSAGE_MAX_LENGTH", "4000"))
+CLIENT_ID_MAX_LENGTH = 64
+# How long a client message id is remembered, i.e. the window in which a retry is recognised.
+CHAT_DEDUP_SECONDS = int(os.getenv("CHAT_DEDUP_SECONDS", "300"))
+
+def _persist_message(db: Session, group_id: int, user: models.User, content: str) -> models.ChatMessage:
+    """Saves a chat message. Its group's preview is updated afterwards, by `previews.record_message`."""
+    now = datetime.now(timezone.utc)
+    new_message = models.ChatMessage(
+        content=content,
+        group_id=group_id,
+        user_id=user.id,
+        user=user,
+        timestamp=now
+    )
+    db.add(new_message)
+    db.commit()
+    db.refresh(new_message)
+    return new_message
+
+class InvalidFrame(Exception):
+    def __init__(self, code: str, detail: str):
+        self.code = code
+        self.detail = detail
+
+
+def _parse_frame(data: str) -> Dict:
+    """
+    Validates an incoming frame without touching the database or Redis.
+
+    Frames are JSON envelopes: {"type": "typing"} or
+    {"type": "message", "content": "...", "client_id": "..."}, where the optional
+    client_id makes retries idempotent. Plain text is still accepted as a message
+    without a client_id, for older clients.
+    """
+    # A str has at most 4 bytes per character, so most frames skip the encode.
+    if len(data) * 4 > WS_MAX_FRAME_BYTES and len(data.encode()) > WS_MAX_FRAME_BYTES:
+        raise InvalidFrame("frame_too_large", f"Frames are limited to {WS_MAX_FRAME_BYTES} bytes")
+
+    if data.startswith("{"):
+        try:
+            frame = json.loads(data)
+        except ValueError:
+            raise InvalidFrame("invalid_frame", "Frame is not valid JSON")
+        if not isinstance(frame, dict):
+            raise InvalidFrame("invalid_frame", "Frame must be a JSON object")
+    else:
+        frame = {"type": "message", "content": data}
+
+    frame_type = frame.get("type")
+    if frame_type == "typing":
+        return frame
+    if frame_type != "message":
+        raise InvalidFrame("invalid_frame", "Unknown frame type")
+
+    content = frame.get("content")
+    if not isinstance(content, str) or not content.strip():
+        raise InvalidFrame("invalid_message", "Message content must be a non-empty string")
+    if len(content) > CHAT_MESSAGE_MAX_LENGTH:
+        raise InvalidFrame("message_too_long", f"Messages are limited to {CHAT_MESSAGE_MAX_LENGTH} characters")
+
+    client_id = frame.get("client_id")
+    if client_id is not None and (not isinstance(client_id, str) or not 0 < len(client_id) <= CLIENT_ID_MAX_LENGTH):
+        raise InvalidFrame("invalid_frame", f"client_id must be a string of at most {CLIENT_ID_MAX_LENGTH} characters")
+    return {"type": "message", "content": content, "client_id": client_id}
+
+
+def _error_frame(code: str, **fields) -> str:
+    return json.dumps({"type": "ERROR", "code": code, **fields})
+
+
+async def _claim_client_id(user_id: int, client_id: str) -> Optional[str]:
+    """
+    Reserves a client message id for its first delivery.
+
+    Returns None when this is the first time the id is seen; otherwise the
+    stored value, which is the saved message's id or "pending" while the first
+    attempt is still being written. If Redis is unavailable the message is
+    treated as new.
+    """
+    key = f"chat:dedup:{user_id}:{client_id}"
+    try:
+        if await redis_client.set(key, "pending", nx=True, ex=CHAT_DEDUP_SECONDS):
+            return None
+        return await redis_client.get(key) or "pending"
+    except Exception as e:
+        logging.error(f"Failed to check client message id for user {user_id}: {e}")
+        return None
+
+
+async def _settle_client_id(user_id: int, client_id: str, message_id: Optional[int]):
+    """Stores the saved message's id for a claimed client id, or releases the claim so the client can retry."""
+    key = f"chat:dedup:{user_id}:{client_id}"
+    try:
+        if message_id is None:
+            await redis_client.delete(key)
+        else:
+            await redis_client.set(key, str(message_id), xx=True, ex=CHAT_DEDUP_SECONDS)
+    except Exception as e:
+        logging.error(f"Failed to record client message id for user {user_id}: {e}")
+
 # --- WebSocket Endpoint for Group Chat ---
 @router.websocket("/ws/{group_id}")
 async def websocket_endpoint(
@@ -74,36 +240,79 @@ async def websocket_endpoint(
     if not current_user:
         return
 
-    membership = db.query(models.Membership).filter(
-        models.Membership.group_id == group_id,
-        models.Membership.user_id == current_user.id
-    ).first()
-    if not membership:
+    if not await membership_cache.is_member(db, current_user.id, group_id):
         await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Not a member of this group")
         return
 
     await chat_manager.connect(websocket, group_id)
+    try:
+        await presence.connected(group_id, current_user.id)
+    except Exception as e:
+        logging.error(f"Failed to record presence for user {current_user.id} in group {group_id}: {e}")
     try:
         while True:
+            # Return the connection to the pool while the socket is idle.
+            db.close()
             data = await websocket.receive_text()
-            new_message = models.ChatMessage(
-                content=data,
-                group_id=group_id,
-                user_id=current_user.id,
-                user=current_user 
-            )
-            db.add(new_message)
-            db.commit()
-            db.refresh(new_message)
+            chat_manager.stats.messages_in.mark()
+            try:
+                frame = _parse_frame(data)
+            except InvalidFrame as e:
+                chat_manager.send_personal(websocket, _error_frame(e.code, detail=e.detail))
+                continue
+            if frame["type"] == "typing":
+                presence.typing(group_id, current_user.id)
+                continue
+
+            # Over-limit frames are dropped before any database or Redis write.
+            retry_after = await rate_limit.chat_user.hit(current_user.id)
+            if retry_after is None:
+                retry_after = await rate_limit.chat_group.hit(group_id)
+                if retry_after is not None:
+                    # The message is dropped, so it should not use up the sender's own budget.
+                    rate_limit.chat_user.refund(current_user.id)
+            if retry_after is not None:
+                chat_manager.send_personal(websocket, _error_frame(
+                    "rate_limited", retry_after=round(retry_after, 2), client_id=frame["client_id"]
+                ))
+                continue
+
+            client_id = frame["client_id"]
+            if client_id:
+                existing = await _claim_client_id(current_user.id, client_id)
+                if existing is not None:
+                    # A retry of a message already received: acknowledge it again instead of storing a copy.
+                    if existing != "pending":
+                        chat_manager.send_personal(websocket, json.dumps({"type": "ACK", "client_id": client_id, "id": int(existing)}))
+                    continue
+
+            try:
+                new_message = _persist_message(db, group_id, current_user, frame["content"])
+            except Exception:
+                if client_id:
+                    await _settle_client_id(current_user.id, client_id, None)
+                raise
+            if client_id:
+                await _settle_client_id(current_user.id, client_id, new_message.id)
+                chat_manager.send_personal(websocket, json.dumps({"type": "ACK", "client_id": client_id, "id": new_message.id}))
+            # Chat writes bypass the HTTP middleware, so pin the sender's history reads here.
+            await database.mark_recent_write(current_user.email)
 
             response_message_json = schemas.ChatMessageResponse.from_orm(new_message).json()
             await chat_manager.publish_to_channel(response_message_json, group_id)
+            await read_state.record_message(db, group_id, current_user.id, new_message.id)
+            await previews.record_message(new_message)
             
     except WebSocketDisconnect:
         chat_manager.disconnect(websocket, group_id)
     except Exception as e:
         logging.error(f"An error occurred in websocket for group {group_id}: {e}")
         chat_manager.disconnect(websocket, group_id)
+    finally:
+        try:
+            await presence.disconnected(group_id, current_user.id)
+        except Exception as e:
+            logging.error(f"Failed to clear presence for user {current_user.id} in group {group_id}: {e}")
 
 # --- Background Task Helper for Notifications ---
 async def publish_new_conversation_notification(target_user_id: int, current_user_id: int, group_payload: dict):
@@ -117,8 +326,17 @@ async def publish_new_conversation_notification(target_user_id: int, current_use
     await redis_client.publish(f"notifications:{current_user_id}", notification_json)
 
 # --- REST Endpoints for Chat Management ---
+def _find_dm_channel(db: Session, low_id: int, high_id: int):
+    """Looks up a DM by its canonical (min, max) user pair with a single index probe."""
+    return db.query(models.Group).options(
+        joinedload(models.Group.memberships).joinedload(models.Membership.user).selectinload(models.User.hobbies)
+    ).filter(
+        models.Group.dm_user_low_id == low_id,
+        models.Group.dm_user_high_id == high_id
+    ).first()
+
 @router.post("/dm/{target_user_id}", response_model=schemas.GroupResponse)
-def get_or_create_dm_channel(
+async def get_or_create_dm_channel(
     target_user_id: int,
     background_tasks: BackgroundTasks,
     db: Session = Depends(database.get_db),
@@ -128,43 +346,50 @@ def get_or_create_dm_channel(
     if target_user_id == current_user.id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cannot create a DM with yourself.")
         
-    Membership1 = aliased(models.Membership)
-    Membership2 = aliased(models.Membership)
-    existing_dm = db.query(models.Group).join(
-        Membership1, models.Group.id == Membership1.group_id
-    ).join(
-        Membership2, models.Group.id == Membership2.group_id
-    ).options(
-        joinedload(models.Group.memberships).joinedload(models.Membership.user)
-    ).filter(
-        models.Group.is_direct_message == True,
-        Membership1.user_id == current_user.id,
-        Membership2.user_id == target_user_id
-    ).first()
+    low_id, high_id = sorted((current_user.id, target_user_id))
+    existing_dm = await run_in_threadpool(_find_dm_channel, db, low_id, high_id)
     if existing_dm:
         return existing_dm
 
+    # Only creating a DM counts against the limit; opening an existing one is free.
+    await rate_limit.enforce(rate_limit.dm_user, current_user.id)
+    return await run_in_threadpool(_create_dm_channel, db, background_tasks, current_user, target_user_id, low_id, high_id)
+
+
+def _create_dm_channel(db: Session, background_tasks: BackgroundTasks, current_user: models.User,
+                       target_user_id: int, low_id: int, high_id: int):
     target_user = db.query(models.User).filter(models.User.id == target_user_id).first()
     if not target_user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Target user not found.")
 
-    new_dm_group = models.Group(
-        name=f"DM between {current_user.name} and {target_user.name}",
-        description=f"Direct message channel",
-        hobby="Direct Message",
-        is_direct_message=True,
-        creator_id=current_user.id
-    )
-    db.add(new_dm_group)
-    db.flush()
-    membership1 = models.Membership(user_id=current_user.id, group_id=new_dm_group.id)
-    membership2 = models.Membership(user_id=target_user.id, group_id=new_dm_group.id)
+    # Upsert on the pair key so concurrent requests cannot create duplicate DMs.
+    new_dm_group_id = db.execute(
+        database.dialect_insert(models.Group).values(
+            name=f"DM between {current_user.name} and {target_user.name}",
+            description=f"Direct message channel",
+            is_direct_message=True,
+            creator_id=current_user.id,
+            dm_user_low_id=low_id,
+            dm_user_high_id=high_id
+        ).on_conflict_do_nothing(
+            index_elements=["dm_user_low_id", "dm_user_high_id"]
+        ).returning(models.Group.id)
+    ).scalar()
+    if new_dm_group_id is None:
+        # Another request created this DM first; it also sends the notifications.
+        db.rollback()
+        return _find_dm_channel(db, low_id, high_id)
+
+    membership1 = models.Membership(user_id=current_user.id, group_id=new_dm_group_id)
+    membership2 = models.Membership(user_id=target_user.id, group_id=new_dm_group_id)
     db.add_all([membership1, membership2])
     db.commit()
+    background_tasks.add_task(membership_cache.add_memberships, current_user.id, [new_dm_group_id])
+    background_tasks.add_task(membership_cache.add_memberships, target_user.id, [new_dm_group_id])
 
     final_dm_group = db.query(models.Group).options(
-        joinedload(models.Group.memberships).joinedload(models.Membership.user)
-    ).filter(models.Group.id == new_dm_group.id).first()
+        joinedload(models.Group.memberships).joinedload(models.Membership.user).selectinload(models.User.hobbies)
+    ).filter(models.Group.id == new_dm_group_id).first()
 
     group_payload = json.loads(schemas.GroupResponse.from_orm(final_dm_group).json())
     background_tasks.add_task(
@@ -176,37 +401,238 @@ def get_or_create_dm_channel(
     
     return final_dm_group
 
-@router.get("/conversations", response_model=List[schemas.GroupResponse])
-def get_my_conversations(
+def _conversation_summaries(groups, previews, states) -> List[schemas.ConversationSummary]:
+    items = []
+    for group in groups:
+        members, member_count = previews.get(group.id, ([], 0))
+        unread_count, last_read_message_id = states.get(group.id, (0, None))
+        last_message = None
+        if group.last_message_id is not None:
+            last_message = schemas.MessagePreview(
+                id=group.last_message_id,
+                user_id=group.last_message_user_id,
+                content=group.last_message_preview or "",
+                timestamp=group.last_message_at
+            )
+        items.append(schemas.ConversationSummary(
+            id=group.id,
+            name=group.name,
+            is_direct_message=group.is_direct_message,
+            last_activity_at=group.last_activity_at,
+            last_message=last_message,
+            members=members,
+            member_count=member_count,
+            unread_count=unread_count,
+            last_read_message_id=last_read_message_id
+        ))
+    return items
+
+@router.get("/conversations", response_model=List[schemas.ConversationResponse])
+async def get_my_conversations(
+    view: Literal["full", "summary"] = "full",
     db: Session = Depends(database.get_db),
     current_user = Depends(get_current_user)
 ):
-    """Returns a list of all groups and DMs the current user is a member of."""
-    conversations = db.query(models.Group).join(
-        models.Membership, models.Group.id == models.Membership.group_id
-    ).options(
-        joinedload(models.Group.memberships).joinedload(models.Membership.user)
-    ).filter(
-        models.Membership.user_id == current_user.id
-    ).all()
-    
-    return conversations
+    """
+    Returns all groups and DMs the current user is a member of, with unread counts.
+
+    `view=summary` returns `ConversationSummary` items instead: most recently
+    active first, with the last message and the first few members by name
+    rather than every member's full profile.
+    """
+    if view == "summary":
+        def load_summaries():
+            groups = db.query(models.Group).join(
+                models.Membership, models.Group.id == models.Membership.group_id
+            ).filter(
+                models.Membership.user_id == current_user.id
+            ).order_by(models.Group.last_activity_at.desc(), models.Group.id.desc()).all()
+            return groups, serializers.member_previews(db, [group.id for group in groups], CONVERSATION_MEMBER_PREVIEW)
+
+        groups, previews = await run_in_threadpool(load_summaries)
+        try:
+            states = await read_state.get_read_state(db, current_user.id, [group.id for group in groups])
+        except Exception as e:
+            logging.error(f"Failed to load read state for user {current_user.id}: {e}")
+            states = {}
+        return serializers.model_response(
+            List[schemas.ConversationSummary], _conversation_summaries(groups, previews, states)
+        )
+
+    def load_conversations():
+        return db.query(models.Group).join(
+            models.Membership, models.Group.id == models.Membership.group_id
+        ).options(
+            joinedload(models.Group.memberships).joinedload(models.Membership.user).selectinload(models.User.hobbies)
+        ).filter(
+            models.Membership.user_id == current_user.id
+        ).all()
+
+    conversations = await run_in_threadpool(load_conversations)
+    try:
+        states = await read_state.get_read_state(db, current_user.id, [group.id for group in conversations])
+    except Exception as e:
+        logging.error(f"Failed to load read state for user {current_user.id}: {e}")
+        states = {}
+
+    results = []
+    for group in conversations:
+        unread_count, last_read_message_id = states.get(group.id, (0, None))
+        results.append(schemas.ConversationResponse.model_validate(group).model_copy(update={
+            "unread_count": unread_count,
+            "last_read_message_id": last_read_message_id
+        }))
+    return results
+
+def _encode_cursor(last_activity_at: datetime, group_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{last_activity_at.isoformat()}|{group_id}".encode()).decode()
+
+def _decode_cursor(cursor: str):
+    try:
+        activity, group_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(activity), int(group_id)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+@router.get("/conversations/recent", response_model=schemas.ConversationPage)
+async def get_recent_conversations(
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(database.get_read_db),
+    current_user = Depends(get_current_user)
+):
+    """
+    Returns the user's groups and DMs, most recently active first.
+
+    Pass the returned `next_cursor` back to fetch the following page. The
+    last-message preview is read from the group row itself, so a page costs
+    one query plus one query for its member summaries. That query finds the
+    user's memberships through their index and sorts those groups by
+    activity, so its cost grows with the user's membership count rather than
+    the page size. Previews and this order may lag the newest message by up
+    to `PREVIEW_UPDATE_INTERVAL_MS` (see `app.previews`).
+    """
+    position = _decode_cursor(cursor) if cursor else None
+
+    def load_page():
+        query = db.query(models.Group).join(
+            models.Membership, models.Group.id == models.Membership.group_id
+        ).filter(
+            models.Membership.user_id == current_user.id
+        )
+        if position:
+            query = query.filter(
+                tuple_(models.Group.last_activity_at, models.Group.id) < tuple_(*position)
+            )
+        groups = query.order_by(
+            models.Group.last_activity_at.desc(), models.Group.id.desc()
+        ).limit(limit + 1).all()
+        return groups, serializers.member_previews(db, [group.id for group in groups[:limit]], CONVERSATION_MEMBER_PREVIEW)
+
+    groups, previews = await run_in_threadpool(load_page)
+    has_more = len(groups) > limit
+    groups = groups[:limit]
+
+    try:
+        states = await read_state.get_read_state(db, current_user.id, [group.id for group in groups])
+    except Exception as e:
+        logging.error(f"Failed to load read state for user {current_user.id}: {e}")
+        states = {}
+
+    items = _conversation_summaries(groups, previews, states)
+    next_cursor = None
+    if has_more and groups:
+        next_cursor = _encode_cursor(groups[-1].last_activity_at, groups[-1].id)
+    return schemas.ConversationPage(items=items, next_cursor=next_cursor)
 
 @router.get("/{group_id}", response_model=List[schemas.ChatMessageResponse])
-def get_chat_history(
+async def get_chat_history(
     group_id: int,
-    db: Session = Depends(database.get_db),
+    limit: int = Query(50, ge=1, le=CHAT_HISTORY_MAX_LIMIT),
+    before: Optional[datetime] = None,
+    archived: bool = False,
+    format: Literal["json", "ndjson"] = "json",
+    db: Session = Depends(database.get_read_db),
     current_user = Depends(get_current_user)
 ):
-    """Gets the recent chat history for a specific group."""
-    membership = db.query(models.Membership).filter(
-        models.Membership.group_id == group_id,
-        models.Membership.user_id == current_user.id
-    ).first()
+    """
+    Gets the latest `limit` messages of a group sent before `before`, oldest first.
 
-    if not membership:
+    With `archived=true`, messages already moved out of the database by the
+    archive job fill the page once the database runs out. `format=ndjson`
+    streams the same messages one per line.
+    """
+    if not await membership_cache.is_member(db, current_user.id, group_id):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You are not a member of this group")
-    
-    history = db.query(models.ChatMessage).filter(models.ChatMessage.group_id==group_id).order_by(models.ChatMessage.timestamp.desc()).limit(50).all()
-    return history[::-1]
 
+    if format == "ndjson":
+        def archived_head():
+            """The archived messages that precede the database's part of the page."""
+            query = db.query(models.ChatMessage.timestamp).filter(models.ChatMessage.group_id == group_id)
+            if before is not None:
+                query = query.filter(models.ChatMessage.timestamp < before)
+            in_database = query.order_by(models.ChatMessage.id.desc()).limit(limit).all()
+            if len(in_database) >= limit:
+                return []
+            oldest = in_database[-1].timestamp if in_database else before
+            return archive.archived_messages(db, group_id, oldest, limit - len(in_database))
+
+        head = await run_in_threadpool(archived_head) if archived else []
+        return serializers.ndjson_response(
+            itertools.chain([head], serializers.message_batches(db, group_id, limit, before)),
+            schemas.ChatMessageResponse
+        )
+
+    def load_history():
+        # Authors are loaded up front; serialization runs on the event loop and must not lazy-load.
+        query = db.query(models.ChatMessage).options(
+            joinedload(models.ChatMessage.user).selectinload(models.User.hobbies)
+        ).filter(models.ChatMessage.group_id==group_id)
+        if before is not None:
+            query = query.filter(models.ChatMessage.timestamp < before)
+        history = query.order_by(models.ChatMessage.timestamp.desc()).limit(limit).all()
+        if archived and len(history) < limit:
+            oldest = history[-1].timestamp if history else before
+            return archive.archived_messages(db, group_id, oldest, limit - len(history)) + history[::-1]
+        return history[::-1]
+
+    return await run_in_threadpool(load_history)
+
+
+@router.get("/{group_id}/presence")
+async def get_group_presence(
+    group_id: int,
+    db: Session = Depends(database.get_read_db),
+    current_user = Depends(get_current_user)
+):
+    """Returns the IDs of group members currently connected to the group's chat."""
+    if not await membership_cache.is_member(db, current_user.id, group_id):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You are not a member of this group")
+
+    return {"group_id": group_id, "online": await presence.get_online_user_ids(group_id)}
+
+
+@router.post("/{group_id}/read")
+async def mark_conversation_read(
+    group_id: int,
+    receipt: schemas.ReadReceipt,
+    db: Session = Depends(database.get_db),
+    current_user = Depends(get_current_user)
+):
+    """Marks the group as read up to `message_id` and broadcasts a read receipt to its members."""
+    if not await membership_cache.is_member(db, current_user.id, group_id):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You are not a member of this group")
+
+    unread = await run_in_threadpool(read_state.unread_after, db, current_user.id, group_id, receipt.message_id)
+    if unread is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Message not found in this group")
+
+    if await read_state.mark_read(current_user.id, group_id, receipt.message_id, unread):
+        await chat_manager.publish_to_channel(json.dumps({
+            "type": "READ",
+            "group_id": group_id,
+            "user_id": current_user.id,
+            "message_id": receipt.message_id
+        }), group_id)
+
+    return {"group_id": group_id, "last_read_message_id": receipt.message_id}
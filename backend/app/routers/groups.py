@@ -1,11 +1,21 @@
-from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session, joinedload
-from typing import List
+from typing import List, Literal, Union
+import json
 import logging
+import os
 
-from app import models, schemas, database, security
+from app import models, schemas, database, security, es_client, membership_cache, serializers, deletion
 from app.routers.auth import get_current_user
-from app.es_client import es_client
+from app.redis_client import redis_client
+from app.jobs import recommendations
+
+RECOMMENDATION_CACHE_TTL_SECONDS = int(os.getenv("RECOMMENDATION_CACHE_TTL_SECONDS", "600"))
+
+GROUP_VIEWS = {"summary": schemas.GroupSummary, "compact": schemas.GroupCompact}
+# Any of the shapes `view=` selects.
+GroupView = Union[schemas.GroupResponse, schemas.GroupSummary, schemas.GroupCompact]
 
 router = APIRouter(
     prefix="/groups",
@@ -21,11 +31,7 @@ async def index_group(group: models.Group):
             "description": group.description,
             "hobby": group.hobby
         }
-        await es_client.index(
-            index="groups",
-            id=group.id,
-            document=doc
-        )
+        await es_client.index_document("groups", group.id, doc)
         logging.info(f"Successfully indexed group {group.id}")
     except Exception as e:
         logging.error(f"Failed to index group {group.id}: {e}")
@@ -40,8 +46,8 @@ def create_group(group: schemas.GroupCreate,
     if existing_group:
         raise HTTPException(status_code=400, detail="Group with this name already exists")
     
-    user_hobby_names = [h.name for h in current_user.hobbies]
-    if group.hobby not in user_hobby_names:
+    hobby = next((h for h in current_user.hobbies if h.name == group.hobby), None)
+    if hobby is None:
         raise HTTPException(
             status_code=403, 
             detail=f"You cannot create a group for a hobby you don't have"
@@ -50,7 +56,7 @@ def create_group(group: schemas.GroupCreate,
     new_group = models.Group(
         name=group.name,
         description=group.description,
-        hobby=group.hobby,
+        hobby_id=hobby.id,
         creator_id=current_user.id
     )
     db.add(new_group)
@@ -66,24 +72,92 @@ def create_group(group: schemas.GroupCreate,
     db.refresh(new_group)
 
     background_tasks.add_task(index_group, new_group)
+    background_tasks.add_task(membership_cache.add_memberships, current_user.id, [new_group.id])
 
     return new_group
 
 
-@router.get("/{group_id}", response_model=schemas.GroupResponse)
-def get_group(group_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(get_current_user)):
-    group = db.query(models.Group).filter(models.Group.id == group_id).first()
+@router.get("/recommendations", response_model=List[schemas.GroupRecommendation])
+async def get_recommended_groups(
+    db: Session = Depends(database.get_read_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Public groups recommended for the current user, precomputed offline and served from cache."""
+    items = None
+    try:
+        version = await redis_client.get(recommendations.VERSION_KEY) or 0
+        key = recommendations.cache_key(version, current_user.id)
+        cached = await redis_client.get(key)
+        if cached is not None:
+            items = json.loads(cached)
+    except Exception as e:
+        logging.error(f"Failed to read cached recommendations for user {current_user.id}: {e}")
+        key = None
+
+    if items is None:
+        items = await run_in_threadpool(recommendations.load_recommendations, db, current_user)
+        if key:
+            try:
+                await redis_client.set(key, json.dumps(items), ex=RECOMMENDATION_CACHE_TTL_SECONDS)
+            except Exception as e:
+                logging.error(f"Failed to cache recommendations for user {current_user.id}: {e}")
+
+    # Drop groups the user joined after the recommendations were computed or cached.
+    joined = await membership_cache.get_group_ids(db, current_user.id)
+    return [item for item in items if item["id"] not in joined]
+
+
+@router.get("/{group_id}", response_model=GroupView)
+def get_group(group_id: int,
+              view: Literal["full", "summary", "compact"] = "full",
+              db: Session = Depends(database.get_read_db),
+              current_user: models.User = Depends(get_current_user)):
+    """Returns one group. `view=summary` or `view=compact` return `GroupSummary` or `GroupCompact`."""
+    if view != "full":
+        rows = serializers.group_views(db, view, models.Group.id == group_id)
+        if not rows:
+            raise HTTPException(status_code=404, detail="Group not found")
+        return serializers.model_response(GROUP_VIEWS[view], rows[0])
+
+    group = db.query(models.Group).options(
+        joinedload(models.Group.memberships).joinedload(models.Membership.user).selectinload(models.User.hobbies)
+    ).filter(models.Group.id == group_id).first()
     if not group:
         raise HTTPException(status_code=404, detail="Group not found")
     return group
 
 
-@router.get("/", response_model=List[schemas.GroupResponse])
+@router.get("/", response_model=List[GroupView])
 def list_groups(
-    db: Session = Depends(database.get_db),
+    view: Literal["full", "summary", "compact"] = "full",
+    format: Literal["json", "ndjson"] = "json",
+    db: Session = Depends(database.get_read_db),
     current_user = Depends(get_current_user)
 ):
-    options = joinedload(models.Group.memberships).joinedload(models.Membership.user)
+    """
+    Lists public groups with every member's profile.
+
+    `view=summary` lists `GroupSummary` items (a few members by name plus a
+    member count) and `view=compact` lists `GroupCompact` items (no members).
+    `format=ndjson` writes one group per line in any view. The full shape is
+    streamed from a server-side cursor; the slim views are small enough to be
+    loaded at once.
+    """
+    if view != "full":
+        rows = serializers.group_views(db, view, models.Group.is_direct_message == False)
+        if format == "ndjson":
+            return serializers.ndjson_response(iter([rows]), GROUP_VIEWS[view])
+        return serializers.model_response(List[GROUP_VIEWS[view]], rows)
+
+    if format == "ndjson":
+        return serializers.ndjson_response(
+            serializers.group_batches(db, models.Group.is_direct_message == False), schemas.GroupResponse
+        )
+
+    if serializers.FAST_RESPONSES:
+        return serializers.FastJSONResponse(serializers.group_rows(db, models.Group.is_direct_message == False))
+
+    options = joinedload(models.Group.memberships).joinedload(models.Membership.user).selectinload(models.User.hobbies)
 
     public_groups = db.query(models.Group).options(options).filter(
         models.Group.is_direct_message == False
@@ -131,3 +205,23 @@ def update_group(group_id: int,
     background_tasks.add_task(index_group, group)
     
     return group
+
+
+@router.delete("/{group_id}", response_model=schemas.DeletionJob, status_code=status.HTTP_202_ACCEPTED)
+async def delete_group(group_id: int,
+                       background_tasks: BackgroundTasks,
+                       db: Session = Depends(database.get_db),
+                       current_user: models.User = Depends(get_current_user)):
+    """Schedules the deletion of a group with its posts, messages and memberships; see app.deletion."""
+    group = await run_in_threadpool(
+        lambda: db.query(models.Group.creator_id).filter(models.Group.id == group_id).first()
+    )
+    if group is None:
+        raise HTTPException(status_code=404, detail="Group not found")
+
+    if group.creator_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Only group creator is allowed to delete the group")
+
+    job_id = await deletion.start("group", group_id, current_user.id)
+    background_tasks.add_task(deletion.run, job_id)
+    return {"job_id": job_id, "status": "pending"}
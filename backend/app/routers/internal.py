@@ -0,0 +1,59 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from typing import Optional
+import os
+from dotenv import load_dotenv
+
+from app import database, redis_client, es_client, deletion
+from app.routers import chat, notifications
+
+load_dotenv()
+
+INTERNAL_API_TOKEN = os.getenv("INTERNAL_API_TOKEN")
+
+
+def require_internal_token(x_internal_token: Optional[str] = Header(None)):
+    """Internal endpoints are open in development and guarded by a shared token when one is configured."""
+    if INTERNAL_API_TOKEN and x_internal_token != INTERNAL_API_TOKEN:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid internal token")
+
+
+router = APIRouter(
+    prefix="/internal",
+    tags=["internal"],
+    dependencies=[Depends(require_internal_token)]
+)
+
+
+@router.get("/pools")
+def get_pool_status():
+    """Connection pool usage for this worker process."""
+    return {
+        "pid": os.getpid(),
+        "database": database.pool_status(),
+        "replicas": [
+            {**database.pool_status(replica_engine), "lag_seconds": database.replica_lag[i]}
+            for i, replica_engine in enumerate(database.replica_engines)
+        ],
+        "redis": redis_client.pool_status(),
+        "elasticsearch": es_client.pool_status(),
+    }
+
+
+@router.get("/metrics")
+async def get_websocket_metrics():
+    """WebSocket connections, fan-out, queue depths and message rates for this worker process."""
+    # Runs on the event loop, which owns the managers' state.
+    return {
+        "pid": os.getpid(),
+        "chat": chat.chat_manager.metrics(),
+        "notifications": notifications.notification_manager.metrics(),
+    }
+
+
+@router.get("/deletions/{job_id}")
+async def get_deletion_status(job_id: str):
+    """Status of a user or group deletion, with the number of rows removed so far per table."""
+    job = await deletion.get_status(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Deletion job not found")
+    return {"job_id": job_id, **job}
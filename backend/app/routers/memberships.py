@@ -1,7 +1,9 @@
-from fastapi import APIRouter, HTTPException, Depends, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, HTTPException, Depends, status, BackgroundTasks
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload, selectinload
+from typing import Literal, Union
 
-from app import models, schemas, database
+from app import models, schemas, database, membership_cache, crud, serializers
 from app.routers.auth import get_current_user
 
 router = APIRouter(
@@ -12,6 +14,7 @@ router = APIRouter(
 
 @router.post("/join", response_model=schemas.MembershipResponse)
 def join_group(group_id: int, 
+               background_tasks: BackgroundTasks,
                db: Session = Depends(database.get_db), 
                current_user: models.User = Depends(get_current_user)):
     
@@ -19,50 +22,92 @@ def join_group(group_id: int,
     if not group:
         raise HTTPException(status_code=404, detail="Group not found")
 
-    existing = db.query(models.Membership).filter_by(user_id=current_user.id, group_id=group_id).first()
-    if existing:
-        raise HTTPException(status_code=400, detail="Already a member of this group")
-
-    user_hobby_names = [h.name for h in current_user.hobbies]
-    if group.hobby not in user_hobby_names:
+    if group.hobby_id not in current_user.hobby_ids:
         raise HTTPException(
             status_code=403,
             detail=f"You cannot join this group as it requires hobby '{group.hobby}'"
         )
 
+    # The unique constraint detects existing memberships without a separate lookup.
     membership = models.Membership(user_id=current_user.id, group_id=group_id)
     db.add(membership)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Already a member of this group")
     db.refresh(membership)
+
+    background_tasks.add_task(membership_cache.add_memberships, current_user.id, [group_id])
     return membership
 
 
+@router.post("/join-bulk", response_model=list[schemas.BulkMembershipResult])
+def join_groups(request: schemas.BulkJoinRequest,
+                background_tasks: BackgroundTasks,
+                db: Session = Depends(database.get_db),
+                current_user: models.User = Depends(get_current_user)):
+    """Joins many groups in one request and reports the outcome for each group."""
+    results = crud.join_groups(db, current_user, request.group_ids)
+    db.commit()
+
+    joined = [result.group_id for result in results if result.status == "joined"]
+    background_tasks.add_task(membership_cache.add_memberships, current_user.id, joined)
+    return results
+
+
 @router.post("/leave")
 def leave_group(group_id: int, 
+                background_tasks: BackgroundTasks,
                 db: Session = Depends(database.get_db), 
                 current_user: models.User = Depends(get_current_user)):
     
-    membership = db.query(models.Membership).filter_by(user_id=current_user.id, group_id=group_id).first()
-    if not membership:
+    deleted = db.query(models.Membership).filter_by(user_id=current_user.id, group_id=group_id).delete()
+    if not deleted:
         raise HTTPException(status_code=400, detail="Not a member of this group")
     
-    db.delete(membership)
     db.commit()
+
+    background_tasks.add_task(membership_cache.remove_memberships, current_user.id, [group_id])
     return {"detail": "Left the group successfully"}
 
 
-@router.get("/group/{group_id}/members", response_model=list[schemas.UserResponse])
-def get_group_members(group_id: int, db: Session = Depends(database.get_db)):
-    group = db.query(models.Group).filter(models.Group.id == group_id).first()
+@router.get("/group/{group_id}/members", response_model=list[Union[schemas.UserResponse, schemas.MemberRef]])
+def get_group_members(group_id: int,
+                      view: Literal["full", "ref"] = "full",
+                      db: Session = Depends(database.get_read_db)):
+    """Lists a group's members. `view=ref` returns only `MemberRef` (id and name) for each."""
+    group = db.query(models.Group.id).filter(models.Group.id == group_id).first()
     if not group:
         raise HTTPException(status_code=404, detail="Group not found")
-    
-    members = [membership.user for membership in group.memberships]
+
+    if view == "ref":
+        return serializers.model_response(list[schemas.MemberRef], serializers.member_refs(db, group_id))
+
+    members = db.query(models.User).join(
+        models.Membership, models.Membership.user_id == models.User.id
+    ).options(
+        selectinload(models.User.hobbies), selectinload(models.User.memberships)
+    ).filter(models.Membership.group_id == group_id).order_by(models.Membership.id).all()
     return members
 
 
-@router.get("/my-groups", response_model=list[schemas.GroupResponse])
-def get_my_groups(db: Session = Depends(database.get_db), current_user: models.User = Depends(get_current_user)):
-    memberships = db.query(models.Membership).filter_by(user_id=current_user.id).all()
-    groups = [membership.group for membership in memberships]
+@router.get("/my-groups", response_model=list[Union[schemas.GroupResponse, schemas.GroupSummary, schemas.GroupCompact]])
+def get_my_groups(view: Literal["full", "summary", "compact"] = "full",
+                  db: Session = Depends(database.get_db),
+                  current_user: models.User = Depends(get_current_user)):
+    """Lists the caller's groups. `view=summary` or `view=compact` return `GroupSummary` or `GroupCompact` items."""
+    if view != "full":
+        query = db.query(models.Group).join(
+            models.Membership, models.Membership.group_id == models.Group.id
+        ).filter(models.Membership.user_id == current_user.id)
+        rows = serializers.group_views(db, view, query=query)
+        response_type = schemas.GroupSummary if view == "summary" else schemas.GroupCompact
+        return serializers.model_response(list[response_type], rows)
+
+    groups = db.query(models.Group).join(
+        models.Membership, models.Membership.group_id == models.Group.id
+    ).options(
+        joinedload(models.Group.memberships).joinedload(models.Membership.user).selectinload(models.User.hobbies)
+    ).filter(models.Membership.user_id == current_user.id).order_by(models.Membership.id).all()
     return groups
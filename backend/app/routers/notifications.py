@@ -1,10 +1,12 @@
-from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect, status
 from sqlalchemy.orm import Session
 from typing import Dict
 import logging
 import asyncio
 
 from app import database, models
+from app.metrics import SocketStats
+from app.socket_sender import QueuedSender
 from ..redis_client import redis_client
 from .auth import get_current_user_ws
 
@@ -12,20 +14,30 @@ from .auth import get_current_user_ws
 class NotificationManager:
     def __init__(self):
         self.active_connections: Dict[int, WebSocket] = {}
+        self.senders: Dict[int, QueuedSender] = {}
         self.listener_tasks: Dict[int, asyncio.Task] = {}
+        self.stats = SocketStats()
 
     async def connect(self, websocket: WebSocket, user_id: int):
         await websocket.accept()
         # If the user already has a connection open (e.g., in another tab), close the old one.
         if user_id in self.active_connections:
             await self.active_connections[user_id].close(code=1008, reason="New connection established")
+            old_sender = self.senders.pop(user_id, None)
+            if old_sender:
+                old_sender.close()
 
         self.active_connections[user_id] = websocket
+        self.senders[user_id] = QueuedSender(websocket, self.stats)
         if user_id not in self.listener_tasks:
             self.listener_tasks[user_id] = asyncio.create_task(self._redis_listener(user_id))
 
     def disconnect(self, user_id: int):
         self.active_connections.pop(user_id, None)
+        sender = self.senders.pop(user_id, None)
+        if sender:
+            sender.close()
+        self.stats.forget(user_id)
         task = self.listener_tasks.pop(user_id, None)
         if task:
             task.cancel()
@@ -39,12 +51,41 @@ class NotificationManager:
                 while True:
                     message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=None)
                     if message:
-                        if user_id in self.active_connections:
-                            await self.active_connections[user_id].send_text(message["data"])
+                        sender = self.senders.get(user_id)
+                        if sender and sender.enqueue(message["data"]):
+                            self.stats.record_out(user_id, 1)
         except asyncio.CancelledError:
             logging.info(f"Notification listener for {channel} cancelled.")
-        
-    
+
+    async def shutdown(self):
+        """Closes every socket on this server instance and stops its Redis listeners."""
+        tasks = list(self.listener_tasks.values())
+        self.listener_tasks.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for sender in self.senders.values():
+            sender.close()
+        self.senders.clear()
+
+        connections = list(self.active_connections.values())
+        self.active_connections.clear()
+        for websocket in connections:
+            try:
+                await websocket.close(code=status.WS_1001_GOING_AWAY, reason="Server shutting down")
+            except Exception:
+                pass
+
+    def metrics(self) -> dict:
+        """Connection counts, queue depths and traffic for this worker."""
+        depths = [sender.depth for sender in self.senders.values()]
+        return {
+            "connections": len(self.active_connections),
+            "listener_tasks": len(self.listener_tasks),
+            "queue_depth": {"total": sum(depths), "max": max(depths, default=0)},
+            **self.stats.as_dict(),
+        }
+
 notification_manager = NotificationManager()
 
 router = APIRouter(
@@ -66,5 +107,6 @@ async def websocket_notification_endpoint(
     try:
         while True:
             await websocket.receive_text()
+            notification_manager.stats.messages_in.mark()
     except WebSocketDisconnect:
         notification_manager.disconnect(user_id)
\ No newline at end of file
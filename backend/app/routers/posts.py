@@ -1,13 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
-from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy.orm import Session, joinedload
+from typing import List, Literal
+import itertools
 import json
 import logging
 
-from app import models, schemas, security, database
+from app import models, schemas, security, database, es_client, membership_cache, serializers, rate_limit, archive
 from app.routers.auth import get_current_user
 from ..redis_client import redis_client
-from app.es_client import es_client
 
 router = APIRouter(
     prefix="/groups/{group_id}/posts",
@@ -22,11 +22,7 @@ async def index_post(post: models.Post):
             "content": post.content,
             "group_id": post.group_id
         }
-        await es_client.index(
-            index="posts",
-            id=post.id,
-            document=doc
-        )
+        await es_client.index_document("posts", post.id, doc)
         logging.info(f"Successfully indexed post {post.id}")
     except Exception as e:
         logging.error(f"Failed to index post {post.id}: {e}")
@@ -40,15 +36,13 @@ async def create_post_in_group(
     db: Session = Depends(database.get_db),
     current_user: models.User = Depends(get_current_user)
 ):
+    await rate_limit.enforce(rate_limit.post_user, current_user.id)
+
     group = db.query(models.Group).filter(models.Group.id == group_id).first()
     if not group:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Group not found")
     
-    membership = db.query(models.Membership).filter(
-        models.Membership.group_id == group_id,
-        models.Membership.user_id == current_user.id
-        ).first()
-    if not membership:
+    if not await membership_cache.is_member(db, current_user.id, group_id):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You must be a member of this group to create a post")
     
     new_post = models.Post(
@@ -86,13 +80,29 @@ async def create_post_in_group(
 @router.get("/", response_model=List[schemas.PostResponse])
 def get_posts_for_group(
     group_id: int,
-    db: Session = Depends(database.get_db),
+    archived: bool = False,
+    format: Literal["json", "ndjson"] = "json",
+    db: Session = Depends(database.get_read_db),
     current_user: models.User = Depends(get_current_user)
 ):
     group = db.query(models.Group).filter(models.Group.id == group_id).first()
     if not group:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Group not found")
+
+    # Archived posts are all older than the ones still in the database.
+    older = archive.archived_posts(db, group_id) if archived else []
+
+    # NDJSON streams the posts from a server-side cursor instead of building the whole list.
+    if format == "ndjson":
+        return serializers.ndjson_response(
+            itertools.chain([older], serializers.post_batches(db, group_id)), schemas.PostResponse
+        )
+
+    if serializers.FAST_RESPONSES:
+        return serializers.FastJSONResponse(older + serializers.post_rows(db, group_id))
     
-    posts = db.query(models.Post).filter(models.Post.group_id == group_id).all()
+    posts = db.query(models.Post).options(
+        joinedload(models.Post.owner).selectinload(models.User.hobbies)
+    ).filter(models.Post.group_id == group_id).order_by(models.Post.id).all()
 
-    return posts
\ No newline at end of file
+    return older + posts
\ No newline at end of file
@@ -1,26 +1,136 @@
-from fastapi import APIRouter, Depends
-from typing import List, Dict, Any
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session, selectinload
+from typing import List, Dict, Any, Optional
+import os
 
-from ..es_client import es_client
+from ..es_client import get_es_client
 from .auth import get_current_user
-from .. import models
+from .. import models, database, search_cache
+
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "10"))
 
 router = APIRouter(
     prefix="/search",
     tags=["search"]
 )
 
+
+def _hit_ids(hits: List[dict], index: str) -> List[int]:
+    """Returns the integer document IDs for one index, keeping Elasticsearch's ranking order."""
+    ids = []
+    for hit in hits:
+        if hit["_index"] == index:
+            try:
+                ids.append(int(hit["_id"]))
+            except (TypeError, ValueError):
+                continue
+    return ids
+
+
+def _hydrate_users(db: Session, ids: List[int]) -> List[dict]:
+    if not ids:
+        return []
+    users = db.query(models.User).options(
+        selectinload(models.User.hobbies)
+    ).filter(models.User.id.in_(ids)).all()
+    by_id = {
+        user.id: {
+            "id": user.id,
+            "name": user.name,
+            "hobbies": [hobby.name for hobby in user.hobbies]
+        }
+        for user in users
+    }
+    return [by_id[i] for i in ids if i in by_id]
+
+
+def _hydrate_groups(db: Session, ids: List[int]) -> List[dict]:
+    if not ids:
+        return []
+    # DM groups are never search results, even for their own members.
+    groups = db.query(models.Group).filter(
+        models.Group.id.in_(ids),
+        models.Group.is_direct_message == False
+    ).all()
+    by_id = {
+        group.id: {
+            "id": group.id,
+            "name": group.name,
+            "description": group.description,
+            "hobby": group.hobby
+        }
+        for group in groups
+    }
+    return [by_id[i] for i in ids if i in by_id]
+
+
+def _hydrate_posts(db: Session, ids: List[int], user_id: int) -> List[dict]:
+    if not ids:
+        return []
+    # A single query loads the posts and whether the caller may see their group.
+    posts = db.query(models.Post).join(
+        models.Group, models.Post.group_id == models.Group.id
+    ).outerjoin(
+        models.Membership,
+        and_(
+            models.Membership.group_id == models.Post.group_id,
+            models.Membership.user_id == user_id
+        )
+    ).filter(
+        models.Post.id.in_(ids),
+        # DM groups are only visible to their members; every other group is public.
+        or_(models.Group.is_direct_message == False, models.Membership.id.isnot(None))
+    ).all()
+    by_id = {
+        post.id: {
+            "id": post.id,
+            "title": post.title,
+            "content": post.content,
+            "group_id": post.group_id
+        }
+        for post in posts
+    }
+    return [by_id[i] for i in ids if i in by_id]
+
+
+def hydrate_hits(db: Session, hits: List[dict], current_user: models.User) -> Dict[str, List[Any]]:
+    """
+    Replaces raw Elasticsearch hits with current database rows.
+
+    Each index is resolved with one `IN` query, so hits that were deleted since
+    they were indexed, or that the caller is not allowed to see, are dropped
+    without a query per hit.
+    """
+    return {
+        "users": _hydrate_users(db, _hit_ids(hits, "users")),
+        "groups": _hydrate_groups(db, _hit_ids(hits, "groups")),
+        "posts": _hydrate_posts(db, _hit_ids(hits, "posts"), current_user.id)
+    }
+
+
 @router.get("/", response_model=Dict[str, List[Any]])
 async def unified_search(
     q: str,
+    type: Optional[str] = None,
+    page: int = Query(1, ge=1),
+    db: Session = Depends(database.get_db),
     current_user: models.User = Depends(get_current_user)
 ):
     """
     Performs a unified search across users, groups, and posts in Elasticsearch.
+    Pass `type` to restrict the search to a single index.
     """
+    if type is not None and type not in search_cache.SEARCH_INDICES:
+        raise HTTPException(status_code=400, detail=f"Unknown search type '{type}'")
+
+    q = search_cache.normalize_query(q)
     if not q:
         return {"users": [], "groups": [], "posts": []}
 
+    indices = [type] if type else list(search_cache.SEARCH_INDICES)
+
     # Define the Elasticsearch query. This "multi_match" query is powerful because
     # it can search for the same text across multiple fields with different weights.
     query = {
@@ -37,32 +147,20 @@ async def unified_search(
         }
     }
 
-    # Perform the search across all three indices at once.
-    response = await es_client.search(
-        index=["users", "groups", "posts"],
-        query=query,
-        ignore_unavailable=True
-    )
-
-    # Process the results from Elasticsearch
-    results = {
-        "users": [],
-        "groups": [],
-        "posts": []
-    }
-    
-    for hit in response["hits"]["hits"]:
-        doc = hit["_source"]
-        doc_type = hit["_index"]
-        
-        # Add the document ID to the response
-        doc['id'] = hit['_id']
-
-        if doc_type == "users":
-            results["users"].append(doc)
-        elif doc_type == "groups":
-            results["groups"].append(doc)
-        elif doc_type == "posts":
-            results["posts"].append(doc)
-
-    return results
+    async def search():
+        # Only the IDs are needed, since every hit is re-read from the database below.
+        response = await get_es_client().search(
+            index=indices,
+            query=query,
+            source=False,
+            from_=(page - 1) * SEARCH_PAGE_SIZE,
+            size=SEARCH_PAGE_SIZE,
+            ignore_unavailable=True
+        )
+        return response["hits"]["hits"]
+
+    # Hot queries are served from the cache until a write bumps one of the indices.
+    hits = await search_cache.cached_search(indices, q, page, search)
+
+    # Hydration is blocking database work, so keep it off the event loop.
+    return await run_in_threadpool(hydrate_hits, db, hits, current_user)
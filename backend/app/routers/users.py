@@ -1,11 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, status
+from sqlalchemy.orm import Session, selectinload
 from typing import List
 import logging
 
-from app import models, schemas, database, security
+from app import models, schemas, database, security, es_client, membership_cache, crud, deletion
 from app.routers.auth import get_current_user
-from app.es_client import es_client
 
 router = APIRouter(
     prefix="/users",
@@ -28,11 +27,7 @@ async def index_user(user_id: int):
             "email": user.email,
             "hobbies": [hobby.name for hobby in user.hobbies]
         }
-        await es_client.index(
-            index="users",
-            id=user.id,
-            document=doc
-        )
+        await es_client.index_document("users", user.id, doc)
         logging.info(f"Successfully indexed user {user.id}")
     except Exception as e:
         logging.error(f"Failed to index user {user_id}: {e}")
@@ -46,6 +41,17 @@ def get_my_profile(db: Session = Depends(database.get_db), current_user: models.
     return current_user
 
 
+@router.delete("/me", response_model=schemas.DeletionJob, status_code=status.HTTP_202_ACCEPTED)
+async def delete_my_account(
+    background_tasks: BackgroundTasks,
+    current_user: models.User = Depends(get_current_user)
+):
+    """Schedules the deletion of the current user and everything they posted; see app.deletion."""
+    job_id = await deletion.start("user", current_user.id, current_user.id)
+    background_tasks.add_task(deletion.run, job_id)
+    return {"job_id": job_id, "status": "pending"}
+
+
 @router.get("/search", response_model=List[schemas.UserPublic])
 def search_users(
     query: str,
@@ -55,7 +61,7 @@ def search_users(
     if not query:
         return []
 
-    found_users = db.query(models.User).filter(
+    found_users = db.query(models.User).options(selectinload(models.User.hobbies)).filter(
         models.User.name.ilike(f"%{query}%"),
         models.User.id != current_user.id
     ).limit(10).all()
@@ -64,7 +70,7 @@ def search_users(
 
 
 @router.get("/{user_id}", response_model=schemas.UserPublic)
-def get_user(user_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(get_current_user)):
+def get_user(user_id: int, db: Session = Depends(database.get_read_db), current_user: models.User = Depends(get_current_user)):
     user = db.query(models.User).filter(models.User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -92,50 +98,44 @@ def update_user(
         user.hashed_password = security.hash_password(user_update.password)
 
     if user_update.hobbies is not None:
-        current_hobby_names = {h.name for h in user.hobbies}
-        new_hobby_names = set(user_update.hobbies)
-        removed_hobbies = current_hobby_names - new_hobby_names
+        current_hobbies = {h.id: h for h in user.hobbies}
+        new_hobbies = crud.resolve_hobbies(db, user_update.hobbies)
+        removed_hobby_ids = set(current_hobbies) - {h.id for h in new_hobbies}
 
         # Identify hobbies that can't be removed because the user is a creator
-        protected_hobbies = set(
-            db.query(models.Group.hobby)
+        protected_hobby_ids = {
+            row[0]
+            for row in db.query(models.Group.hobby_id)
             .filter(
                 models.Group.creator_id == user.id,
                 models.Group.is_direct_message == False
             )
+            .distinct()
             .all()
-        )
-        # The query returns list of tuples, so convert
-        protected_hobbies = {h[0] for h in protected_hobbies}
+        }
 
         # Filter out protected hobbies
-        hobbies_to_remove = removed_hobbies - protected_hobbies
+        hobby_ids_to_remove = removed_hobby_ids - protected_hobby_ids
 
-        if hobbies_to_remove:
+        if hobby_ids_to_remove:
             memberships_to_remove = (
                 db.query(models.Membership)
                 .join(models.Group)
                 .filter(
                     models.Membership.user_id == user.id,
-                    models.Group.hobby.in_(hobbies_to_remove)
+                    models.Group.hobby_id.in_(hobby_ids_to_remove)
                 )
                 .all()
             )
             for membership in memberships_to_remove:
                 db.delete(membership)
+            removed_group_ids = [membership.group_id for membership in memberships_to_remove]
+            background_tasks.add_task(membership_cache.remove_memberships, user.id, removed_group_ids)
 
         # Determine final hobby list (keep protected + new ones)
-        final_hobbies = new_hobby_names | protected_hobbies
-
-        # Clear and re-add hobbies
-        user.hobbies.clear()
-        for hobby_name in final_hobbies:
-            hobby = db.query(models.Hobby).filter(models.Hobby.name == hobby_name).first()
-            if not hobby:
-                hobby = models.Hobby(name=hobby_name)
-                db.add(hobby)
-                db.flush()
-            user.hobbies.append(hobby)
+        user.hobbies = new_hobbies + [
+            current_hobbies[hobby_id] for hobby_id in removed_hobby_ids & protected_hobby_ids
+        ]
 
     db.commit()
     db.refresh(user)
@@ -143,3 +143,26 @@ def update_user(
     background_tasks.add_task(index_user, user.id)
 
     return user
+
+
+@router.post("/me/hobbies", response_model=schemas.UserResponse)
+def add_hobbies(
+    request: schemas.HobbyBulkAdd,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Adds several hobbies to the current user at once, creating any that don't exist yet."""
+    hobbies = crud.resolve_hobbies(db, request.hobbies)
+    if hobbies:
+        db.execute(
+            database.dialect_insert(models.user_hobbies)
+            .values([{"user_id": current_user.id, "hobby_id": hobby.id} for hobby in hobbies])
+            .on_conflict_do_nothing(index_elements=["user_id", "hobby_id"])
+        )
+    db.commit()
+    user = db.query(models.User).filter(models.User.id == current_user.id).first()
+
+    background_tasks.add_task(index_user, user.id)
+
+    return user
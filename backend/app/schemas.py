@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr
-from typing import List, Optional
+from pydantic import BaseModel, EmailStr, Field
+from typing import List, Optional, Literal
 from datetime import datetime
 
 class LoginRequest(BaseModel):
@@ -37,6 +37,10 @@ class UserUpdate(BaseModel):
         from_attributes = True
 
 
+class HobbyBulkAdd(BaseModel):
+    hobbies: List[str] = Field(..., max_length=100)
+
+
 class UserResponse(BaseModel):
     id: int
     name: str
@@ -70,9 +74,17 @@ class GroupUpdate(BaseModel):
     description: Optional[str] = None
     creator_id: Optional[int] = None
 
+class GroupRecommendation(BaseModel):
+    id: int
+    name: str
+    description: Optional[str] = ""
+    hobby: str
+    score: float
+
 class GroupResponse(GroupBase):
     id: int
-    creator_id: int
+    # NULL once the creator's account is deleted and no member was left to take the group over.
+    creator_id: Optional[int] = None
     created_at: datetime
     is_direct_message: bool
     members: List[UserPublic]
@@ -81,6 +93,51 @@ class GroupResponse(GroupBase):
         from_attributes = True
 
 
+class ConversationResponse(GroupResponse):
+    unread_count: int = 0
+    last_read_message_id: Optional[int] = None
+
+
+class MemberRef(BaseModel):
+    id: int
+    name: str
+
+class GroupCompact(BaseModel):
+    id: int
+    name: str
+    hobby: str
+    member_count: int
+
+class GroupSummary(GroupCompact):
+    description: Optional[str] = ""
+    creator_id: Optional[int] = None
+    created_at: datetime
+    is_direct_message: bool
+    # The first few members only; `member_count` has the total.
+    members: List[MemberRef]
+
+class MessagePreview(BaseModel):
+    id: int
+    user_id: Optional[int] = None
+    content: str
+    timestamp: datetime
+
+class ConversationSummary(BaseModel):
+    id: int
+    name: str
+    is_direct_message: bool
+    last_activity_at: datetime
+    last_message: Optional[MessagePreview] = None
+    members: List[MemberRef]
+    member_count: int
+    unread_count: int = 0
+    last_read_message_id: Optional[int] = None
+
+class ConversationPage(BaseModel):
+    items: List[ConversationSummary]
+    next_cursor: Optional[str] = None
+
+
 class MembershipResponse(BaseModel):
     user_id: int
     group_id: int
@@ -89,6 +146,13 @@ class MembershipResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class BulkJoinRequest(BaseModel):
+    group_ids: List[int] = Field(..., max_length=100)
+
+class BulkMembershipResult(BaseModel):
+    group_id: int
+    status: Literal["joined", "already_member", "not_found", "hobby_required"]
+
 
 class PostBase(BaseModel):
     title: str
@@ -123,4 +187,11 @@ class ChatMessageResponse(ChatMessageBase):
     user: UserPublic
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class ReadReceipt(BaseModel):
+    message_id: int
+
+class DeletionJob(BaseModel):
+    job_id: str
+    status: str
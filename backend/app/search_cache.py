@@ -0,0 +1,125 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from .redis_client import redis_client
+
+load_dotenv()
+
+SEARCH_CACHE_TTL_SECONDS = int(os.getenv("SEARCH_CACHE_TTL_SECONDS", "30"))
+SEARCH_LOCAL_CACHE_SIZE = int(os.getenv("SEARCH_LOCAL_CACHE_SIZE", "1024"))
+# How long a worker trusts the index generations it last read from Redis. Writes
+# through another worker can take this long to invalidate this worker's results.
+SEARCH_GENERATION_TTL_MS = int(os.getenv("SEARCH_GENERATION_TTL_MS", "1000"))
+
+SEARCH_INDICES = ("users", "groups", "posts")
+
+# Small in-process cache in front of Redis: key -> (expires_at, hits).
+# Keys embed the index generations, so a bump makes old entries unreachable.
+_local_cache: Dict[str, Tuple[float, List[dict]]] = {}
+# index -> (expires_at, generation), so most lookups make no Redis round trip.
+_local_generations: Dict[str, Tuple[float, str]] = {}
+
+
+def _generation_key(index: str) -> str:
+    return f"search:gen:{index}"
+
+
+def normalize_query(q: str) -> str:
+    """Lowercases and collapses whitespace so trivially different queries share an entry."""
+    return " ".join(q.lower().split())
+
+
+async def bump_generation(index: str):
+    """Invalidates every cached result that touches `index`. Called after each write to it."""
+    try:
+        await redis_client.incr(_generation_key(index))
+        # This worker sees its own writes right away; others within SEARCH_GENERATION_TTL_MS.
+        _local_generations.pop(index, None)
+    except Exception as e:
+        logging.error(f"Failed to bump search cache generation for {index}: {e}")
+
+
+async def _generations(indices: List[str]) -> List[str]:
+    now = time.monotonic()
+    generations = {}
+    for index in indices:
+        entry = _local_generations.get(index)
+        if entry is not None and entry[0] >= now:
+            generations[index] = entry[1]
+    missing = [index for index in indices if index not in generations]
+    if missing:
+        fetched = await redis_client.mget([_generation_key(index) for index in missing])
+        expires_at = now + SEARCH_GENERATION_TTL_MS / 1000
+        for index, generation in zip(missing, fetched):
+            generations[index] = generation or "0"
+            _local_generations[index] = (expires_at, generations[index])
+    return [generations[index] for index in indices]
+
+
+async def _cache_key(indices: List[str], q: str, page: int) -> str:
+    generations = await _generations(indices)
+    versions = ",".join(f"{index}:{gen}" for index, gen in zip(indices, generations))
+    digest = hashlib.sha1(normalize_query(q).encode()).hexdigest()
+    return f"search:result:{versions}:{page}:{digest}"
+
+
+def _get_local(key: str) -> Optional[List[dict]]:
+    entry = _local_cache.get(key)
+    if entry is None:
+        return None
+    expires_at, hits = entry
+    if expires_at < time.monotonic():
+        _local_cache.pop(key, None)
+        return None
+    return hits
+
+
+def _set_local(key: str, hits: List[dict]):
+    if len(_local_cache) >= SEARCH_LOCAL_CACHE_SIZE:
+        # Evict the entry closest to expiry rather than tracking full LRU order.
+        oldest = min(_local_cache, key=lambda k: _local_cache[k][0])
+        _local_cache.pop(oldest, None)
+    _local_cache[key] = (time.monotonic() + SEARCH_CACHE_TTL_SECONDS, hits)
+
+
+async def cached_search(indices: List[str], q: str, page: int, search) -> List[dict]:
+    """
+    Returns the hits for a search, served from local memory or Redis when possible.
+
+    `search` is a coroutine function that queries Elasticsearch and returns the
+    list of hits. Only `_index` and `_id` are cached, since results are always
+    hydrated from the database afterwards.
+    """
+    try:
+        key = await _cache_key(indices, q, page)
+    except Exception as e:
+        logging.error(f"Search cache unavailable, querying Elasticsearch directly: {e}")
+        return await search()
+
+    hits = _get_local(key)
+    if hits is not None:
+        return hits
+
+    try:
+        cached = await redis_client.get(key)
+    except Exception as e:
+        logging.error(f"Failed to read search cache entry: {e}")
+        cached = None
+    if cached is not None:
+        hits = json.loads(cached)
+        _set_local(key, hits)
+        return hits
+
+    hits = [{"_index": hit["_index"], "_id": hit["_id"]} for hit in await search()]
+    _set_local(key, hits)
+    try:
+        await redis_client.set(key, json.dumps(hits), ex=SEARCH_CACHE_TTL_SECONDS)
+    except Exception as e:
+        logging.error(f"Failed to write search cache entry: {e}")
+    return hits
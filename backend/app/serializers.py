@@ -0,0 +1,321 @@
+"""
+Fast serialization and slim response shapes for large list endpoints.
+
+By default, list endpoints return ORM objects. FastAPI then validates every
+row against the `response_model` and runs `jsonable_encoder` over the result,
+which dominates CPU time for big lists. With FAST_RESPONSES=true those
+endpoints instead build plain dicts from column projections, which skips
+loading ORM entities. The dicts already have the response model's shape, so
+they are encoded once with orjson and returned directly, without being
+validated again. The JSON is the same apart from minor timestamp formatting.
+
+The `view=` parameter of the group endpoints selects a slimmer shape
+(`GroupSummary`, `GroupCompact`, `MemberRef`). Their loaders fetch only the
+columns those models need and never touch members' hobbies or memberships.
+
+`format=ndjson` streams the full shape one row per line, reading the rows
+from a server-side cursor in batches, so memory per request stays bounded.
+"""
+import logging
+import os
+from collections import defaultdict
+from functools import lru_cache
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from dotenv import load_dotenv
+from fastapi.responses import Response, StreamingResponse
+from pydantic import TypeAdapter
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from . import models, tracing
+
+load_dotenv()
+
+FAST_RESPONSES = os.getenv("FAST_RESPONSES", "false").lower() == "true"
+# Members listed in a GroupSummary; member_count always has the total.
+GROUP_SUMMARY_MEMBERS = int(os.getenv("GROUP_SUMMARY_MEMBERS", "5"))
+# Rows fetched from the server-side cursor and serialized together by NDJSON streams.
+NDJSON_BATCH_SIZE = int(os.getenv("NDJSON_BATCH_SIZE", "500"))
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if FAST_RESPONSES and orjson is None:
+    logging.warning("FAST_RESPONSES is enabled but orjson is not installed; using the default serialization")
+    FAST_RESPONSES = False
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        with tracing.Timer("serialize", "render"):
+            # OPT_UTC_Z writes UTC offsets as "Z", like pydantic does.
+            return orjson.dumps(content, option=orjson.OPT_UTC_Z)
+
+
+def _user_hobbies(db: Session, user_ids: Iterable[int]) -> Dict[int, List[dict]]:
+    user_ids = list(set(user_ids))
+    if not user_ids:
+        return {}
+    rows = db.query(
+        models.user_hobbies.c.user_id, models.Hobby.id, models.Hobby.name
+    ).join(
+        models.Hobby, models.Hobby.id == models.user_hobbies.c.hobby_id
+    ).filter(models.user_hobbies.c.user_id.in_(user_ids)).all()
+    hobbies = defaultdict(list)
+    for user_id, hobby_id, name in rows:
+        hobbies[user_id].append({"id": hobby_id, "name": name})
+    return hobbies
+
+
+def public_users(db: Session, user_ids: Iterable[int]) -> Dict[int, dict]:
+    """`UserPublic` dicts by ID; IDs of users that no longer exist are left out."""
+    user_ids = list(set(user_ids))
+    if not user_ids:
+        return {}
+    hobbies = _user_hobbies(db, user_ids)
+    rows = db.query(models.User.id, models.User.name).filter(models.User.id.in_(user_ids)).all()
+    return {user_id: {"id": user_id, "name": name, "hobbies": hobbies.get(user_id, [])} for user_id, name in rows}
+
+
+def _group_query(db: Session, *criteria):
+    return db.query(
+        models.Group.id,
+        models.Group.name,
+        models.Group.description,
+        func.coalesce(models.Hobby.name, "Direct Message").label("hobby"),
+        models.Group.creator_id,
+        models.Group.created_at,
+        models.Group.is_direct_message,
+    ).outerjoin(models.Hobby, models.Hobby.id == models.Group.hobby_id).filter(*criteria).order_by(models.Group.id)
+
+
+def _group_dicts(db: Session, groups) -> List[dict]:
+    if not groups:
+        return []
+    group_ids = [group.id for group in groups]
+    members = db.query(
+        models.Membership.group_id, models.User.id, models.User.name
+    ).join(
+        models.User, models.User.id == models.Membership.user_id
+    ).filter(models.Membership.group_id.in_(group_ids)).order_by(models.Membership.id).all()
+    hobbies = _user_hobbies(db, (user_id for _, user_id, _ in members))
+
+    members_by_group = defaultdict(list)
+    for group_id, user_id, name in members:
+        members_by_group[group_id].append({"id": user_id, "name": name, "hobbies": hobbies.get(user_id, [])})
+
+    return [
+        {
+            "name": group.name,
+            "description": group.description,
+            "hobby": group.hobby,
+            "id": group.id,
+            "creator_id": group.creator_id,
+            "created_at": group.created_at,
+            "is_direct_message": group.is_direct_message,
+            "members": members_by_group.get(group.id, []),
+        }
+        for group in groups
+    ]
+
+
+def group_rows(db: Session, *criteria) -> List[dict]:
+    """`GroupResponse`-shaped dicts for the groups matching `criteria`, from three column queries."""
+    return _group_dicts(db, _group_query(db, *criteria).all())
+
+
+def group_batches(db: Session, *criteria) -> Iterator[List[dict]]:
+    """Like `group_rows`, but reads the groups through a server-side cursor a batch at a time."""
+    for batch in _batches(_group_query(db, *criteria).yield_per(NDJSON_BATCH_SIZE)):
+        yield _group_dicts(db, batch)
+
+
+def _post_query(db: Session, group_id: int):
+    return db.query(
+        models.Post.id,
+        models.Post.title,
+        models.Post.content,
+        models.Post.created_at,
+        models.Post.owner_id,
+        models.Post.group_id,
+        models.User.name.label("owner_name"),
+    ).join(
+        models.User, models.User.id == models.Post.owner_id
+    ).filter(models.Post.group_id == group_id).order_by(models.Post.id)
+
+
+def _post_dicts(db: Session, posts) -> List[dict]:
+    hobbies = _user_hobbies(db, (post.owner_id for post in posts))
+    return [
+        {
+            "title": post.title,
+            "content": post.content,
+            "id": post.id,
+            "created_at": post.created_at,
+            "owner_id": post.owner_id,
+            "group_id": post.group_id,
+            "owner": {"id": post.owner_id, "name": post.owner_name, "hobbies": hobbies.get(post.owner_id, [])},
+        }
+        for post in posts
+    ]
+
+
+def post_rows(db: Session, group_id: int) -> List[dict]:
+    """`PostResponse`-shaped dicts for a group's posts, from two column queries."""
+    return _post_dicts(db, _post_query(db, group_id).all())
+
+
+def post_batches(db: Session, group_id: int) -> Iterator[List[dict]]:
+    for batch in _batches(_post_query(db, group_id).yield_per(NDJSON_BATCH_SIZE)):
+        yield _post_dicts(db, batch)
+
+
+def message_batches(db: Session, group_id: int, limit: int, before=None) -> Iterator[List[dict]]:
+    """`ChatMessageResponse`-shaped dicts for a group's latest `limit` messages before `before`, oldest first."""
+    latest = db.query(models.ChatMessage.id).filter(
+        models.ChatMessage.group_id == group_id,
+        *([models.ChatMessage.timestamp < before] if before is not None else [])
+    ).order_by(models.ChatMessage.id.desc()).limit(limit).subquery()
+    query = db.query(
+        models.ChatMessage.id,
+        models.ChatMessage.content,
+        models.ChatMessage.timestamp,
+        models.ChatMessage.user_id,
+        models.ChatMessage.group_id,
+        models.User.name.label("user_name"),
+    ).join(
+        latest, latest.c.id == models.ChatMessage.id
+    ).join(
+        models.User, models.User.id == models.ChatMessage.user_id
+    ).order_by(models.ChatMessage.id)
+
+    for batch in _batches(query.yield_per(NDJSON_BATCH_SIZE)):
+        hobbies = _user_hobbies(db, (message.user_id for message in batch))
+        yield [
+            {
+                "content": message.content,
+                "id": message.id,
+                "timestamp": message.timestamp,
+                "user_id": message.user_id,
+                "group_id": message.group_id,
+                "user": {"id": message.user_id, "name": message.user_name, "hobbies": hobbies.get(message.user_id, [])},
+            }
+            for message in batch
+        ]
+
+
+def _batches(rows: Iterable) -> Iterator[list]:
+    iterator = iter(rows)
+    while batch := list(islice(iterator, NDJSON_BATCH_SIZE)):
+        yield batch
+
+
+def ndjson_response(batches: Iterator[List[dict]], model) -> StreamingResponse:
+    """
+    Streams one JSON document per line, validated against `model`.
+
+    Only one batch of rows is in memory at a time. The generator is sync, so
+    Starlette runs it in the threadpool and the database reads stay off the
+    event loop.
+    """
+    adapter = _adapter(model)
+
+    def lines():
+        for batch in batches:
+            yield b"".join(adapter.dump_json(adapter.validate_python(row)) + b"\n" for row in batch)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@lru_cache(maxsize=None)
+def _adapter(response_type) -> TypeAdapter:
+    return TypeAdapter(response_type)
+
+
+def model_response(response_type, content) -> Response:
+    """Validates `content` against `response_type` and encodes it, both in pydantic's compiled core."""
+    adapter = _adapter(response_type)
+    with tracing.Timer("serialize", "dump_json"):
+        body = adapter.dump_json(adapter.validate_python(content))
+    return Response(content=body, media_type="application/json")
+
+
+def member_previews(db: Session, group_ids: List[int], limit: int) -> Dict[int, Tuple[List[dict], int]]:
+    """Returns {group_id: (first `limit` members as id/name, member count)} in one windowed query."""
+    if not group_ids:
+        return {}
+    ranked = db.query(
+        models.Membership.group_id.label("group_id"),
+        models.User.id.label("user_id"),
+        models.User.name.label("name"),
+        func.row_number().over(
+            partition_by=models.Membership.group_id,
+            order_by=models.Membership.id
+        ).label("position"),
+        func.count().over(partition_by=models.Membership.group_id).label("member_count")
+    ).join(
+        models.User, models.User.id == models.Membership.user_id
+    ).filter(
+        models.Membership.group_id.in_(group_ids)
+    ).subquery()
+
+    rows = db.query(ranked).filter(ranked.c.position <= limit).all()
+    previews = {}
+    for row in rows:
+        members, _ = previews.get(row.group_id, ([], 0))
+        members.append({"id": row.user_id, "name": row.name})
+        previews[row.group_id] = (members, row.member_count)
+    return previews
+
+
+def group_views(db: Session, view: str, *criteria, query=None) -> List[dict]:
+    """
+    `GroupCompact` or `GroupSummary` dicts for the matching groups.
+
+    Pass `query` to start from a query that already joins or orders the groups,
+    e.g. by the caller's memberships.
+    """
+    columns = [
+        models.Group.id,
+        models.Group.name,
+        func.coalesce(models.Hobby.name, "Direct Message").label("hobby"),
+    ]
+    if view == "summary":
+        columns += [
+            models.Group.description,
+            models.Group.creator_id,
+            models.Group.created_at,
+            models.Group.is_direct_message,
+        ]
+    query = query if query is not None else db.query(models.Group)
+    groups = query.with_entities(*columns).outerjoin(
+        models.Hobby, models.Hobby.id == models.Group.hobby_id
+    ).filter(*criteria).all()
+    group_ids = [group.id for group in groups]
+
+    if view == "summary":
+        previews = member_previews(db, group_ids, GROUP_SUMMARY_MEMBERS)
+        rows = []
+        for group in groups:
+            members, member_count = previews.get(group.id, ([], 0))
+            rows.append({**group._asdict(), "members": members, "member_count": member_count})
+        return rows
+
+    counts = dict(db.query(
+        models.Membership.group_id, func.count()
+    ).filter(models.Membership.group_id.in_(group_ids)).group_by(models.Membership.group_id).all()) if group_ids else {}
+    return [{**group._asdict(), "member_count": counts.get(group.id, 0)} for group in groups]
+
+
+def member_refs(db: Session, group_id: int) -> List[dict]:
+    """`MemberRef` dicts for a group's members, in join order."""
+    rows = db.query(models.User.id, models.User.name).join(
+        models.Membership, models.Membership.user_id == models.User.id
+    ).filter(models.Membership.group_id == group_id).order_by(models.Membership.id).all()
+    return [{"id": user_id, "name": name} for user_id, name in rows]
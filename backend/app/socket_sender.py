@@ -0,0 +1,70 @@
+import asyncio
+import logging
+import os
+import time
+
+from dotenv import load_dotenv
+from fastapi import WebSocket, status
+
+from .metrics import SocketStats
+
+load_dotenv()
+
+# Frames buffered per socket before new ones are dropped for that socket.
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+# A socket that drops this many frames in a row is closed so the client can reconnect and resync.
+WS_SLOW_CONSUMER_MAX_DROPS = int(os.getenv("WS_SLOW_CONSUMER_MAX_DROPS", "64"))
+
+
+class QueuedSender:
+    """
+    Delivers frames to one WebSocket from a bounded queue.
+
+    Fan-out only enqueues, so one slow client cannot stall delivery to the rest
+    of its group. When its queue is full the frame is dropped for that client.
+    """
+    def __init__(self, websocket: WebSocket, stats: SocketStats):
+        self.websocket = websocket
+        self.stats = stats
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=WS_SEND_QUEUE_SIZE)
+        self.consecutive_drops = 0
+        self.task = asyncio.create_task(self._run())
+        # Kept so the event loop's weak reference is not the only one while the close runs.
+        self.close_task = None
+
+    def enqueue(self, data: str) -> bool:
+        try:
+            self.queue.put_nowait((data, time.perf_counter()))
+        except asyncio.QueueFull:
+            self.stats.slow_consumer_drops += 1
+            self.consecutive_drops += 1
+            if self.consecutive_drops == WS_SLOW_CONSUMER_MAX_DROPS:
+                self.stats.slow_consumers_closed += 1
+                self.close_task = asyncio.create_task(self._close_slow_consumer())
+            return False
+        self.consecutive_drops = 0
+        return True
+
+    @property
+    def depth(self) -> int:
+        return self.queue.qsize()
+
+    async def _run(self):
+        while True:
+            data, enqueued_at = await self.queue.get()
+            try:
+                await self.websocket.send_text(data)
+            except Exception:
+                # The receive loop notices the disconnect and unregisters the socket.
+                return
+            self.stats.send_latency.observe((time.perf_counter() - enqueued_at) * 1000)
+
+    async def _close_slow_consumer(self):
+        self.task.cancel()
+        try:
+            await self.websocket.close(code=status.WS_1013_TRY_AGAIN_LATER, reason="Too slow to keep up")
+        except Exception as e:
+            logging.error(f"Failed to close slow WebSocket consumer: {e}")
+
+    def close(self):
+        self.task.cancel()
@@ -0,0 +1,337 @@
+"""
+Per-request tracing for HTTP endpoints.
+
+The tracing middleware opens a `RequestTrace` for each request and stores it in a
+context variable. Hooks in the database engines, the Redis client, the
+Elasticsearch transport and response serialization add their timings to it.
+When the request ends:
+
+* a `Server-Timing` header summarizes the time spent in each layer,
+* requests slower than SLOW_REQUEST_MS are logged with their query breakdown,
+* the trace is exported as an OTLP/JSON line to TRACE_EXPORT_PATH when set,
+  which the OpenTelemetry Collector's `otlpjsonfile` receiver can ingest.
+
+Statements repeated many times within one request are reported as likely N+1
+patterns.
+"""
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
+from collections import Counter
+from typing import List, Optional
+
+from dotenv import load_dotenv
+from fastapi import routing
+from fastapi.responses import JSONResponse
+from sqlalchemy import event
+
+load_dotenv()
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "500"))
+# File receiving one OTLP/JSON document per exported request; empty disables the export.
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+# Individual spans kept per request; counts and totals are always complete.
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "200"))
+# A statement issued at least this many times in one request is flagged as a likely N+1.
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "10"))
+
+SERVICE_NAME = os.getenv("SERVICE_NAME", "hobbynet-api")
+
+# OTLP span kinds.
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+
+class LayerStats:
+    """Call count and time spent in one layer (database, Redis, ...) during a request."""
+    __slots__ = ("count", "seconds", "slowest_seconds", "slowest_detail")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.slowest_seconds = 0.0
+        self.slowest_detail: Optional[str] = None
+
+    def add(self, seconds: float, detail: Optional[str]):
+        self.count += 1
+        self.seconds += seconds
+        if seconds > self.slowest_seconds:
+            self.slowest_seconds = seconds
+            self.slowest_detail = detail
+
+
+class RequestTrace:
+    """Everything recorded about one request. Sync endpoints run in the threadpool, so updates take a lock."""
+    def __init__(self, method: str, path: str):
+        self.trace_id = f"{random.getrandbits(128):032x}"
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.method = method
+        self.path = path
+        self.route: Optional[str] = None
+        self.start_ns = time.time_ns()
+        self.start = time.perf_counter()
+        self.layers = {name: LayerStats() for name in ("db", "redis", "es", "serialize")}
+        self.statements = Counter()
+        self.spans: List[dict] = []
+        self.dropped_spans = 0
+        self._lock = threading.Lock()
+
+    def record(self, layer: str, name: str, seconds: float, detail: Optional[str] = None):
+        end_ns = time.time_ns()
+        with self._lock:
+            self.layers[layer].add(seconds, detail)
+            if layer == "db" and detail:
+                self.statements[detail] += 1
+            if len(self.spans) < TRACE_MAX_SPANS:
+                self.spans.append({
+                    "layer": layer,
+                    "name": name,
+                    "start_ns": end_ns - int(seconds * 1e9),
+                    "end_ns": end_ns,
+                    "detail": detail
+                })
+            else:
+                self.dropped_spans += 1
+
+    def repeated_statements(self) -> List[tuple]:
+        return [(statement, count) for statement, count in self.statements.most_common(3) if count >= N_PLUS_ONE_THRESHOLD]
+
+    def server_timing(self, total_seconds: float) -> str:
+        entries = []
+        for name in ("db", "redis", "es", "serialize"):
+            layer = self.layers[name]
+            if layer.count:
+                entries.append(f'{name};dur={layer.seconds * 1000:.1f};desc="{layer.count} calls"')
+        entries.append(f"total;dur={total_seconds * 1000:.1f}")
+        return ", ".join(entries)
+
+
+_current_trace: contextvars.ContextVar[Optional[RequestTrace]] = contextvars.ContextVar("request_trace", default=None)
+
+
+def current() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+def record(layer: str, name: str, seconds: float, detail: Optional[str] = None):
+    """Adds a timed call to the active request's trace; a no-op outside a traced request."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.record(layer, name, seconds, detail)
+
+
+def start_request(method: str, path: str) -> Optional[contextvars.Token]:
+    if not TRACING_ENABLED:
+        return None
+    return _current_trace.set(RequestTrace(method, path))
+
+
+def finish_request(token: Optional[contextvars.Token], status_code: int) -> Optional[str]:
+    """Closes the request's trace, logs and exports it, and returns the Server-Timing header value."""
+    if token is None:
+        return None
+    trace = _current_trace.get()
+    _current_trace.reset(token)
+    total = time.perf_counter() - trace.start
+
+    if total * 1000 >= SLOW_REQUEST_MS:
+        _log_slow_request(trace, status_code, total)
+    if _exporter is not None and random.random() < TRACE_SAMPLE_RATE:
+        _exporter.info(json.dumps(_to_otlp(trace, status_code, total)))
+    return trace.server_timing(total)
+
+
+def _log_slow_request(trace: RequestTrace, status_code: int, total: float):
+    db = trace.layers["db"]
+    parts = [f"db {db.count} queries {db.seconds * 1000:.1f}ms"]
+    if db.slowest_detail:
+        parts.append(f"slowest {db.slowest_seconds * 1000:.1f}ms: {db.slowest_detail[:300]}")
+    for name in ("redis", "es", "serialize"):
+        layer = trace.layers[name]
+        if layer.count:
+            parts.append(f"{name} {layer.count} calls {layer.seconds * 1000:.1f}ms")
+    for statement, count in trace.repeated_statements():
+        parts.append(f"possible N+1, {count}x: {statement[:200]}")
+    logging.warning(
+        f"Slow request {trace.method} {trace.route or trace.path} -> {status_code} in {total * 1000:.1f}ms; "
+        + "; ".join(parts)
+    )
+
+
+def _attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+_LAYER_ATTRIBUTES = {"db": "db.statement", "redis": "db.statement", "es": "url.path", "serialize": "code.function"}
+
+
+def _to_otlp(trace: RequestTrace, status_code: int, total: float) -> dict:
+    """Builds an OTLP/JSON `ExportTraceServiceRequest` with the request span and its child spans."""
+    attributes = [
+        _attribute("http.request.method", trace.method),
+        _attribute("url.path", trace.path),
+        _attribute("http.response.status_code", status_code),
+    ]
+    if trace.route:
+        attributes.append(_attribute("http.route", trace.route))
+    for name, layer in trace.layers.items():
+        attributes.append(_attribute(f"app.{name}.count", layer.count))
+        attributes.append(_attribute(f"app.{name}.duration_ms", layer.seconds * 1000))
+    if trace.dropped_spans:
+        attributes.append(_attribute("app.dropped_spans", trace.dropped_spans))
+
+    spans = [{
+        "traceId": trace.trace_id,
+        "spanId": trace.span_id,
+        "name": f"{trace.method} {trace.route or trace.path}",
+        "kind": SPAN_KIND_SERVER,
+        "startTimeUnixNano": str(trace.start_ns),
+        "endTimeUnixNano": str(trace.start_ns + int(total * 1e9)),
+        "attributes": attributes,
+        "status": {"code": 2 if status_code >= 500 else 0},
+    }]
+    for span in trace.spans:
+        child_attributes = [_attribute("app.layer", span["layer"])]
+        if span["detail"]:
+            child_attributes.append(_attribute(_LAYER_ATTRIBUTES[span["layer"]], span["detail"]))
+        spans.append({
+            "traceId": trace.trace_id,
+            "spanId": f"{random.getrandbits(64):016x}",
+            "parentSpanId": trace.span_id,
+            "name": span["name"],
+            "kind": SPAN_KIND_CLIENT if span["layer"] != "serialize" else 1,
+            "startTimeUnixNano": str(span["start_ns"]),
+            "endTimeUnixNano": str(span["end_ns"]),
+            "attributes": child_attributes,
+        })
+
+    return {"resourceSpans": [{
+        "resource": {"attributes": [_attribute("service.name", SERVICE_NAME), _attribute("process.pid", os.getpid())]},
+        "scopeSpans": [{"scope": {"name": "app.tracing"}, "spans": spans}],
+    }]}
+
+
+# --- Export ---
+# Lines are handed to a queue and written by a listener thread, so requests never block on file I/O.
+_exporter: Optional[logging.Logger] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def start_exporter():
+    global _exporter, _listener
+    if not TRACING_ENABLED or not TRACE_EXPORT_PATH or _exporter is not None:
+        return
+    records = queue.SimpleQueue()
+    file_handler = logging.FileHandler(TRACE_EXPORT_PATH)
+    file_handler.setFormatter(logging.Formatter("%(message)s"))
+    _listener = logging.handlers.QueueListener(records, file_handler)
+    _listener.start()
+
+    exporter = logging.getLogger("app.tracing.export")
+    exporter.setLevel(logging.INFO)
+    exporter.propagate = False
+    exporter.addHandler(logging.handlers.QueueHandler(records))
+    _exporter = exporter
+
+
+def stop_exporter():
+    global _exporter, _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+    if _exporter is not None:
+        _exporter.handlers.clear()
+    _exporter = None
+    _listener = None
+
+
+# --- Hooks ---
+
+def instrument_engine(engine):
+    """Times every statement executed through `engine` while a request is being traced."""
+    if not TRACING_ENABLED:
+        return
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("trace_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["trace_start"].pop()
+        record("db", statement.split(None, 1)[0].upper() if statement else "SQL", time.perf_counter() - started, statement)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(exception_context):
+        starts = exception_context.connection.info.get("trace_start") if exception_context.connection else None
+        if starts:
+            starts.pop()
+
+
+class Timer:
+    """Context manager that records the enclosed block as one call in the given layer."""
+    __slots__ = ("layer", "name", "detail", "start")
+
+    def __init__(self, layer: str, name: str, detail: Optional[str] = None):
+        self.layer = layer
+        self.name = name
+        self.detail = detail
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.layer, self.name, time.perf_counter() - self.start, self.detail)
+        return False
+
+
+def traced_transport_class(base):
+    """Subclasses an Elasticsearch transport so that every request it performs is timed."""
+    class TracedTransport(base):
+        async def perform_request(self, method, target, *args, **kwargs):
+            with Timer("es", f"{method} {target.split('?', 1)[0]}", target):
+                return await super().perform_request(method, target, *args, **kwargs)
+
+    return TracedTransport
+
+
+class TimedJSONResponse(JSONResponse):
+    """The default JSON response, with encoding counted as serialization time."""
+    def render(self, content) -> bytes:
+        with Timer("serialize", "render"):
+            return super().render(content)
+
+
+def install_serialization_hook():
+    """
+    Times response-model validation and `jsonable_encoder`.
+
+    FastAPI does both in `fastapi.routing.serialize_response`, which the request
+    handler looks up at call time, so wrapping the module attribute is enough.
+    """
+    original = routing.serialize_response
+    if not TRACING_ENABLED or getattr(original, "traced", False):
+        return
+
+    async def serialize_response(*args, **kwargs):
+        with Timer("serialize", "validate"):
+            return await original(*args, **kwargs)
+
+    serialize_response.traced = True
+    routing.serialize_response = serialize_response
@@ -0,0 +1,174 @@
+"""
+Helpers shared by the benchmark scripts: environment setup, synthetic data and result files.
+
+The app reads its settings at import time, so `configure_environment` must run
+before anything from `app` is imported.
+"""
+import json
+import math
+import os
+import platform
+import secrets
+import subprocess
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+
+def configure_environment(database_url: str, redis_url: Optional[str] = None, **overrides: str):
+    """Points the app at the benchmark database and Redis and disables optional services."""
+    os.environ["DATABASE_URL"] = database_url
+    if redis_url:
+        os.environ["REDIS_URL"] = redis_url
+    os.environ.setdefault("SECRET_KEY", secrets.token_hex(32))
+    os.environ.setdefault("SEARCH_ENABLED", "false")
+    for key, value in overrides.items():
+        os.environ[key] = str(value)
+
+
+def default_sqlite_url(name: str) -> str:
+    path = RESULTS_DIR / f"{name}.sqlite3"
+    if path.exists():
+        path.unlink()
+    # The app uses sessions from the threadpool, which the sqlite driver refuses by default.
+    return f"sqlite:///{path}?check_same_thread=false"
+
+
+def create_schema():
+    """Creates the tables with `create_all`; Alembic migrations are Postgres-only."""
+    from app import database, models  # noqa: F401 - registers the tables on Base.metadata
+    database.Base.metadata.create_all(database.engine)
+
+
+def seed(users: int, groups: int, tag: Optional[str] = None, posts_per_group: int = 0,
+         messages_per_group: int = 0, memberships_per_user: int = 1) -> Dict[str, list]:
+    """
+    Inserts a synthetic dataset with multi-row inserts and returns the new IDs.
+
+    Every user shares one hobby so they may join any group. User `i` joins the
+    `memberships_per_user` groups starting at `i % groups`. All users get the
+    same password hash, since bcrypt would dominate seeding time.
+    """
+    from sqlalchemy import insert
+    from app import database, models, security
+
+    tag = tag or str(int(time.time()))
+    password_hash = security.hash_password("benchmark")
+    db = database.SessionLocal()
+    try:
+        hobby_id = db.execute(
+            insert(models.Hobby).returning(models.Hobby.id), [{"name": f"bench-{tag}"}]
+        ).scalar_one()
+
+        user_rows = [
+            {"name": f"Bench User {i}", "email": f"bench-{tag}-{i}@example.com", "hashed_password": password_hash}
+            for i in range(users)
+        ]
+        user_ids = list(db.execute(
+            insert(models.User).returning(models.User.id, sort_by_parameter_order=True), user_rows
+        ).scalars())
+        db.execute(insert(models.user_hobbies), [{"user_id": user_id, "hobby_id": hobby_id} for user_id in user_ids])
+
+        group_rows = [
+            {
+                "name": f"Bench Group {i}",
+                "description": "Benchmark group",
+                "hobby_id": hobby_id,
+                "creator_id": user_ids[i % users],
+                "is_direct_message": False
+            }
+            for i in range(groups)
+        ]
+        group_ids = list(db.execute(
+            insert(models.Group).returning(models.Group.id, sort_by_parameter_order=True), group_rows
+        ).scalars())
+
+        membership_rows = []
+        for i, user_id in enumerate(user_ids):
+            for offset in range(min(memberships_per_user, groups)):
+                membership_rows.append({"user_id": user_id, "group_id": group_ids[(i + offset) % groups]})
+        db.execute(insert(models.Membership), membership_rows)
+
+        if posts_per_group:
+            db.execute(insert(models.Post), [
+                {
+                    "title": f"Post {n}",
+                    "content": "Benchmark post body " * 10,
+                    "group_id": group_id,
+                    "owner_id": user_ids[(i + n) % users]
+                }
+                for i, group_id in enumerate(group_ids) for n in range(posts_per_group)
+            ])
+        if messages_per_group:
+            db.execute(insert(models.ChatMessage), [
+                {"content": f"Message {n}", "group_id": group_id, "user_id": user_ids[(i + n) % users]}
+                for i, group_id in enumerate(group_ids) for n in range(messages_per_group)
+            ])
+        db.commit()
+    finally:
+        db.close()
+
+    emails = [row["email"] for row in user_rows]
+    return {
+        "tag": tag,
+        "hobby_id": hobby_id,
+        "hobby_name": f"bench-{tag}",
+        "user_ids": user_ids,
+        "emails": emails,
+        "group_ids": group_ids
+    }
+
+
+def access_token(email: str) -> str:
+    from datetime import timedelta
+    from app import security
+    return security.create_access_token({"sub": email}, expires_delta=timedelta(hours=12))
+
+
+def percentiles(samples: List[float], points=(50, 90, 95, 99, 99.9)) -> Dict[str, Optional[float]]:
+    """Nearest-rank percentiles plus min, max and mean, in the samples' unit."""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+    result = {
+        "count": len(ordered),
+        "min": ordered[0],
+        "mean": sum(ordered) / len(ordered),
+        "max": ordered[-1]
+    }
+    for point in points:
+        rank = max(1, math.ceil(point / 100 * len(ordered)))
+        result[f"p{point:g}"] = ordered[rank - 1]
+    return result
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(name: str, config: dict, metrics: dict, output: Optional[str] = None) -> Path:
+    """Writes one run to a JSON file so runs before and after a change can be compared."""
+    started = datetime.now(timezone.utc)
+    path = Path(output) if output else RESULTS_DIR / f"{name}-{started.strftime('%Y%m%dT%H%M%SZ')}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    document = {
+        "benchmark": name,
+        "created_at": started.isoformat(),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": config,
+        "metrics": metrics
+    }
+    path.write_text(json.dumps(document, indent=2, default=str))
+    return path
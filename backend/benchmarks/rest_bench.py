@@ -0,0 +1,370 @@
+"""
+In-process micro-benchmarks for the REST endpoints, with SQL statement counts.
+
+Each scale tier seeds a fresh SQLite database (or the given `--database-url`)
+and drives the app directly over ASGI, so no server or network is involved.
+Redis is an in-memory fakeredis unless `--redis-url` is given, and
+Elasticsearch is replaced by a stub that returns seeded IDs. Run it from the
+backend directory:
+
+    python -m benchmarks.rest_bench --tiers small,medium
+    python -m benchmarks.rest_bench --tiers small --baseline benchmarks/baseline.json --update-baseline
+    python -m benchmarks.rest_bench --tiers small --baseline benchmarks/baseline.json --check
+
+For every endpoint it records latency and CPU time percentiles, the number of SQL statements
+per request and the bytes allocated per request (measured in a separate
+tracemalloc pass, so tracing doesn't skew latency). With `--check` the run exits
+non-zero when an endpoint issues more statements than the baseline or its p95
+latency exceeds the baseline by more than `--tolerance`.
+
+Statement counts are deterministic and safe to gate in CI. Latency baselines
+only mean something on the machine that recorded them, so the committed
+benchmarks/baseline.json holds statement counts only; endpoints without a
+`p95_ms` in the baseline are not checked for latency.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlencode
+
+from benchmarks import common
+
+TIERS = {
+    "small": {"users": 100, "groups": 20, "memberships_per_user": 5, "posts_per_group": 10, "messages_per_group": 20},
+    "medium": {"users": 1000, "groups": 200, "memberships_per_user": 10, "posts_per_group": 20, "messages_per_group": 50},
+    "large": {"users": 10000, "groups": 1000, "memberships_per_user": 20, "posts_per_group": 20, "messages_per_group": 100},
+}
+
+# Endpoints that hash passwords are far slower than the rest; fewer iterations keep runs short.
+SLOW_ENDPOINTS = {"auth.signup", "auth.login"}
+
+
+class StubElasticsearch:
+    """Answers searches with seeded document IDs and accepts index calls without doing anything."""
+    def __init__(self, ids_by_index: Dict[str, List[int]]):
+        self.ids_by_index = ids_by_index
+
+    async def search(self, index, query=None, from_=0, size=10, **kwargs):
+        indices = [index] if isinstance(index, str) else index
+        hits = [
+            {"_index": name, "_id": str(doc_id), "_score": 1.0}
+            for name in indices for doc_id in self.ids_by_index.get(name, [])
+        ]
+        return {"hits": {"hits": hits[from_:from_ + size]}}
+
+    async def index(self, **kwargs):
+        return {"result": "created"}
+
+    async def ping(self):
+        return True
+
+    async def close(self):
+        pass
+
+
+class StatementCounter:
+    """Counts statements sent to the database through the app's engines."""
+    def __init__(self, engines):
+        from sqlalchemy import event
+
+        self.count = 0
+        for engine in engines:
+            event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+async def call(app, method: str, path: str, params: Optional[dict] = None,
+               body: Optional[dict] = None, token: Optional[str] = None):
+    """Sends one request straight to the ASGI app; returns (status, body, seconds until the response ended)."""
+    payload = json.dumps(body).encode() if body is not None else b""
+    headers = [(b"host", b"bench"), (b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())]
+    if token:
+        headers.append((b"authorization", f"Bearer {token}".encode()))
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": urlencode(params or {}).encode(),
+        "root_path": "",
+        "headers": headers,
+        "client": ("127.0.0.1", 50000),
+        "server": ("bench", 80),
+    }
+    response_done = asyncio.Event()
+    request_sent = False
+    status = None
+    chunks = []
+    elapsed = None
+    start = time.perf_counter()
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": payload, "more_body": False}
+        await response_done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status, elapsed
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                # Background tasks run after this point; they are not part of the latency.
+                elapsed = time.perf_counter() - start
+                response_done.set()
+
+    await app(scope, receive, send)
+    return status, b"".join(chunks), elapsed if elapsed is not None else time.perf_counter() - start
+
+
+def build_cases(dataset: dict) -> Dict[str, Callable[[int], dict]]:
+    """Maps endpoint names to functions returning the request for iteration `i`."""
+    token = common.access_token(dataset["emails"][0])
+    group_id = dataset["group_ids"][0]
+    other_user = dataset["user_ids"][1]
+    tag = dataset["tag"]
+
+    def get(path, **params):
+        return lambda i: {"method": "GET", "path": path, "params": params, "token": token}
+
+    return {
+        "auth.signup": lambda i: {"method": "POST", "path": "/auth/signup", "body": {
+            "name": f"Signup {i}", "email": f"signup-{tag}-{i}@example.com",
+            "password": "benchmark", "hobbies": [dataset["hobby_name"]]
+        }},
+        "auth.login": lambda i: {"method": "POST", "path": "/auth/login", "body": {
+            "email": dataset["emails"][i % len(dataset["emails"])], "password": "benchmark"
+        }},
+        "users.me": get("/users/me"),
+        "users.get": get(f"/users/{other_user}"),
+        "users.search": get("/users/search", query="Bench User 1"),
+        "groups.list": get("/groups/"),
+        "groups.list_summary": get("/groups/", view="summary"),
+        "groups.list_compact": get("/groups/", view="compact"),
+        "groups.get": get(f"/groups/{group_id}"),
+        "groups.recommendations": get("/groups/recommendations"),
+        "memberships.members": get(f"/memberships/group/{group_id}/members"),
+        "memberships.members_ref": get(f"/memberships/group/{group_id}/members", view="ref"),
+        "memberships.my_groups": get("/memberships/my-groups"),
+        "posts.list": get(f"/groups/{group_id}/posts/"),
+        "posts.create": lambda i: {"method": "POST", "path": f"/groups/{group_id}/posts/", "token": token, "body": {
+            "title": f"Benchmark post {i}", "content": "Benchmark post body"
+        }},
+        "chat.conversations": get("/chat/conversations"),
+        "chat.conversations_summary": get("/chat/conversations", view="summary"),
+        "chat.conversations_recent": get("/chat/conversations/recent"),
+        "chat.history": get(f"/chat/{group_id}"),
+        # A new query per iteration misses the search cache; the fixed one hits it after the first call.
+        "search.unified": lambda i: {"method": "GET", "path": "/search/", "params": {"q": f"bench {i}"}, "token": token},
+        "search.unified_cached": get("/search/", q="bench"),
+    }
+
+
+async def run_case(app, counter: StatementCounter, make_request: Callable[[int], dict],
+                   iterations: int, warmup: int) -> dict:
+    for i in range(warmup):
+        await call(app, **make_request(-1 - i))
+
+    latencies = []
+    cpu_times = []
+    statements = []
+    statuses = set()
+    response_bytes = 0
+    for i in range(iterations):
+        before = counter.count
+        # process_time covers the threadpool too, so sync endpoints are included.
+        cpu_before = time.process_time()
+        status, body, elapsed = await call(app, **make_request(i))
+        cpu_times.append((time.process_time() - cpu_before) * 1000)
+        statements.append(counter.count - before)
+        latencies.append(elapsed * 1000)
+        statuses.add(status)
+        response_bytes = len(body)
+
+    # Allocation pass: a few more calls with tracemalloc on.
+    allocation_runs = min(iterations, 5)
+    tracemalloc.start()
+    allocated = []
+    peaks = []
+    for i in range(allocation_runs):
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        await call(app, **make_request(iterations + i))
+        current, peak = tracemalloc.get_traced_memory()
+        allocated.append(current - before)
+        peaks.append(peak - before)
+    tracemalloc.stop()
+
+    return {
+        "iterations": iterations,
+        "statuses": sorted(statuses),
+        "latency_ms": common.percentiles(latencies),
+        "cpu_ms": common.percentiles(cpu_times),
+        "statements": {"min": min(statements), "max": max(statements), "mean": sum(statements) / len(statements)},
+        "response_bytes": response_bytes,
+        "retained_bytes": max(allocated) if allocated else None,
+        "peak_bytes": max(peaks) if peaks else None,
+    }
+
+
+async def run_tier(tier: str, args) -> dict:
+    from app import database, es_client, redis_client
+
+    if not args.redis_url:
+        from fakeredis import FakeAsyncRedis
+        # Swap the pool inside the shared client so every module that imported it uses fakeredis.
+        redis_client.redis_client.connection_pool = FakeAsyncRedis().connection_pool
+
+    common.create_schema()
+    dataset = common.seed(**TIERS[tier])
+    es_client._es_client = StubElasticsearch({
+        "users": dataset["user_ids"][:20],
+        "groups": dataset["group_ids"][:20],
+    })
+
+    from app.main import app
+
+    counter = StatementCounter([database.engine, *database.replica_engines])
+    cases = build_cases(dataset)
+    selected = [name for name in cases if not args.endpoints or name in args.endpoints]
+    results = {}
+    for name in selected:
+        iterations = args.slow_iterations if name in SLOW_ENDPOINTS else args.iterations
+        results[name] = await run_case(app, counter, cases[name], iterations, args.warmup)
+        logging.info(
+            f"[{tier}] {name}: p95 {results[name]['latency_ms']['p95']:.2f} ms, "
+            f"{results[name]['statements']['max']} statements"
+        )
+    return {"dataset": TIERS[tier], "endpoints": results}
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    """Returns one message per endpoint that regressed against the baseline."""
+    failures = []
+    for tier, tier_results in results.items():
+        for name, current in tier_results["endpoints"].items():
+            expected = baseline.get(tier, {}).get(name)
+            if expected is None:
+                continue
+            if current["statements"]["max"] > expected["statements"]:
+                failures.append(
+                    f"{tier}/{name}: {current['statements']['max']} SQL statements, baseline {expected['statements']}"
+                )
+            if "p95_ms" not in expected:
+                continue
+            limit = expected["p95_ms"] * (1 + tolerance)
+            if current["latency_ms"]["p95"] > limit:
+                failures.append(
+                    f"{tier}/{name}: p95 {current['latency_ms']['p95']:.2f} ms, "
+                    f"baseline {expected['p95_ms']:.2f} ms (+{tolerance:.0%} allowed)"
+                )
+    return failures
+
+
+def baseline_from(results: Dict[str, dict]) -> Dict[str, dict]:
+    return {
+        tier: {
+            name: {"statements": endpoint["statements"]["max"], "p95_ms": endpoint["latency_ms"]["p95"]}
+            for name, endpoint in tier_results["endpoints"].items()
+        }
+        for tier, tier_results in results.items()
+    }
+
+
+def _run_tier_in_subprocess(tier: str, args) -> dict:
+    """Each tier runs in its own process, since the app binds its engine to DATABASE_URL at import."""
+    with tempfile.NamedTemporaryFile(suffix=".json") as output:
+        command = [
+            sys.executable, "-m", "benchmarks.rest_bench", "--tier-worker", tier, "--tier-output", output.name,
+            "--iterations", str(args.iterations), "--slow-iterations", str(args.slow_iterations),
+            "--warmup", str(args.warmup),
+        ]
+        if args.database_url:
+            command += ["--database-url", args.database_url]
+        if args.redis_url:
+            command += ["--redis-url", args.redis_url]
+        if args.endpoints:
+            command += ["--endpoints", ",".join(args.endpoints)]
+        subprocess.run(command, cwd=common.BACKEND_DIR, check=True)
+        return json.loads(Path(output.name).read_text())
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tiers", default="small", help=f"comma-separated, from {', '.join(TIERS)}")
+    parser.add_argument("--endpoints", type=lambda value: value.split(","), help="comma-separated endpoint names")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--slow-iterations", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--database-url", help="defaults to a fresh SQLite file per tier")
+    parser.add_argument("--redis-url", help="defaults to an in-memory fakeredis")
+    parser.add_argument("--baseline", help="baseline JSON file for --check and --update-baseline")
+    parser.add_argument("--check", action="store_true", help="fail if a result regresses against --baseline")
+    parser.add_argument("--update-baseline", action="store_true", help="write this run's results to --baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p95 growth over the baseline")
+    parser.add_argument("--output", help="result file; defaults to benchmarks/results/rest_bench-<time>.json")
+    parser.add_argument("--tier-worker", help=argparse.SUPPRESS)
+    parser.add_argument("--tier-output", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    args = _parse_args()
+
+    if args.tier_worker:
+        common.configure_environment(
+            args.database_url or common.default_sqlite_url(f"rest_bench_{args.tier_worker}"),
+            args.redis_url,
+            SEARCH_ENABLED="true"
+        )
+        result = asyncio.run(run_tier(args.tier_worker, args))
+        Path(args.tier_output).write_text(json.dumps(result))
+        return
+
+    tiers = [tier.strip() for tier in args.tiers.split(",") if tier.strip()]
+    unknown = [tier for tier in tiers if tier not in TIERS]
+    if unknown:
+        sys.exit(f"Unknown tiers: {', '.join(unknown)}")
+    if (args.check or args.update_baseline) and not args.baseline:
+        sys.exit("--check and --update-baseline need --baseline")
+
+    results = {tier: _run_tier_in_subprocess(tier, args) for tier in tiers}
+    config = {key: value for key, value in vars(args).items() if not key.startswith("tier_") and key != "output"}
+    path = common.write_results("rest_bench", config, results, args.output)
+    logging.info(f"Results written to {path}")
+
+    if args.update_baseline:
+        baseline_path = Path(args.baseline)
+        baseline = json.loads(baseline_path.read_text()) if baseline_path.exists() else {}
+        baseline.update(baseline_from(results))
+        baseline_path.write_text(json.dumps(baseline, indent=2, sort_keys=True))
+        logging.info(f"Baseline updated in {baseline_path}")
+    elif args.check:
+        failures = compare(results, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        for failure in failures:
+            logging.error(f"Regression: {failure}")
+        if failures:
+            sys.exit(1)
+        logging.info("No regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Compares the default and the FAST_RESPONSES serialization of the large list endpoints.
+
+Runs the `groups.list` and `posts.list` cases of the REST benchmark twice per
+tier, once with each setting, and reports CPU time per request side by side:
+
+    python -m benchmarks.serialization_bench --tiers medium,large
+"""
+import argparse
+import logging
+import os
+
+from benchmarks import common, rest_bench
+
+ENDPOINTS = ["groups.list", "posts.list"]
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tiers", default="medium")
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    run_args = argparse.Namespace(
+        iterations=args.iterations, slow_iterations=1, warmup=3,
+        database_url=None, redis_url=None, endpoints=ENDPOINTS
+    )
+    results = {}
+    for tier in args.tiers.split(","):
+        results[tier] = {}
+        for mode, flag in (("default", "false"), ("fast", "true")):
+            # The tier runs in a subprocess, which inherits the flag.
+            os.environ["FAST_RESPONSES"] = flag
+            results[tier][mode] = rest_bench._run_tier_in_subprocess(tier, run_args)["endpoints"]
+
+        for endpoint in ENDPOINTS:
+            default = results[tier]["default"][endpoint]
+            fast = results[tier]["fast"][endpoint]
+            default_cpu = default["cpu_ms"]["p50"]
+            fast_cpu = fast["cpu_ms"]["p50"]
+            logging.info(
+                f"[{tier}] {endpoint}: CPU p50 {default_cpu:.2f} ms -> {fast_cpu:.2f} ms "
+                f"({(1 - fast_cpu / default_cpu) * 100 if default_cpu else 0:.0f}% less), "
+                f"statements {default['statements']['max']} -> {fast['statements']['max']}, "
+                f"{default['response_bytes']} -> {fast['response_bytes']} bytes"
+            )
+
+    path = common.write_results("serialization_bench", vars(args), results, args.output)
+    logging.info(f"Results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,384 @@
+"""
+WebSocket load harness for cross-worker chat and notification routing.
+
+Starts the app under uvicorn with several workers, seeds users and groups, then
+opens one `/chat/ws/{group_id}` socket per user and optionally one
+`/notifications/ws` socket per user. Connections are spread across the workers
+by the kernel, so every chat message travels sender -> worker -> Redis pub/sub
+-> every worker with a member of that group. Run it from the backend directory:
+
+    python -m benchmarks.ws_load --workers 4 --clients 2000 --groups 50
+    python -m benchmarks.ws_load --fakeredis --clients 500
+    python -m benchmarks.ws_load --database-url postgresql://... --redis-url redis://localhost:6379/15
+
+Recorded per run, written as JSON under benchmarks/results/:
+  * end-to-end latency from send to delivery on every member's socket, in ms
+  * sent and delivered messages per second
+  * worker RSS before and after connecting, and the growth per connection
+  * Redis connected_clients before, while connected and after the run
+
+SQLite is the default so the harness runs anywhere, but it serializes writes;
+use Postgres for numbers that mean anything in production. `--fakeredis` needs
+the `fakeredis` and `lupa` packages; a real Redis gives truer pub/sub numbers.
+Use a dedicated Redis database, since the run leaves presence and unread keys.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from benchmarks import common
+
+PAYLOAD_PREFIX = "bench|"
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _start_fakeredis() -> str:
+    from fakeredis import TcpFakeServer
+
+    port = _free_port()
+    server = TcpFakeServer(("127.0.0.1", port), server_type="redis")
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"redis://127.0.0.1:{port}/0"
+
+
+def _start_server(port: int, workers: int) -> subprocess.Popen:
+    command = [
+        sys.executable, "-m", "uvicorn", "app.main:app",
+        "--host", "127.0.0.1", "--port", str(port),
+        "--workers", str(workers),
+        "--log-level", "warning",
+        "--ws-max-queue", "1024",
+        "--ws-max-size", os.getenv("WS_MAX_FRAME_BYTES", "16384")
+    ]
+    return subprocess.Popen(command, cwd=common.BACKEND_DIR, env=os.environ.copy())
+
+
+def _wait_until_ready(port: int, server: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with code {server.returncode}")
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/openapi.json", timeout=1).read()
+            return
+        except OSError:
+            time.sleep(0.25)
+    raise RuntimeError("uvicorn did not become ready in time")
+
+
+def _child_pids(parent: int) -> List[int]:
+    children = []
+    for entry in Path("/proc").iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            # The command name is parenthesized and may contain spaces; ppid follows it.
+            fields = (entry / "stat").read_text().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == parent:
+            children.append(int(entry.name))
+    return children
+
+
+def _rss_kib(pid: int) -> int:
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def _worker_rss(server: subprocess.Popen) -> Dict[str, int]:
+    """RSS in KiB of each uvicorn worker process, read from /proc."""
+    return {str(pid): _rss_kib(pid) for pid in _child_pids(server.pid)}
+
+
+def _redis_clients(redis_url: str) -> Optional[int]:
+    import redis
+
+    try:
+        client = redis.Redis.from_url(redis_url)
+        try:
+            return client.info("clients").get("connected_clients")
+        finally:
+            client.close()
+    except Exception as e:
+        logging.error(f"Could not read Redis client count: {e}")
+        return None
+
+
+class LoadStats:
+    def __init__(self):
+        self.chat_latencies_ms: List[float] = []
+        self.notification_latencies_ms: List[float] = []
+        self.sent = 0
+        self.send_errors = 0
+        self.connect_failures = 0
+        self.connect_times_ms: List[float] = []
+        self.unexpected_closes = 0
+        self.other_frames = 0
+
+
+async def _open(url: str, stats: LoadStats, semaphore: asyncio.Semaphore):
+    import websockets
+
+    async with semaphore:
+        start = time.perf_counter()
+        try:
+            websocket = await websockets.connect(url, max_queue=None, open_timeout=30, ping_interval=None)
+        except Exception as e:
+            stats.connect_failures += 1
+            logging.debug(f"Connection to {url} failed: {e}")
+            return None
+        stats.connect_times_ms.append((time.perf_counter() - start) * 1000)
+        return websocket
+
+
+async def _read_chat(websocket, stats: LoadStats, measuring: asyncio.Event):
+    try:
+        async for frame in websocket:
+            received = time.time_ns()
+            message = json.loads(frame)
+            # Presence, typing and read events carry a type; chat messages don't.
+            content = message.get("content", "") if "type" not in message else ""
+            if content.startswith(PAYLOAD_PREFIX):
+                if measuring.is_set():
+                    sent = int(content.split("|")[1])
+                    stats.chat_latencies_ms.append((received - sent) / 1e6)
+            else:
+                stats.other_frames += 1
+    except Exception:
+        stats.unexpected_closes += 1
+
+
+async def _read_notifications(websocket, stats: LoadStats, measuring: asyncio.Event):
+    try:
+        async for frame in websocket:
+            received = time.time_ns()
+            message = json.loads(frame)
+            if message.get("type") == "BENCH" and measuring.is_set():
+                stats.notification_latencies_ms.append((received - message["sent_ns"]) / 1e6)
+    except Exception:
+        stats.unexpected_closes += 1
+
+
+async def _send_chat(sockets: List, rate: float, duration: float, stats: LoadStats):
+    """Sends `rate` messages per second in total, round-robin over the given sockets."""
+    interval = 1 / rate
+    deadline = time.monotonic() + duration
+    next_send = time.monotonic()
+    sequence = 0
+    while time.monotonic() < deadline:
+        websocket = sockets[sequence % len(sockets)]
+        try:
+            await websocket.send(f"{PAYLOAD_PREFIX}{time.time_ns()}|{sequence}")
+            stats.sent += 1
+        except Exception:
+            stats.send_errors += 1
+        sequence += 1
+        next_send += interval
+        delay = next_send - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+async def _publish_notifications(redis_url: str, user_ids: List[int], rate: float, duration: float):
+    """Publishes straight to the notification channels, as the REST endpoints do."""
+    import redis.asyncio as redis
+
+    client = redis.Redis.from_url(redis_url)
+    interval = 1 / rate
+    deadline = time.monotonic() + duration
+    next_send = time.monotonic()
+    try:
+        while time.monotonic() < deadline:
+            user_id = random.choice(user_ids)
+            await client.publish(f"notifications:{user_id}", json.dumps({"type": "BENCH", "sent_ns": time.time_ns()}))
+            next_send += interval
+            delay = next_send - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+    finally:
+        await client.aclose()
+
+
+async def _run_load(args, port: int, dataset: dict, server: subprocess.Popen) -> dict:
+    stats = LoadStats()
+    measuring = asyncio.Event()
+    semaphore = asyncio.Semaphore(args.connect_concurrency)
+    base = f"ws://127.0.0.1:{port}"
+    users = list(zip(dataset["user_ids"], dataset["emails"]))
+    groups = dataset["group_ids"]
+
+    tokens = [common.access_token(email) for _, email in users]
+    rss_before = _worker_rss(server)
+    redis_before = _redis_clients(args.redis_url)
+
+    connect_start = time.perf_counter()
+    chat_sockets = await asyncio.gather(*[
+        _open(f"{base}/chat/ws/{groups[i % len(groups)]}?token={tokens[i]}", stats, semaphore)
+        for i in range(len(users))
+    ])
+    notification_sockets = []
+    if args.notifications:
+        notification_sockets = await asyncio.gather(*[
+            _open(f"{base}/notifications/ws?token={token}", stats, semaphore) for token in tokens
+        ])
+    connect_seconds = time.perf_counter() - connect_start
+
+    readers = [asyncio.create_task(_read_chat(ws, stats, measuring)) for ws in chat_sockets if ws]
+    readers += [asyncio.create_task(_read_notifications(ws, stats, measuring)) for ws in notification_sockets if ws]
+
+    # Let presence events from the connect storm settle before measuring.
+    await asyncio.sleep(args.settle)
+    rss_connected = _worker_rss(server)
+    redis_connected = _redis_clients(args.redis_url)
+
+    open_chat = [ws for ws in chat_sockets if ws]
+    senders = open_chat[:max(1, min(args.senders, len(open_chat)))] if open_chat else []
+    measuring.set()
+    load_start = time.perf_counter()
+    tasks = []
+    if senders and args.rate > 0:
+        tasks.append(_send_chat(senders, args.rate, args.duration, stats))
+    if notification_sockets and args.notification_rate > 0:
+        tasks.append(_publish_notifications(
+            args.redis_url, dataset["user_ids"], args.notification_rate, args.duration
+        ))
+    await asyncio.gather(*tasks)
+    # Wait for deliveries still in flight.
+    await asyncio.sleep(args.drain)
+    load_seconds = time.perf_counter() - load_start
+    measuring.clear()
+
+    for websocket in open_chat + [ws for ws in notification_sockets if ws]:
+        await websocket.close()
+    for reader in readers:
+        reader.cancel()
+    await asyncio.gather(*readers, return_exceptions=True)
+    await asyncio.sleep(1)
+    redis_after = _redis_clients(args.redis_url)
+
+    connections = len(open_chat) + len([ws for ws in notification_sockets if ws])
+    rss_growth = sum(rss_connected.values()) - sum(rss_before.values())
+    members_per_group = len(users) / len(groups)
+    return {
+        "connections": {
+            "opened": connections,
+            "failed": stats.connect_failures,
+            "seconds": connect_seconds,
+            "connect_ms": common.percentiles(stats.connect_times_ms),
+            "unexpected_closes": stats.unexpected_closes
+        },
+        "chat": {
+            "sent": stats.sent,
+            "send_errors": stats.send_errors,
+            "delivered": len(stats.chat_latencies_ms),
+            "expected_deliveries": int(stats.sent * members_per_group),
+            "sent_per_second": stats.sent / load_seconds,
+            "delivered_per_second": len(stats.chat_latencies_ms) / load_seconds,
+            "latency_ms": common.percentiles(stats.chat_latencies_ms),
+            "other_frames": stats.other_frames
+        },
+        "notifications": {
+            "delivered": len(stats.notification_latencies_ms),
+            "latency_ms": common.percentiles(stats.notification_latencies_ms)
+        },
+        "memory": {
+            "worker_rss_kib_before": rss_before,
+            "worker_rss_kib_connected": rss_connected,
+            "rss_kib_per_connection": rss_growth / connections if connections else None
+        },
+        "redis": {
+            "connected_clients_before": redis_before,
+            "connected_clients_connected": redis_connected,
+            "connected_clients_after": redis_after
+        }
+    }
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--clients", type=int, default=1000, help="chat sockets, one per seeded user")
+    parser.add_argument("--groups", type=int, default=20)
+    parser.add_argument("--notifications", action=argparse.BooleanOptionalAction, default=True,
+                        help="also open one notification socket per user")
+    parser.add_argument("--senders", type=int, default=50, help="chat sockets that send messages")
+    parser.add_argument("--rate", type=float, default=200, help="chat messages sent per second in total")
+    parser.add_argument("--notification-rate", type=float, default=200)
+    parser.add_argument("--duration", type=float, default=30, help="seconds of load")
+    parser.add_argument("--settle", type=float, default=3)
+    parser.add_argument("--drain", type=float, default=3)
+    parser.add_argument("--connect-concurrency", type=int, default=200)
+    parser.add_argument("--database-url", help="defaults to a fresh SQLite file")
+    parser.add_argument("--redis-url", default=os.getenv("REDIS_URL", "redis://localhost:6379/15"))
+    parser.add_argument("--fakeredis", action="store_true", help="serve Redis from an in-process fakeredis")
+    parser.add_argument("--port", type=int)
+    parser.add_argument("--output", help="result file; defaults to benchmarks/results/ws_load-<time>.json")
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    args = _parse_args()
+    if args.fakeredis:
+        args.redis_url = _start_fakeredis()
+    database_url = args.database_url or common.default_sqlite_url("ws_load")
+    # Every socket holds a pooled connection only while it handles a frame, but the
+    # connect storm still needs headroom beyond the default pool.
+    common.configure_environment(
+        database_url, args.redis_url,
+        DB_POOL_SIZE=os.getenv("DB_POOL_SIZE", "10"),
+        DB_MAX_OVERFLOW=os.getenv("DB_MAX_OVERFLOW", "20"),
+        REDIS_MAX_CONNECTIONS=os.getenv("REDIS_MAX_CONNECTIONS", str(args.clients * 2 + 100))
+    )
+
+    common.create_schema()
+    dataset = common.seed(users=args.clients, groups=args.groups)
+    logging.info(f"Seeded {args.clients} users in {args.groups} groups")
+
+    port = args.port or _free_port()
+    server = _start_server(port, args.workers)
+    try:
+        _wait_until_ready(port, server)
+        metrics = asyncio.run(_run_load(args, port, dataset, server))
+    finally:
+        server.send_signal(signal.SIGINT)
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+    config = {key: value for key, value in vars(args).items() if key != "output"}
+    config["database"] = database_url.split(":", 1)[0]
+    path = common.write_results("ws_load", config, metrics, args.output)
+    chat = metrics["chat"]
+    logging.info(
+        f"Delivered {chat['delivered']}/{chat['expected_deliveries']} chat messages, "
+        f"p50 {chat['latency_ms'].get('p50')} ms, p99 {chat['latency_ms'].get('p99')} ms; results in {path}"
+    )
+
+
+if __name__ == "__main__":
+    main()
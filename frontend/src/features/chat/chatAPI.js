@@ -2,6 +2,39 @@ import { privateApi } from '../../api';
 import { setConnectionStatus } from './chatSlice';
 
 let socket = null;
+let socketGroupId = null;
+
+// Messages sent but not yet acknowledged, by client_id. They are resent with the
+// same client_id when the socket reconnects, so the server stores each only once.
+const pendingMessages = new Map();
+const MAX_SEND_ATTEMPTS = 5;
+
+// crypto.randomUUID only exists in secure contexts (HTTPS or localhost).
+const newClientId = () => {
+  if (typeof crypto !== 'undefined' && crypto.randomUUID) {
+    return crypto.randomUUID();
+  }
+  if (typeof crypto !== 'undefined' && crypto.getRandomValues) {
+    const bytes = crypto.getRandomValues(new Uint8Array(16));
+    return Array.from(bytes, (byte) => byte.toString(16).padStart(2, '0')).join('');
+  }
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}-${Math.random().toString(36).slice(2)}`;
+};
+
+const sendPending = (clientId) => {
+  const pending = pendingMessages.get(clientId);
+  if (!pending || !socket || socket.readyState !== WebSocket.OPEN || socketGroupId !== pending.groupId) {
+    return;
+  }
+  if (pending.attempts >= MAX_SEND_ATTEMPTS) {
+    // Never acknowledged, e.g. rejected as invalid; stop resending it.
+    console.error('Giving up on unacknowledged message', clientId);
+    pendingMessages.delete(clientId);
+    return;
+  }
+  pending.attempts += 1;
+  socket.send(JSON.stringify({ type: 'message', content: pending.content, client_id: clientId }));
+};
 
 export const fetchChatHistoryAPI = async (groupId) => {
   const response = await privateApi.get(`/chat/${groupId}`);
@@ -40,6 +73,7 @@ export const connectWebSocket = (groupId, token, onMessageCallback, dispatch) =>
   // Use a local variable to ensure event handlers are bound to *this specific* socket.
   const currentSocket = new WebSocket(wsUrl);
   socket = currentSocket; // Update the module-level reference to the new, active socket.
+  socketGroupId = groupId;
 
   dispatch(setConnectionStatus('connecting'));
 
@@ -48,11 +82,22 @@ export const connectWebSocket = (groupId, token, onMessageCallback, dispatch) =>
     // Only update the status to 'open' if this is still the active socket.
     if (socket === currentSocket) {
       dispatch(setConnectionStatus('open'));
+      // Retry messages of this group that the previous socket never got acknowledged.
+      pendingMessages.forEach((_, clientId) => sendPending(clientId));
     }
   };
 
   currentSocket.onmessage = (event) => {
     const message = JSON.parse(event.data);
+    if (message.client_id && pendingMessages.has(message.client_id)) {
+      if (message.type === 'ACK') {
+        pendingMessages.delete(message.client_id);
+      } else if (message.type === 'ERROR' && message.code === 'rate_limited') {
+        setTimeout(() => sendPending(message.client_id), message.retry_after * 1000);
+      } else if (message.type === 'ERROR') {
+        pendingMessages.delete(message.client_id);
+      }
+    }
     onMessageCallback(message);
   };
 
@@ -77,10 +122,13 @@ export const connectWebSocket = (groupId, token, onMessageCallback, dispatch) =>
 };
 
 export const sendChatMessage = (message) => {
+  // The client_id is fixed per message, so every retry of it is recognised by the server.
+  const clientId = newClientId();
+  pendingMessages.set(clientId, { groupId: socketGroupId, content: message, attempts: 0 });
   if (socket && socket.readyState === WebSocket.OPEN) {
-    socket.send(message);
+    sendPending(clientId);
   } else {
-    console.error('WebSocket is not connected.');
+    console.error('WebSocket is not connected; the message will be sent on reconnect.');
   }
 };
 
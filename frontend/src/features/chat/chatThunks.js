@@ -86,6 +86,8 @@ export const startChatSession = (groupId) => (dispatch, getState) => {
 
   // Define the callback function that will be executed for each incoming message.
   const onMessageCallback = (message) => {
+    // Presence and typing events carry a `type`; only chat messages go to the store.
+    if (message.type) return;
     // Dispatch the action to add the new message to the Redux store.
     dispatch(addMessage(message));
   };
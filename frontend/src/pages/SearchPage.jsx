@@ -52,7 +52,7 @@ export default function SearchPage() {
             renderItem={(user) => (
               <div key={`user-${user.id}`} className="bg-white p-4 rounded-lg shadow-sm">
                 <p className="font-semibold text-lg">{user.name}</p>
-                <p className="text-sm text-gray-500">{user.email}</p>
+                <p className="text-sm text-gray-500">{user.hobbies.join(", ")}</p>
               </div>
             )}
           />